@@ -1,16 +1,21 @@
 from flask import Flask, jsonify, abort, request
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 
 from admin_service.models import Admin, admin_schema, admins_schema
-from shared.db import db, ma, bcrypt
-from shared.token import create_token, LOG_PATH, ADMIN_PATH, extract_auth_token, decode_token
+from shared.db import db, ma, bcrypt, database_uri, engine_options
+from shared.metrics import register_metrics
+from shared.identity import publish_revocation, register_revocation_routes
+from shared.token import create_token, extract_auth_token, decode_claims, has_role, ROLE_ADMIN, SERVICE_PORTS
+from shared.emitter import emit_log, log_emitter
+from shared.passwords import verify_password, needs_rehash, hash_password, concurrency_limit
 
-import requests
 import jwt
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///lab-project.db"
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri("admin")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 db.init_app(app)
 bcrypt.init_app(app)
@@ -18,7 +23,12 @@ ma.init_app(app)
 
 CORS(app)
 
+SERVICE_NAME = "admin_service"
+register_metrics(app, SERVICE_NAME)
+register_revocation_routes(app)
+
 @app.route('/create-admin', methods=['POST'])
+@concurrency_limit()
 def create_admin():
     """
     Create a new admin.
@@ -27,7 +37,7 @@ def create_admin():
     :type request: flask.Request
     :raises jwt.ExpiredSignatureError: If the token has expired
     :raises jwt.InvalidTokenError: If the token is invalid
-    :raises werkzeug.exceptions.HTTPException: 403 if unauthorized or token issues, 400 for bad request, 500 for server error
+    :raises werkzeug.exceptions.HTTPException: 403 if unauthorized or token issues, 400 for bad request, 500 for server error, 503 if too many passwords are being hashed
     :return: JSON representation of the created admin
     :rtype: flask.Response
     """
@@ -35,13 +45,13 @@ def create_admin():
     if not token:
         abort(403, "Something went wrong")
     try:
-        admin_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    response = requests.get(f"{ADMIN_PATH}/admin:{admin_id}")
-    if response.status_code == 404:
+    if not has_role(claims, ROLE_ADMIN):
         return abort(403, "Unauthorized")
+    admin_id = claims['id']
     if 'username' not in request.json or 'password' not in request.json:
         abort(400, "Bad Request")
 
@@ -53,7 +63,7 @@ def create_admin():
         db.session.add(new_admin)
         db.session.commit()
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {admin_id} created new admin: {username}"})
+        emit_log(f"Admin {admin_id} created new admin: {username}", SERVICE_NAME, "admin.created", f"admin:{admin_id}")
 
         return jsonify(admin_schema.dump(new_admin)), 200
     except Exception as e:
@@ -62,13 +72,14 @@ def create_admin():
 
 
 @app.route('/authenticate', methods=['POST'])
+@concurrency_limit()
 def authenticate():
     """
     Authenticate an admin.
 
     :param request: HTTP request containing 'username' and 'password' in JSON, defaults to None
     :type request: flask.Request
-    :raises werkzeug.exceptions.HTTPException: 400 if bad request, 401 if unauthorized, 500 for server error
+    :raises werkzeug.exceptions.HTTPException: 400 if bad request, 401 if unauthorized, 500 for server error, 503 if too many logins are in progress
     :return: JSON containing the authentication token
     :rtype: flask.Response
     """
@@ -84,15 +95,52 @@ def authenticate():
         if not admin:
             return abort(401, "Unauthorized")
         
-        if not bcrypt.check_password_hash(admin.hashed_password, password):
+        if not verify_password(admin.hashed_password, password):
             return abort(401, "Unauthorized")
+
+        if needs_rehash(admin.hashed_password):
+            # The cost factor changed since this password was hashed.
+            admin.hashed_password = hash_password(password)
+            db.session.commit()
         
-        d = {"token": create_token(admin.admin_id)}
+        d = {"token": create_token(admin.admin_id, role=ROLE_ADMIN, username=admin.username)}
 
         return jsonify(d), 200
+    except HTTPException:
+        raise
     except Exception as e:
         return abort(500, "Server Error")
-    
+
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    """
+    Log an admin out by revoking the token they present.
+
+    The token is refused by every service until it expires: the
+    revocation is pushed to every other service, whose workers share it
+    through ``TOKEN_REVOCATION_FILE``.
+
+    :param request: HTTP request carrying the token in the Authorization header
+    :type request: flask.Request
+    :raises werkzeug.exceptions.HTTPException: 403 for a missing, invalid or non-admin token
+    :return: Success message
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        claims = decode_claims(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    if not has_role(claims, ROLE_ADMIN):
+        abort(403, "Unauthorized")
+
+    publish_revocation(token, SERVICE_NAME)
+    return jsonify({"message": "Logged out"}), 200
+
 
 @app.route('/admin:<int:admin_id>', methods=['GET'])
 def get_admin(admin_id):
@@ -117,4 +165,5 @@ def get_admin(admin_id):
         abort(500, "Server Error")
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5050)
\ No newline at end of file
+    log_emitter.start()
+    app.run(debug=True, port=SERVICE_PORTS["admin"])
\ No newline at end of file
@@ -0,0 +1,6 @@
+from shared.migrations import Migration
+from admin_service.models import MODELS
+
+MIGRATIONS = [
+    Migration(1, "create tables", lambda ops: ops.create_tables(MODELS)),
+]
@@ -1,4 +1,5 @@
 from shared.db import db, ma, bcrypt
+from shared.passwords import hash_password
 
 class Admin(db.Model):
     """
@@ -19,7 +20,7 @@ class Admin(db.Model):
     username = db.Column(db.String(80), nullable=False, unique=True)
     hashed_password = db.Column(db.String(128), nullable=False)
     def __init__(self, username, password):
-        self.hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.hashed_password = hash_password(password)
         super(Admin, self).__init__(username=username)
 
 
@@ -34,4 +35,6 @@ class AdminSchema(ma.Schema):
         fields = ('admin_id', 'username')
 
 admin_schema = AdminSchema()
-admins_schema = AdminSchema(many=True)
\ No newline at end of file
+admins_schema = AdminSchema(many=True)
+
+MODELS = (Admin,)
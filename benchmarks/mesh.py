@@ -0,0 +1,396 @@
+"""
+Load-test the whole service mesh and report latency, throughput and errors per endpoint.
+
+Every service is started under gunicorn (``serve.py``) on its own SQLite
+file in a temporary directory, on ports shifted by ``--port-offset`` so a
+running development mesh is left alone. The harness seeds goods and funded
+customers, then sends a scenario's requests at a fixed rate for
+``--duration`` seconds. Requests are scheduled open-loop: latency is
+measured from the time a request was due, so a slow mesh shows up as
+latency instead of silently lowering the offered load.
+
+Scenarios are ``browse`` (catalog, search and ratings reads), ``checkout``
+(a storm of purchases on a few hot goods), ``reviews`` (a flood of review
+submissions with listings) and ``mixed``. ``--replay`` sends recorded
+requests instead, cycling through a JSONL file whose lines look like::
+
+    {"service": "sale", "method": "POST", "path": "/sale", "json": {"good_name": "Good 1"}, "as": "customer"}
+
+where ``as`` is ``customer`` (a random seeded customer), ``admin`` or
+omitted, and an optional ``name`` groups lines in the report.
+
+Results are printed and saved as JSON under ``--output``; ``--compare``
+prints the change against a saved run.
+
+Usage::
+
+    python -m benchmarks.mesh --scenario browse --rate 200 --duration 30
+    python -m benchmarks.mesh --replay recorded.jsonl --rate 50
+    python -m benchmarks.mesh --scenario checkout --compare benchmarks/results/checkout-20250101-120000.json
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# The mesh and the harness sign tokens with the same throwaway key.
+os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+
+from shared.token import SERVICE_PORTS, ROLE_ADMIN, create_token
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results")
+CATEGORIES = ("food", "clothes", "accessories", "electronics")
+WORDS = ("fresh", "organic", "cotton", "wireless", "leather", "classic", "compact", "premium", "vintage", "smart")
+
+Call = namedtuple("Call", "name method service path json token")
+
+
+class Mesh:
+    """
+    The seven services running under gunicorn on temporary databases.
+
+    :param directory: Directory holding the databases, spill, revocation, invalidation and metrics files and service output
+    :type directory: str
+    :param port_offset: Added to every service's usual port
+    :type port_offset: int
+    :param workers: Worker processes per service
+    :type workers: int
+    :param threads: Request threads per worker
+    :type threads: int
+    """
+    def __init__(self, directory, port_offset=10000, workers=2, threads=4):
+        self.directory = directory
+        self.ports = {name: port + port_offset for name, port in SERVICE_PORTS.items()}
+        self.workers = workers
+        self.threads = threads
+        self.processes = []
+
+    def url(self, service, path):
+        return f"http://127.0.0.1:{self.ports[service]}{path}"
+
+    def environment(self):
+        # Every file serve.py would otherwise keep under instance/ goes in the
+        # temporary directory, so a development mesh on the same host is left alone.
+        env = dict(os.environ, PYTHONUNBUFFERED="1",
+                   LOG_SPILL_PATH=os.path.join(self.directory, "log-spill.jsonl"),
+                   INVENTORY_EVENT_SPILL_PATH=os.path.join(self.directory, "inventory-event-spill.jsonl"),
+                   TOKEN_REVOCATION_FILE=os.path.join(self.directory, "revoked-tokens.txt"),
+                   CACHE_INVALIDATION_FILE=os.path.join(self.directory, "cache-invalidations.jsonl"),
+                   METRICS_DIR=os.path.join(self.directory, "metrics"))
+        for name, port in self.ports.items():
+            env[f"{name.upper()}_PORT"] = str(port)
+            env[f"{name.upper()}_PATH"] = f"http://127.0.0.1:{port}"
+            env[f"{name.upper()}_DATABASE_URI"] = f"sqlite:///{os.path.join(self.directory, name + '.db')}"
+        return env
+
+    def start(self, timeout=60):
+        """
+        Start every service and wait until all of them accept connections.
+        """
+        env = self.environment()
+        for name in self.ports:
+            output = open(os.path.join(self.directory, f"{name}.out"), "w")
+            self.processes.append(subprocess.Popen(
+                [sys.executable, "serve.py", name, "--workers", str(self.workers), "--threads", str(self.threads)],
+                cwd=ROOT, env=env, stdout=output, stderr=subprocess.STDOUT
+            ))
+        deadline = time.monotonic() + timeout
+        for name, port in self.ports.items():
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{name}_service did not start, see {self.directory}/{name}.out")
+                    time.sleep(0.2)
+
+    def stop(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in self.processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class Fixture:
+    """
+    The data seeded into a fresh mesh, used to build requests.
+
+    :ivar admin_token: Token of an administrator
+    :vartype admin_token: str
+    :ivar customers: ``(user_id, token)`` of each funded customer
+    :vartype customers: list
+    :ivar goods: ``(inventory_id, name)`` of each good
+    :vartype goods: list
+    """
+    def __init__(self, admin_token, customers, goods):
+        self.admin_token = admin_token
+        self.customers = customers
+        self.goods = goods
+
+
+def seed(mesh, customers, goods, rng):
+    """
+    Create goods with plenty of stock and customers with plenty of money.
+
+    :return: The seeded data
+    :rtype: Fixture
+    """
+    session = requests.Session()
+    admin_token = create_token(1, role=ROLE_ADMIN, username="benchmark")
+    admin = {"Authorization": f"Bearer {admin_token}"}
+
+    seeded_goods = []
+    for i in range(goods):
+        response = session.post(mesh.url("inventory", "/inventory"), headers=admin, json={
+            "name": f"Good {i}", "category": CATEGORIES[i % len(CATEGORIES)], "price": float(rng.randint(1, 500)),
+            "description": " ".join(rng.sample(WORDS, 3)), "count": 10 ** 7,
+        })
+        response.raise_for_status()
+        seeded_goods.append((response.json()["inventory_id"], f"Good {i}"))
+
+    seeded_customers = []
+    run = rng.randrange(10 ** 6)
+    for i in range(customers):
+        response = session.post(mesh.url("customer", "/customer"), json={
+            "full_name": f"Customer {i}", "username": f"bench{run}_{i}", "password": "benchmark",
+            "age": 30, "address": "Benchmark Street", "gender": "male", "marital_status": "single",
+        })
+        response.raise_for_status()
+        user_id = response.json()["user_id"]
+        token = create_token(user_id)
+        session.post(mesh.url("customer", "/charge"), headers={"Authorization": f"Bearer {token}"},
+                     json={"amount": 1e9}).raise_for_status()
+        seeded_customers.append((user_id, token))
+
+    return Fixture(admin_token, seeded_customers, seeded_goods)
+
+
+def browse(fixture, rng):
+    inventory_id, name = rng.choice(fixture.goods)
+    return rng.choices([
+        Call("GET /inventory", "GET", "inventory", "/inventory?limit=50", None, None),
+        Call("GET /inventory:<id>", "GET", "inventory", f"/inventory:{inventory_id}", None, None),
+        Call("GET /search (inventory)", "GET", "inventory", f"/search?q={rng.choice(WORDS)[:4]}&limit=20", None, None),
+        Call("GET /goods", "GET", "sale", "/goods?limit=50", None, None),
+        Call("GET /product-rating:<id>", "GET", "review", f"/product-rating:{inventory_id}", None, None),
+        Call("GET /product-reviews:<id>", "GET", "review", f"/product-reviews:{inventory_id}?limit=20", None, None),
+    ], weights=[3, 4, 2, 2, 3, 2])[0]
+
+
+def checkout(fixture, rng):
+    # Most purchases hit a handful of hot goods, as in a flash sale.
+    hot = fixture.goods[:5]
+    inventory_id, name = rng.choice(hot) if rng.random() < 0.8 else rng.choice(fixture.goods)
+    user_id, token = rng.choice(fixture.customers)
+    if rng.random() < 0.2:
+        return Call("GET /good:<id>", "GET", "sale", f"/good:{inventory_id}", None, None)
+    return Call("POST /sale", "POST", "sale", "/sale", {"good_name": name, "quantity": 1}, token)
+
+
+def reviews(fixture, rng):
+    inventory_id, name = rng.choice(fixture.goods)
+    user_id, token = rng.choice(fixture.customers)
+    if rng.random() < 0.6:
+        comment = " ".join(rng.choices(WORDS, k=6))
+        return Call("POST /review", "POST", "review", "/review",
+                    {"inventory_id": inventory_id, "rating": rng.randint(1, 5), "comment": comment}, token)
+    return rng.choice([
+        Call("GET /product-reviews:<id>", "GET", "review", f"/product-reviews:{inventory_id}?limit=20", None, None),
+        Call("GET /product-rating:<id>", "GET", "review", f"/product-rating:{inventory_id}", None, None),
+        Call("GET /search (review)", "GET", "review", f"/search?q={rng.choice(WORDS)[:4]}&limit=20", None, None),
+    ])
+
+
+def mixed(fixture, rng):
+    return rng.choices([browse, checkout, reviews], weights=[6, 2, 2])[0](fixture, rng)
+
+
+SCENARIOS = {"browse": browse, "checkout": checkout, "reviews": reviews, "mixed": mixed}
+
+
+def replay(path):
+    """
+    Build a scenario cycling through recorded requests.
+
+    :param path: JSONL file of requests
+    :type path: str
+    :return: Scenario function
+    :rtype: callable
+    """
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines:
+        raise ValueError(f"{path} holds no requests")
+    position = [0]
+    lock = threading.Lock()
+
+    def scenario(fixture, rng):
+        with lock:
+            line = lines[position[0] % len(lines)]
+            position[0] += 1
+        who = line.get("as")
+        token = fixture.admin_token if who == "admin" else rng.choice(fixture.customers)[1] if who == "customer" else None
+        method = line.get("method", "GET").upper()
+        name = line.get("name") or f"{method} {line['path'].split('?')[0]}"
+        return Call(name, method, line["service"], line["path"], line.get("json"), token)
+    return scenario
+
+
+def drive(mesh, scenario, fixture, rate, duration, concurrency, rng):
+    """
+    Send the scenario's requests at ``rate`` per second for ``duration`` seconds.
+
+    :return: ``(name, status, seconds)`` of every request, with status None
+        for connection errors, and the elapsed time
+    :rtype: tuple
+    """
+    local = threading.local()
+    results = []
+    lock = threading.Lock()
+
+    def send(call, due):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        headers = {"Authorization": f"Bearer {call.token}"} if call.token else None
+        try:
+            status = session.request(call.method, mesh.url(call.service, call.path), json=call.json,
+                                     headers=headers, timeout=60).status_code
+        except requests.RequestException:
+            status = None
+        latency = time.perf_counter() - due
+        with lock:
+            results.append((call.name, status, latency))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        sent = 0
+        while True:
+            due = start + sent / rate
+            if due - start >= duration:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, scenario(fixture, rng), due)
+            sent += 1
+    return results, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+def summarize(results, elapsed):
+    """
+    Aggregate request results per endpoint and overall.
+
+    :return: For each endpoint and ``total``: count, throughput (requests/s),
+        errors (status 4xx, 5xx or no response), error rate and p50/p95/p99 latency in ms
+    :rtype: dict
+    """
+    groups = defaultdict(list)
+    for name, status, latency in results:
+        groups[name].append((status, latency))
+        groups["total"].append((status, latency))
+    summary = {}
+    for name, rows in sorted(groups.items()):
+        latencies = sorted(latency * 1000 for status, latency in rows)
+        errors = sum(1 for status, latency in rows if status is None or status >= 400)
+        summary[name] = {
+            "count": len(rows),
+            "throughput": round(len(rows) / elapsed, 2),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4),
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+        }
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    print(f"{'endpoint':<28} {'count':>7} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in summary.items():
+        print(f"{name:<28} {row['count']:>7} {row['throughput']:>8.1f} {row['error_rate']:>7.1%} "
+              f"{row['p50']:>9.1f} {row['p95']:>9.1f} {row['p99']:>9.1f}")
+        before = (baseline or {}).get(name)
+        if before:
+            change = lambda key: f"{(row[key] - before[key]) / before[key]:+.0%}" if before[key] else "n/a"
+            print(f"{'  vs baseline':<28} {'':>7} {change('throughput'):>8} {'':>7} "
+                  f"{change('p50'):>9} {change('p95'):>9} {change('p99'):>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--replay", help="JSONL file of recorded requests to send instead of a scenario")
+    parser.add_argument("--rate", type=float, default=100, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of unmeasured load first")
+    parser.add_argument("--concurrency", type=int, default=64, help="maximum requests in flight")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers per service")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--goods", type=int, default=200)
+    parser.add_argument("--port-offset", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=RESULTS_PATH, help="directory receiving the results")
+    parser.add_argument("--compare", help="saved results to compare against")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    scenario = replay(args.replay) if args.replay else SCENARIOS[args.scenario]
+    label = os.path.splitext(os.path.basename(args.replay))[0] if args.replay else args.scenario
+
+    with tempfile.TemporaryDirectory() as directory:
+        mesh = Mesh(directory, args.port_offset, args.workers, args.threads)
+        try:
+            print(f"starting services in {directory}")
+            mesh.start()
+            fixture = seed(mesh, args.customers, args.goods, rng)
+            if args.warmup:
+                drive(mesh, scenario, fixture, args.rate, args.warmup, args.concurrency, rng)
+            print(f"{label}: {args.rate:g} req/s for {args.duration:g}s")
+            results, elapsed = drive(mesh, scenario, fixture, args.rate, args.duration, args.concurrency, rng)
+        finally:
+            mesh.stop()
+
+    summary = summarize(results, elapsed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["summary"]
+    print_summary(summary, baseline)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump({"scenario": label, "rate": args.rate, "duration": args.duration, "workers": args.workers,
+                   "threads": args.threads, "summary": summary}, f, indent=2)
+    print(f"results saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure concurrent write throughput on one SQLite file, with and without the tuning in ``shared.db``.
+
+Several processes, standing in for the services sharing a database, each
+commit many small transactions through a pooled SQLAlchemy engine built with
+``shared.db.engine_options``. Each run reports commits per second and how
+many transactions failed with ``database is locked``.
+
+Usage::
+
+    python -m benchmarks.sqlite_writes --processes 8 --writes 500
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+
+def _writer(args):
+    path, writes = args
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+    from shared.db import engine_options
+
+    uri = f"sqlite:///{path}"
+    engine = create_engine(uri, **engine_options(uri))
+    failed = 0
+    for i in range(writes):
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("INSERT INTO event (pid, seq, payload) VALUES (:pid, :seq, :payload)"),
+                                   {"pid": os.getpid(), "seq": i, "payload": "x" * 200})
+        except OperationalError:
+            failed += 1
+    engine.dispose()
+    return failed
+
+
+def run(processes, writes):
+    """
+    Run one measurement with the tuning selected by the ``SQLITE_TUNING`` variable.
+
+    :param processes: Number of concurrent writer processes
+    :type processes: int
+    :param writes: Number of transactions per process
+    :type writes: int
+    :return: Commits per second and number of failed transactions
+    :rtype: tuple
+    """
+    from sqlalchemy import create_engine, text
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE event (id INTEGER PRIMARY KEY, pid INTEGER, seq INTEGER, payload TEXT)"))
+        engine.dispose()
+
+        start = time.perf_counter()
+        with Pool(processes) as pool:
+            failed = sum(pool.map(_writer, [(path, writes)] * processes))
+        elapsed = time.perf_counter() - start
+
+    committed = processes * writes - failed
+    return committed / elapsed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--single", action="store_true", help="run once with the current SQLITE_TUNING and print the result")
+    args = parser.parse_args(argv)
+
+    if args.single:
+        rate, failed = run(args.processes, args.writes)
+        print(f"{rate:.0f} {failed}")
+        return
+
+    print(f"{args.processes} processes x {args.writes} transactions")
+    for label, tuning in (("default", "0"), ("tuned", "1")):
+        # Each mode runs in a fresh interpreter: the tuning is read once at import.
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.sqlite_writes", "--single",
+             "--processes", str(args.processes), "--writes", str(args.writes)],
+            env={**os.environ, "SQLITE_TUNING": tuning}, capture_output=True, text=True, check=True
+        ).stdout.split()
+        print(f"{label:>8}: {float(output[0]):8.0f} commits/s, {output[1]} failed with 'database is locked'")
+
+
+if __name__ == "__main__":
+    main()
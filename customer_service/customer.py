@@ -1,15 +1,21 @@
 from flask import Flask, jsonify, abort, request
 from flask_cors import CORS
-
-import requests
-
-from customer_service.models import Customer, customer_schema, customers_schema
-from shared.db import db, ma, bcrypt
-from shared.token import create_token, ADMIN_PATH, extract_auth_token, decode_token, jwt, LOG_PATH, CUSTOMER_PATH
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from customer_service.models import Customer, Payment, customer_schema, customers_schema, PAYMENT_DEBITED, PAYMENT_REFUNDED
+from shared.db import db, ma, bcrypt, database_uri, engine_options
+from shared.metrics import register_metrics
+from shared.token import create_token, extract_auth_token, decode_token, decode_claims, has_role, jwt
+from shared.token import ROLE_ADMIN, ROLE_CUSTOMER, ROLE_SERVICE, SERVICE_PORTS
+from shared.emitter import emit_log, log_emitter
+from shared.passwords import verify_password, needs_rehash, hash_password, concurrency_limit
+from shared.identity import invalidate_customer, publish_revocation, register_revocation_routes
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///lab-project.db"
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri("customer")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 db.init_app(app)
 bcrypt.init_app(app)
@@ -17,6 +23,10 @@ ma.init_app(app)
 
 CORS(app)
 
+SERVICE_NAME = "customer_service"
+register_metrics(app, SERVICE_NAME)
+register_revocation_routes(app)
+
 @app.route('/customers', methods=['GET'])
 def get_all_customers():
     """
@@ -32,19 +42,14 @@ def get_all_customers():
     if not token:
         abort(403, "Something went wrong")
     try:
-        user_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    try:
-        admin = requests.get(f"{ADMIN_PATH}/admin:{user_id}")
+    if not has_role(claims, ROLE_ADMIN):
+        return abort(401, "Unauthorized")
 
-        if admin.status_code == 404:
-            return abort(401, "Unauthorized")
-        
-        if admin.status_code == 500:
-            return abort(500, "Server Error")
-        
+    try:
         customers = Customer.query.all()
         return jsonify(customers_schema.dump(customers)), 200
     except Exception as e:
@@ -75,13 +80,14 @@ def get_customer_by_name(full_name):
 
 
 @app.route('/customer', methods=['POST'])
+@concurrency_limit()
 def create_customer():
     """
     Create a new customer.
 
     :param request: HTTP request containing required customer fields
     :type request: flask.Request
-    :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 500 for server errors
+    :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 500 for server errors, 503 if too many passwords are being hashed
     :return: JSON representation of the created customer
     :rtype: flask.Response
     """
@@ -113,9 +119,11 @@ def create_customer():
         db.session.add(customer)
         db.session.commit()
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"New customer: {full_name}"})
+        emit_log(f"New customer: {full_name}", SERVICE_NAME, "customer.created", f"customer:{customer.user_id}")
 
         return jsonify(customer_schema.dump(customer)), 200
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
         abort(500, "Server Error")
@@ -190,8 +198,9 @@ def update_customer():
             customer.marital_status = marital_status.upper()
 
         db.session.commit()
+        invalidate_customer(customer.user_id, SERVICE_NAME)
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Updated customer information: {customer.username}"})
+        emit_log(f"Updated customer information: {customer.username}", SERVICE_NAME, "customer.updated", f"customer:{customer_id}")
         return jsonify(customer_schema.dump(customer)), 200
     except Exception as e:
         print(e)
@@ -213,15 +222,12 @@ def delete_customer():
     if not token:
         abort(403, "Something went wrong")
     try:
-        id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
-        
-    response1 = requests.get(f"{CUSTOMER_PATH}/customer:{id}")
-    response2 = requests.get(f"{ADMIN_PATH}/admin:{id}")
-    
-    if response1.status_code == 200:
-        customer_id = response1.json()['user_id']
+
+    if has_role(claims, ROLE_CUSTOMER):
+        customer_id = claims['id']
         try:
             customer = Customer.query.filter_by(user_id=customer_id).first()
 
@@ -230,20 +236,21 @@ def delete_customer():
 
             db.session.delete(customer)
             db.session.commit()
+            invalidate_customer(customer_id, SERVICE_NAME)
             
-            requests.post(f"{LOG_PATH}/add-log", json={"message": f"Deleted customer: {customer.username}"})
+            emit_log(f"Deleted customer: {customer.username}", SERVICE_NAME, "customer.deleted", f"customer:{customer_id}")
 
             return {"Message": "Customer Deleted"}
         except Exception as e:
             abort(500, "Server Error")
             
-    elif response2.status_code == 200:
-        if "customer_id" not in request.json():
+    elif has_role(claims, ROLE_ADMIN):
+        if "customer_id" not in request.json:
             abort(400, "Bad Request")
-        customer_id = request.json()['customer_id']
+        customer_id = request.json['customer_id']
         
         try:
-            admin_id = response2.json()['admin_id']
+            admin_id = claims['id']
             customer = Customer.query.filter_by(user_id=customer_id).first()
 
             if not customer:
@@ -251,8 +258,9 @@ def delete_customer():
 
             db.session.delete(customer)
             db.session.commit()
+            invalidate_customer(customer_id, SERVICE_NAME)
             
-            requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {admin_id} Deleted customer: {customer.username}"})
+            emit_log(f"Admin {admin_id} Deleted customer: {customer.username}", SERVICE_NAME, "customer.deleted", f"admin:{admin_id}")
 
             return {"Message": "Customer Deleted"}
         except Exception as e:
@@ -267,11 +275,15 @@ def deduct():
     """
     Deduct an amount from a customer's balance.
 
-    Customer's balance must be greater than the amount to deduct.
+    Customer's balance must be at least the amount to deduct. The check and
+    the decrement happen in a single conditional UPDATE. With an
+    ``order_id`` the debit is recorded as a payment in the same transaction,
+    so a retried request is answered without debiting twice and a request
+    for an order already refunded is refused.
 
-    :param request: HTTP request containing the amount to deduct
+    :param request: HTTP request containing the amount to deduct and optionally the ``order_id``
     :type request: flask.Request
-    :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 404 if customer not found, 500 for server errors
+    :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 404 if customer not found, 409 if the order was refunded, 500 for server errors
     :return: JSON representation of the updated customer
     :rtype: flask.Response
     """ 
@@ -279,47 +291,142 @@ def deduct():
     if not token:
         abort(403, "Something went wrong")
     try:
-        customer_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    try:
-        admin = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
-
-        if admin.status_code == 404:
-            return abort(401, "Unauthorized")
-        
-        if admin.status_code == 500:
-            return abort(500, "Server Error")
-    except:
-        abort(500, "Server Error")
+    if not has_role(claims, ROLE_CUSTOMER):
+        return abort(401, "Unauthorized")
+    customer_id = claims['id']
     
     if 'amount' not in request.json:
         abort(400, "Bad Request")
 
     amount = request.json['amount']
+    order_id = request.json.get('order_id')
 
     if type(amount) != float:
         abort(400, "Bad Request")
 
+    if amount <= 0:
+        abort(400, "Bad Request")
+
+    if order_id is not None and (type(order_id) != str or not 0 < len(order_id) <= 64):
+        abort(400, "Bad Request")
+
+    debited = False
     try:
+        payment = db.session.get(Payment, order_id) if order_id is not None else None
+        if payment is None:
+            # Conditional decrement: two concurrent deductions cannot both pass the balance check.
+            result = db.session.execute(
+                db.update(Customer)
+                .where(Customer.user_id == customer_id, Customer.balance >= amount)
+                .values(balance=Customer.balance - amount)
+            )
+            debited = result.rowcount > 0
+            if debited and order_id is not None:
+                db.session.add(Payment(order_id=order_id, customer_id=customer_id, amount=amount, status=PAYMENT_DEBITED))
+            db.session.commit()
         customer = Customer.query.filter_by(user_id=customer_id).first()
+    except IntegrityError:
+        # The same order was debited concurrently; this debit was rolled back.
+        db.session.rollback()
+        payment = db.session.get(Payment, order_id)
+        customer = Customer.query.filter_by(user_id=customer_id).first()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return abort(500, "Server error")
 
-        if not customer:
-            return abort(404, "Customer Not found")
-        
-        if amount > customer.balance:
-            return abort(400, "Cannot Deduct Amount")
-        
-        customer.balance -= amount
-
-        db.session.commit()
-        
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Deducted {amount} from customer {customer.username}"})
+    if not customer:
+        return abort(404, "Customer Not found")
 
+    if payment is not None:
+        if payment.status != PAYMENT_DEBITED or payment.customer_id != customer_id:
+            return abort(409, "Order Cancelled")
         return jsonify(customer_schema.dump(customer)), 200
+
+    if not debited:
+        return abort(400, "Cannot Deduct Amount")
+
+    invalidate_customer(customer.user_id, SERVICE_NAME)
+    
+    emit_log(f"Deducted {amount} from customer {customer.username}", SERVICE_NAME, "customer.deducted", f"customer:{customer_id}")
+
+    return jsonify(customer_schema.dump(customer)), 200
+
+
+@app.route('/refund', methods=['POST'])
+def refund():
+    """
+    Refund the debit of an order, for a service undoing a failed sale.
+
+    Refunds are idempotent and keyed by the order, so they need no customer
+    token and are safe to retry. Refunding an order that was never debited
+    records it as refunded, so a debit for it arriving late is refused.
+
+    :param request: HTTP request containing ``order_id``, ``customer_id`` and ``amount``
+    :type request: flask.Request
+    :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 403 if not called by a service, 500 for server errors, 503 if the order is being debited concurrently
+    :return: JSON with the ``order_id``, its ``status`` and whether this call ``refunded`` money
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        claims = decode_claims(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    if not has_role(claims, ROLE_SERVICE):
+        return abort(403, "Unauthorized")
+
+    if 'order_id' not in request.json or 'customer_id' not in request.json or 'amount' not in request.json:
+        abort(400, "Bad Request")
+
+    order_id = request.json['order_id']
+    customer_id = request.json['customer_id']
+    amount = request.json['amount']
+
+    if type(order_id) != str or not 0 < len(order_id) <= 64 or type(customer_id) != int or type(amount) != float:
+        abort(400, "Bad Request")
+
+    refunded = None
+    try:
+        payment = db.session.get(Payment, order_id)
+        if payment is None:
+            db.session.add(Payment(order_id=order_id, customer_id=customer_id, amount=amount, status=PAYMENT_REFUNDED))
+        else:
+            result = db.session.execute(
+                db.update(Payment)
+                .where(Payment.order_id == order_id, Payment.status == PAYMENT_DEBITED)
+                .values(status=PAYMENT_REFUNDED)
+            )
+            if result.rowcount:
+                refunded = payment
+                db.session.execute(
+                    db.update(Customer)
+                    .where(Customer.user_id == payment.customer_id)
+                    .values(balance=Customer.balance + payment.amount)
+                )
+        db.session.commit()
+    except IntegrityError:
+        # A debit of this order committed first; retrying will refund it.
+        db.session.rollback()
+        return abort(503, "Try Again", retry_after=1)
     except Exception as e:
+        print(e)
+        db.session.rollback()
         return abort(500, "Server error")
+
+    if refunded is not None:
+        invalidate_customer(refunded.customer_id, SERVICE_NAME)
+        emit_log(f"Refunded {refunded.amount} of order {order_id} to customer {refunded.customer_id}", SERVICE_NAME,
+                 "customer.refunded", f"service:{claims.get('username', claims['id'])}")
+
+    return jsonify({"order_id": order_id, "status": PAYMENT_REFUNDED, "refunded": refunded is not None}), 200
     
 
 @app.route('/charge', methods=['POST'])
@@ -337,20 +444,13 @@ def charge():
     if not token:
         abort(403, "Something went wrong")
     try:
-        customer_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
-
-        if customer.status_code == 404:
-            return abort(401, "Unauthorized")
-        
-        if customer.status_code == 500:
-            return abort(500, "Server Error")
-    except:
-        abort(500, "Server Error")
+    if not has_role(claims, ROLE_CUSTOMER):
+        return abort(401, "Unauthorized")
+    customer_id = claims['id']
     
     if 'amount' not in request.json:
         abort(400, "Bad Request")
@@ -369,8 +469,9 @@ def charge():
         customer.balance += amount
 
         db.session.commit()
+        invalidate_customer(customer.user_id, SERVICE_NAME)
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Increased wallet balance of customer {customer.username} by {amount}"})
+        emit_log(f"Increased wallet balance of customer {customer.username} by {amount}", SERVICE_NAME, "customer.charged", f"customer:{customer_id}")
 
         return jsonify(customer_schema.dump(customer)), 200
     except Exception as e:
@@ -400,13 +501,14 @@ def get_customer_by_id(customer_id):
 
 
 @app.route('/authenticate', methods=['POST'])
+@concurrency_limit()
 def authenticate():
     """
     Authenticate a customer.
 
     :param request: HTTP request containing 'username' and 'password'
     :type request: flask.Request
-    :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 401 if unauthorized, 500 for server errors
+    :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 401 if unauthorized, 500 for server errors, 503 if too many logins are in progress
     :return: JSON containing the authentication token
     :rtype: flask.Response
     """
@@ -421,15 +523,53 @@ def authenticate():
         if not customer:
             return abort(401, "Unauthorized")
         
-        if not bcrypt.check_password_hash(customer.hashed_password, password):
+        if not verify_password(customer.hashed_password, password):
             return abort(401, "Unauthorized")
+
+        if needs_rehash(customer.hashed_password):
+            # The cost factor changed since this password was hashed.
+            customer.hashed_password = hash_password(password)
+            db.session.commit()
         
-        d = {"token": create_token(customer.user_id)}
+        d = {"token": create_token(customer.user_id, role=ROLE_CUSTOMER, username=customer.username)}
 
         return jsonify(d), 200
+    except HTTPException:
+        raise
     except Exception as e:
-        return abort(500, "Server Error")    
+        return abort(500, "Server Error")
+
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    """
+    Log a customer out by revoking the token they present.
+
+    The token is refused by every service until it expires: the
+    revocation is pushed to every other service, whose workers share it
+    through ``TOKEN_REVOCATION_FILE``.
+
+    :param request: HTTP request carrying the token in the Authorization header
+    :type request: flask.Request
+    :raises werkzeug.exceptions.HTTPException: 403 for a missing, invalid or non-customer token
+    :return: Success message
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        claims = decode_claims(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    if not has_role(claims, ROLE_CUSTOMER):
+        abort(403, "Unauthorized")
+
+    publish_revocation(token, SERVICE_NAME)
+    return jsonify({"message": "Logged out"}), 200
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5100)
\ No newline at end of file
+    log_emitter.start()
+    app.run(debug=True, port=SERVICE_PORTS["customer"])
\ No newline at end of file
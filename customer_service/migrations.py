@@ -0,0 +1,8 @@
+from shared.migrations import Migration
+from customer_service.models import MODELS
+
+MIGRATIONS = [
+    Migration(1, "create tables", lambda ops: ops.create_tables(MODELS)),
+    Migration(2, "index full_name", lambda ops: ops.create_indexes(MODELS)),
+    Migration(3, "payments", lambda ops: ops.create_tables(MODELS)),
+]
@@ -1,4 +1,6 @@
 from shared.db import db, ma, bcrypt
+from shared.passwords import hash_password
+from datetime import datetime
 from enum import Enum
 from marshmallow_enum import EnumField
 
@@ -58,7 +60,7 @@ class Customer(db.Model):
     :vartype hashed_password: str
     """
     user_id = db.Column(db.Integer, primary_key=True)
-    full_name = db.Column(db.String(80), nullable=False)
+    full_name = db.Column(db.String(80), nullable=False, index=True)
     username = db.Column(db.String(80), nullable=False, unique=True)
     hashed_password = db.Column(db.String(128), nullable=False)
     balance = db.Column(db.Float, nullable=False)
@@ -68,7 +70,7 @@ class Customer(db.Model):
     marital_status = db.Column(db.Enum(MaritalStatus), nullable=False)
 
     def __init__(self, full_name, username, password, age, address, gender, marital_status):
-        self.hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.hashed_password = hash_password(password)
         self.balance = 0
         super(Customer, self).__init__(full_name=full_name, username=username, age=age, address=address, gender=gender, marital_status=marital_status)
     
@@ -90,4 +92,33 @@ class CustomerSchema(ma.Schema):
         fields = ('user_id', 'full_name', 'username', 'age', 'address', 'gender', 'marital_status', 'balance')
 
 customer_schema = CustomerSchema()
-customers_schema = CustomerSchema(many=True)
\ No newline at end of file
+customers_schema = CustomerSchema(many=True)
+
+PAYMENT_DEBITED = "debited"
+PAYMENT_REFUNDED = "refunded"
+
+class Payment(db.Model):
+    """
+    The Payment object records the debit of one order, so it is applied and refunded at most once.
+
+    A refund for an order that was never debited is recorded too, so a
+    debit arriving after it is refused instead of taking the money.
+
+    :param order_id: The ID sale_service chose for the order
+    :type order_id: str
+    :param customer_id: The ID of the customer paying
+    :type customer_id: int
+    :param amount: The amount debited
+    :type amount: float
+    :param status: ``debited`` or ``refunded``
+    :type status: str
+    :ivar created: The date when the payment was recorded
+    :vartype created: str
+    """
+    order_id = db.Column(db.String(64), primary_key=True)
+    customer_id = db.Column(db.Integer, nullable=False, index=True)
+    amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    created = db.Column(db.String(30), nullable=False, default=lambda: str(datetime.now()))
+
+MODELS = (Customer, Payment)
@@ -1,22 +1,126 @@
 from flask import Flask, jsonify, abort, request
 from flask_cors import CORS
-import requests
-
-from shared.db import db, ma, bcrypt
-from shared.token import jwt, extract_auth_token, decode_token
-from shared.token import INVENTORY_PATH, CUSTOMER_PATH, LOG_PATH
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from shared.db import db, ma, bcrypt, database_uri, engine_options
+from shared.metrics import register_metrics
+from shared.token import jwt, extract_auth_token, decode_token, decode_claims, has_role, ROLE_SERVICE
+from shared.token import INVENTORY_PATH, SERVICE_PORTS
+from shared import http_client
+from shared.emitter import emit_log, log_emitter
+from shared.cache import TTLCache, register_cache_routes
+from shared.identity import get_customer, register_revocation_routes
+from shared.pagination import get_int_arg, get_limit, set_next_cursor
 from favorite_service.models import Favorite, favorite_schema, favorites_schema
 from favorite_service.models import Wishlist, wishlist_schema, wishlists_schema
+from favorite_service.models import Notification, notifications_schema
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///lab-project.db"
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri("favorite")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 db.init_app(app)
 bcrypt.init_app(app)
 ma.init_app(app)
 
 CORS(app)
+register_cache_routes(app)
+
+SERVICE_NAME = "favorite_service"
+register_metrics(app, SERVICE_NAME)
+register_revocation_routes(app)
+
+# Fields of an inventory item shown next to a favorite or wishlist entry
+ITEM_SUMMARY_FIELDS = "inventory_id,name,category,price,count"
+
+item_cache = TTLCache("inventory_item")
+
+
+class InventoryLookupError(Exception):
+    """
+    Raised when inventory_service fails to answer an item lookup.
+    """
+
+
+def get_items(inventory_ids):
+    """
+    Look up the summaries of several inventory items, answering from the local cache when possible.
+
+    Items missing from the cache are fetched together with one
+    ``GET /inventory?ids=`` call.
+
+    :param inventory_ids: The IDs of the inventory items
+    :type inventory_ids: list
+    :raises InventoryLookupError: If inventory_service answers with an error
+    :return: The summary of each item, or None for items that no longer exist
+    :rtype: dict
+    """
+    items = {}
+    missing = []
+    for inventory_id in dict.fromkeys(inventory_ids):
+        item = item_cache.get(inventory_id)
+        if item is None:
+            missing.append(inventory_id)
+        else:
+            # Items known not to exist are cached as False.
+            items[inventory_id] = item or None
+    if not missing:
+        return items
+
+    response = http_client.get(f"{INVENTORY_PATH}/inventory", params={
+        "ids": ",".join(str(inventory_id) for inventory_id in missing), "fields": ITEM_SUMMARY_FIELDS
+    })
+    if response.status_code != 200:
+        raise InventoryLookupError(f"inventory_service returned {response.status_code}")
+    found = {item["inventory_id"]: item for item in response.json()}
+    for inventory_id in missing:
+        item = found.get(inventory_id)
+        item_cache.set(inventory_id, item or False)
+        items[inventory_id] = item
+    return items
+
+
+def list_customer_items(model, key, schema, customer_id):
+    """
+    Return one page of a customer's favorites, wishlist or notifications, following the request's parameters.
+
+    Entries are ordered by ID; when a page is full the response carries an
+    ``X-Next-Cursor`` header holding the ``after_id`` of the next page. With
+    ``expand=inventory`` each entry also holds the summary of its item
+    under ``inventory``, for the whole page at the cost of at most one call
+    to inventory_service.
+
+    :param model: ``Favorite``, ``Wishlist`` or ``Notification``
+    :type model: flask_sqlalchemy.model.Model
+    :param key: The model's ID column
+    :type key: sqlalchemy.orm.attributes.InstrumentedAttribute
+    :param schema: Schema serializing a list of entries
+    :type schema: flask_marshmallow.Schema
+    :param customer_id: The ID of the customer
+    :type customer_id: int
+    :raises werkzeug.exceptions.HTTPException: 400 for bad parameters
+    :return: JSON list of entries
+    :rtype: flask.Response
+    """
+    expand = request.args.get('expand')
+    if expand not in (None, 'inventory'):
+        abort(400, "Bad Request")
+    after_id = get_int_arg(request.args, 'after_id')
+    limit = get_limit(request.args)
+
+    query = model.query.filter_by(customer_id=customer_id)
+    if after_id is not None:
+        query = query.filter(key > after_id)
+    rows = query.order_by(key).limit(limit).all()
+
+    data = schema.dump(rows)
+    if expand:
+        items = get_items([row.inventory_id for row in rows])
+        for entry in data:
+            entry['inventory'] = items[entry['inventory_id']]
+    return set_next_cursor(jsonify(data), rows, limit, lambda row: getattr(row, key.key))
 
 
 @app.route('/favorite:<int:inventory_id>', methods=['POST'])
@@ -39,31 +143,33 @@ def add_favorite(inventory_id):
         abort(403, "Something went wrong")
 
     try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+        customer = get_customer(customer_id)
 
-        if customer.status_code == 404:
+        if not customer:
             return abort(401, "Unauthorized")
         
-        inventory = requests.get(f"{INVENTORY_PATH}/inventory:{inventory_id}")
+        inventory = http_client.get(f"{INVENTORY_PATH}/inventory:{inventory_id}", template="/inventory:<int:inventory_id>")
 
         if inventory.status_code == 404:
             return abort(404, "Item Not Found")
         
-        favorite = Favorite.query.filter_by(customer_id=customer_id, inventory_id=inventory_id).first()
-
-        if favorite:
-            return abort(400, "Item Already Favorite")
-
         favorite = Favorite(customer_id=customer_id, inventory_id=inventory_id)
 
+        # The unique (customer_id, inventory_id) index rejects duplicates, even concurrent ones.
         db.session.add(favorite)
         db.session.commit()
-        
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Added item {inventory.json()['name']} as favorite to customer: {customer.json()['username']}"})
+
+        emit_log(f"Added item {inventory.json()['name']} as favorite to customer: {customer['username']}", SERVICE_NAME, "favorite.added", f"customer:{customer_id}")
 
         return jsonify(favorite_schema.dump(favorite)), 200
+    except IntegrityError:
+        db.session.rollback()
+        return abort(400, "Item Already Favorite")
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
+        db.session.rollback()
         return abort(500, "Server Error")
 
 
@@ -88,9 +194,9 @@ def delete_favorite(favorite_id):
         abort(403, "Something went wrong")
 
     try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+        customer = get_customer(customer_id)
 
-        if customer.status_code == 404:
+        if not customer:
             return abort(401, "Unauthorized")
         
         favorite = Favorite.query.filter_by(favorite_id=favorite_id).first()
@@ -101,7 +207,7 @@ def delete_favorite(favorite_id):
         db.session.delete(favorite)
         db.session.commit()
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Deleted favorite item {favorite_id} to customer: {customer.json()['username']}"})
+        emit_log(f"Deleted favorite item {favorite_id} to customer: {customer['username']}", SERVICE_NAME, "favorite.deleted", f"customer:{customer_id}")
 
         return {"Message": "Favorite Deleted"}, 200
     except Exception as e:
@@ -128,9 +234,9 @@ def get_favorite(favorite_id):
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+    customer = get_customer(customer_id)
 
-    if customer.status_code == 404:
+    if not customer:
         return abort(401, "Unauthorized")
     
     favorite = Favorite.query.filter_by(favorite_id=favorite_id).first()
@@ -147,9 +253,15 @@ def get_favorite(favorite_id):
 @app.route('/favorites', methods=['GET'])
 def get_favorites():
     """
-    Get all favorite items for the authenticated customer.
-
-    :raises werkzeug.exceptions.HTTPException: 401 if unauthorized, 403 for invalid token, 500 for server errors
+    Get the favorite items of the authenticated customer, one page at a time.
+
+    :param after_id: (Optional) Only return favorites with a greater ID
+    :type after_id: int, optional
+    :param limit: (Optional) Page size, defaults to 100 and capped at 1000
+    :type limit: int, optional
+    :param expand: (Optional) ``inventory`` to include each item's name, category, price and count
+    :type expand: str, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad parameters, 401 if unauthorized, 403 for invalid token, 500 for server errors
     :return: JSON representation of the customer's favorites
     :rtype: flask.Response
     """
@@ -162,15 +274,16 @@ def get_favorites():
         abort(403, "Something went wrong")
 
     try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+        customer = get_customer(customer_id)
 
-        if customer.status_code == 404:
+        if not customer:
             return abort(401, "Unauthorized")
         
-        favorites = Favorite.query.filter_by(customer_id=customer_id).all()
-
-        return jsonify(favorites_schema.dump(favorites)), 200
+        return list_customer_items(Favorite, Favorite.favorite_id, favorites_schema, customer_id), 200
+    except HTTPException:
+        raise
     except Exception as e:
+        print(e)
         return abort(500, "Server Error")
 
 
@@ -194,12 +307,12 @@ def add_wishlist(inventory_id):
         abort(403, "Something went wrong")
 
     try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+        customer = get_customer(customer_id)
 
-        if customer.status_code == 404:
+        if not customer:
             return abort(401, "Unauthorized")
         
-        inventory = requests.get(f"{INVENTORY_PATH}/inventory:{inventory_id}")
+        inventory = http_client.get(f"{INVENTORY_PATH}/inventory:{inventory_id}", template="/inventory:<int:inventory_id>")
 
         if inventory.status_code == 404:
             return abort(404, "Item Not Found")
@@ -208,10 +321,18 @@ def add_wishlist(inventory_id):
 
         db.session.add(wishlist)
         db.session.commit()
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Added item {inventory.json()['name']} as wishlist to customer: {customer.json()['username']}"})
+
+        emit_log(f"Added item {inventory.json()['name']} as wishlist to customer: {customer['username']}", SERVICE_NAME, "wishlist.added", f"customer:{customer_id}")
 
         return jsonify(wishlist_schema.dump(wishlist)), 200
+    except IntegrityError:
+        db.session.rollback()
+        return abort(400, "Item Already in Wishlist")
+    except HTTPException:
+        raise
     except Exception as e:
+        print(e)
+        db.session.rollback()
         return abort(500, "Server Error")
 
 
@@ -235,9 +356,9 @@ def delete_wishlist(wishlist_id):
         abort(403, "Something went wrong")
 
     try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+        customer = get_customer(customer_id)
 
-        if customer.status_code == 404:
+        if not customer:
             return abort(401, "Unauthorized")
         
         wishlist = Wishlist.query.filter_by(wishlist_id=wishlist_id).first()
@@ -248,7 +369,7 @@ def delete_wishlist(wishlist_id):
         db.session.delete(wishlist)
         db.session.commit()
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Deleted wishlist item {wishlist_id} of customer: {customer.json()['username']}"})
+        emit_log(f"Deleted wishlist item {wishlist_id} of customer: {customer['username']}", SERVICE_NAME, "wishlist.deleted", f"customer:{customer_id}")
 
         return {"Message": "Wishlist Deleted"}, 200
     except Exception as e:
@@ -258,9 +379,11 @@ def delete_wishlist(wishlist_id):
 @app.route('/wishlists', methods=['GET'])
 def get_wishlists():
     """
-    Get all wishlist items for the authenticated customer.
+    Get the wishlist items of the authenticated customer, one page at a time.
 
-    :raises werkzeug.exceptions.HTTPException: 401 if unauthorized, 403 for invalid token, 500 for server errors
+    Takes the same ``after_id``, ``limit`` and ``expand`` parameters as ``/favorites``.
+
+    :raises werkzeug.exceptions.HTTPException: 400 for bad parameters, 401 if unauthorized, 403 for invalid token, 500 for server errors
     :return: JSON representation of the customer's wishlists
     :rtype: flask.Response
     """
@@ -273,15 +396,16 @@ def get_wishlists():
         abort(403, "Something went wrong")
 
     try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+        customer = get_customer(customer_id)
 
-        if customer.status_code == 404:
+        if not customer:
             return abort(401, "Unauthorized")
         
-        wishlists = Wishlist.query.filter_by(customer_id=customer_id).all()
-
-        return jsonify(wishlists_schema.dump(wishlists)), 200
+        return list_customer_items(Wishlist, Wishlist.wishlist_id, wishlists_schema, customer_id), 200
+    except HTTPException:
+        raise
     except Exception as e:
+        print(e)
         return abort(500, "Server Error")
 
 
@@ -305,9 +429,9 @@ def get_wishlist(wishlist_id):
         abort(403, "Something went wrong")
 
     try:
-        customer = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
+        customer = get_customer(customer_id)
 
-        if customer.status_code == 404:
+        if not customer:
             return abort(401, "Unauthorized")
         
         wishlist = Wishlist.query.filter_by(wishlist_id=wishlist_id).first()
@@ -320,5 +444,121 @@ def get_wishlist(wishlist_id):
         return abort(500, "Server Error")
     
 
+
+def _notifications_for(event):
+    """
+    Work out what an inventory change means for the customers wishlisting the item.
+
+    :return: ``(kind, message)`` pairs, empty when the change notifies nobody
+    :rtype: list
+    """
+    if event.get('deleted'):
+        return []
+    notices = []
+    name = event.get('name') or f"Item {event['inventory_id']}"
+    old_price, price = event.get('old_price'), event.get('price')
+    if old_price is not None and price is not None and price < old_price:
+        notices.append(("price_drop", f"{name} dropped from {old_price:.2f} to {price:.2f}"))
+    old_count, count = event.get('old_count'), event.get('count')
+    if old_count is not None and count is not None and old_count <= 0 < count:
+        notices.append(("back_in_stock", f"{name} is back in stock"))
+    return notices
+
+
+@app.route('/inventory-events', methods=['POST'])
+def receive_inventory_events():
+    """
+    Receive a batch of inventory changes and notify the customers wishlisting those items.
+
+    Called by inventory_service for every change to an item. Cached
+    summaries of the changed items are dropped. The wishlisting customers
+    of every item in the batch are found with one lookup on the
+    ``(inventory_id, customer_id)`` index, and all notifications are
+    written in one transaction.
+
+    :param events: Changes, each with ``inventory_id``, ``name``, ``old_price``, ``price``, ``old_count``, ``count`` and, for deleted items, ``deleted``
+    :type events: list
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 403 for unauthorized access, 500 for server errors
+    :return: Number of notifications created
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        claims = decode_claims(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    if not has_role(claims, ROLE_SERVICE):
+        return abort(403, "Unauthorized")
+
+    events = request.json.get('events')
+    if type(events) != list or not all(type(event) == dict and type(event.get('inventory_id')) == int for event in events):
+        abort(400, "Bad Request")
+
+    notices = {}
+    for event in events:
+        item_cache.invalidate(event['inventory_id'])
+        try:
+            found = _notifications_for(event)
+        except (TypeError, ValueError):
+            abort(400, "Bad Request")
+        if found:
+            notices.setdefault(event['inventory_id'], []).extend(found)
+    if not notices:
+        return jsonify({"notified": 0}), 200
+
+    try:
+        watchers = db.session.query(Wishlist.inventory_id, Wishlist.customer_id).filter(Wishlist.inventory_id.in_(notices)).all()
+        rows = [
+            {"customer_id": customer_id, "inventory_id": inventory_id, "kind": kind, "message": message}
+            for inventory_id, customer_id in watchers
+            for kind, message in notices[inventory_id]
+        ]
+        if rows:
+            db.session.execute(db.insert(Notification), rows)
+        db.session.commit()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return abort(500, "Server Error")
+
+    return jsonify({"notified": len(rows)}), 200
+
+
+@app.route('/notifications', methods=['GET'])
+def get_notifications():
+    """
+    Get the wishlist notifications of the authenticated customer, oldest first, one page at a time.
+
+    Takes the same ``after_id``, ``limit`` and ``expand`` parameters as ``/favorites``.
+
+    :raises werkzeug.exceptions.HTTPException: 400 for bad parameters, 401 if unauthorized, 403 for invalid token, 500 for server errors
+    :return: JSON representation of the customer's notifications
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        customer_id = decode_token(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    try:
+        customer = get_customer(customer_id)
+
+        if not customer:
+            return abort(401, "Unauthorized")
+
+        return list_customer_items(Notification, Notification.notification_id, notifications_schema, customer_id), 200
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(e)
+        return abort(500, "Server Error")
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5150)
\ No newline at end of file
+    log_emitter.start()
+    app.run(debug=True, port=SERVICE_PORTS["favorite"])
\ No newline at end of file
@@ -0,0 +1,26 @@
+from shared.migrations import Migration
+from favorite_service.models import MODELS, Favorite, Wishlist
+
+
+def unique_customer_items(ops):
+    """
+    Make (customer_id, inventory_id) unique on favorites and wishlists, dropping existing duplicates first.
+    """
+    ops.deduplicate(Favorite, ("customer_id", "inventory_id"))
+    ops.deduplicate(Wishlist, ("customer_id", "inventory_id"))
+    ops.create_indexes(MODELS)
+
+
+def wishlist_notifications(ops):
+    """
+    Add the notification table and index wishlists by item.
+    """
+    ops.create_tables(MODELS)
+    ops.create_indexes(MODELS)
+
+
+MIGRATIONS = [
+    Migration(1, "create tables", lambda ops: ops.create_tables(MODELS)),
+    Migration(2, "unique customer items", unique_customer_items),
+    Migration(3, "wishlist notifications", wishlist_notifications),
+]
@@ -1,4 +1,5 @@
 from shared.db import db, ma, bcrypt
+from datetime import datetime
 
 class Favorite(db.Model):
     """
@@ -18,6 +19,12 @@ class Favorite(db.Model):
     favorite_id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, nullable=False)
     inventory_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        # Also serves lookups by customer_id alone, as its leading column.
+        db.Index('ix_favorite_customer_inventory', 'customer_id', 'inventory_id', unique=True),
+    )
+
     def __init__(self, customer_id, inventory_id):
         super(Favorite, self).__init__(customer_id=customer_id, inventory_id=inventory_id) 
 
@@ -47,6 +54,14 @@ class Wishlist(db.Model):
     wishlist_id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, nullable=False)
     inventory_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        # Also serves lookups by customer_id alone, as its leading column.
+        db.Index('ix_wishlist_customer_inventory', 'customer_id', 'inventory_id', unique=True),
+        # Finds the customers to notify of an item's change without reading the table.
+        db.Index('ix_wishlist_inventory_customer', 'inventory_id', 'customer_id'),
+    )
+
     def __init__(self, customer_id, inventory_id):
         super(Wishlist, self).__init__(customer_id=customer_id, inventory_id=inventory_id)
         
@@ -64,4 +79,43 @@ class WishlistSchema(ma.Schema):
         model = Wishlist
 
 wishlist_schema = WishlistSchema()
-wishlists_schema = WishlistSchema(many=True)
\ No newline at end of file
+wishlists_schema = WishlistSchema(many=True)
+
+class Notification(db.Model):
+    """
+    The Notification object tells a customer that an item on their wishlist got cheaper or is back in stock.
+
+    :param customer_id: The ID of the customer being notified
+    :type customer_id: int
+    :param inventory_id: The ID of the inventory item that changed
+    :type inventory_id: int
+    :param kind: ``price_drop`` or ``back_in_stock``
+    :type kind: str
+    :param message: The text shown to the customer
+    :type message: str
+    :ivar notification_id: The unique identifier for the notification
+    :vartype notification_id: int
+    :ivar created: The date when the notification was created
+    :vartype created: str
+    """
+    notification_id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, nullable=False, index=True)
+    inventory_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.String(128), nullable=False)
+    created = db.Column(db.String(30), nullable=False, default=lambda: str(datetime.now()))
+
+class NotificationSchema(ma.Schema):
+    """
+    The NotificationSchema object is used for serializing notifications.
+
+    :cvar Meta.fields: The fields included in the schema ('notification_id', 'customer_id', 'inventory_id', 'kind', 'message', 'created')
+    :vartype Meta.fields: tuple
+    """
+    class Meta:
+        fields = ('notification_id', 'customer_id', 'inventory_id', 'kind', 'message', 'created')
+        model = Notification
+
+notifications_schema = NotificationSchema(many=True)
+
+MODELS = (Favorite, Wishlist, Notification)
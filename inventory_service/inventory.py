@@ -1,22 +1,162 @@
+import json
+import os
+import threading
+import time
+
 from flask import Flask, jsonify, abort, request
 from flask_cors import CORS
-
-from inventory_service.models import Inventory, inventory_schema, inventories_schema
-from shared.db import db, ma, bcrypt
-from shared.token import extract_auth_token, decode_token, ADMIN_PATH, LOG_PATH
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from inventory_service.models import Inventory, Category, CatalogVersion, Reservation, CATALOG, STOCK, RESERVATION_HELD, RESERVATION_RELEASED, InventorySchema, inventory_schema, inventories_schema, inventory_search
+from shared.db import db, ma, bcrypt, database_uri, engine_options
+from shared.metrics import register_metrics
+from shared.identity import register_revocation_routes
+from shared.token import extract_auth_token, decode_claims, has_role, create_service_token, ROLE_ADMIN, ROLE_SERVICE, SERVICE_PORTS, FAVORITE_PATH
+from shared.emitter import BatchEmitter, emit_log, log_emitter
+from shared.cache import TTLCache, register_cache_routes, versioned_response
+from shared.pagination import get_int_arg, get_limit, get_list_arg, set_next_cursor, encode_cursor, decode_cursor
+from shared.search import SearchUnavailable, match_terms
 
 import jwt
-import requests
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///lab-project.db"
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri("inventory")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 db.init_app(app)
 bcrypt.init_app(app)
 ma.init_app(app)
 
 CORS(app)
+register_cache_routes(app)
+
+SERVICE_NAME = "inventory_service"
+register_metrics(app, SERVICE_NAME)
+register_revocation_routes(app)
+INVENTORY_EVENT_SPILL_PATH = os.environ.get("INVENTORY_EVENT_SPILL_PATH", "inventory-event-spill.jsonl")
+CATALOG_VERSION_TTL = float(os.environ.get("CATALOG_VERSION_TTL", 1.0))
+
+catalog_cache = TTLCache("catalog")
+
+# Changes to inventory rows, delivered in batches to favorite_service, which
+# drops its cached copy of each changed item and notifies wishlists
+inventory_events = BatchEmitter(
+    f"{FAVORITE_PATH}/inventory-events", "events", spill_path=INVENTORY_EVENT_SPILL_PATH,
+    headers=lambda: {"Authorization": f"Bearer {create_service_token(SERVICE_NAME)}"}
+)
+
+
+def publish_change(inventory, old_price, old_count, deleted=False):
+    """
+    Publish a committed change to an item.
+
+    Every change is published, including renames, deletions and
+    reservations that notify nobody, so no consumer keeps a stale copy.
+
+    :param inventory: The inventory item after the change
+    :type inventory: Inventory
+    :param old_price: The price before the change
+    :type old_price: float
+    :param old_count: The count before the change
+    :type old_count: int
+    :param deleted: (Optional) Whether the item was deleted
+    :type deleted: bool, optional
+    """
+    event = {
+        "inventory_id": inventory.inventory_id,
+        "name": inventory.name,
+        "old_price": old_price,
+        "price": inventory.price,
+        "old_count": old_count,
+        "count": inventory.count,
+    }
+    if deleted:
+        event["deleted"] = True
+    inventory_events.emit(event)
+
+
+_versions = {"values": {}, "expires": 0.0, "generation": 0}
+_versions_lock = threading.Lock()
+
+
+def get_versions():
+    """
+    Read the catalog and stock versions, from memory when read recently.
+
+    The versions are read from the database at most every
+    ``CATALOG_VERSION_TTL`` seconds, and again right after this process
+    commits a write, so cached reads cost no query. Writes made by another
+    worker are seen within ``CATALOG_VERSION_TTL``.
+
+    :return: The versions by ``CATALOG`` and ``STOCK``; missing before the first write
+    :rtype: dict
+    """
+    now = time.monotonic()
+    if now < _versions["expires"]:
+        return _versions["values"]
+    with _versions_lock:
+        if now < _versions["expires"]:
+            return _versions["values"]
+        generation = _versions["generation"]
+        values = dict(db.session.query(CatalogVersion.catalog_id, CatalogVersion.version).all())
+        # A commit expiring the versions during the query may not be in what it read.
+        if generation == _versions["generation"]:
+            _versions["values"], _versions["expires"] = values, now + CATALOG_VERSION_TTL
+    return values
+
+
+def expire_versions():
+    """
+    Make the next read of the versions go to the database.
+    """
+    _versions["generation"] += 1
+    _versions["expires"] = 0.0
+
+
+@event.listens_for(Session, "after_commit")
+def _expire_versions_on_commit(session):
+    if session.info.pop("catalog_changed", False):
+        expire_versions()
+
+
+def get_catalog_version():
+    """
+    Return the version of the catalog as the current request sees it.
+
+    Requests whose ``fields`` leave out ``count`` only depend on the
+    catalog version, so sales do not invalidate them; every other response
+    also changes with the stock version.
+
+    :return: The version, used as ETag and cache key
+    :rtype: str
+    """
+    versions = get_versions()
+    fields = request.args.get('fields')
+    if fields is not None and 'count' not in fields.split(','):
+        return str(versions.get(CATALOG, 0))
+    return f"{versions.get(CATALOG, 0)}.{versions.get(STOCK, 0)}"
+
+
+def bump_catalog_version(part=CATALOG):
+    """
+    Increment the catalog or stock version as part of the current transaction.
+
+    Cached catalog responses and ETags handed out for the old version stop
+    matching once the transaction commits.
+
+    :param part: (Optional) ``CATALOG`` for changes visible without counts, ``STOCK`` for count changes
+    :type part: int, optional
+    """
+    db.session.execute(
+        insert(CatalogVersion).values(catalog_id=part, version=1)
+        .on_conflict_do_update(index_elements=['catalog_id'], set_={'version': CatalogVersion.version + 1})
+    )
+    db.session.info["catalog_changed"] = True
+
 
 @app.route('/inventory', methods=['POST'])
 def add_inventory():
@@ -41,13 +181,13 @@ def add_inventory():
     if not token:
         abort(403, "Something went wrong")
     try:
-        admin_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    admin = requests.get(f"{ADMIN_PATH}/admin:{admin_id}")
-    if admin.status_code == 404:
+    if not has_role(claims, ROLE_ADMIN):
         return abort(403, "Unauthorized")
+    admin_name = claims.get('username', claims['id'])
     
     
     required_fields = ['name', 'category', 'price', 'description', 'count']
@@ -74,11 +214,14 @@ def add_inventory():
         inventory = Inventory(name=name, category=category, price=price, description=description, count=count)
         print(category)
         db.session.add(inventory)
+        bump_catalog_version()
         db.session.commit()
+        # The new item's ID may be cached as missing, e.g. reused after a delete.
+        publish_change(inventory, None, None)
         
         print("here")
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {admin.json()['username']} added new inventory item {name}"})
+        emit_log(f"Admin {admin_name} added new inventory item {name}", SERVICE_NAME, "inventory.added", f"{claims['role']}:{claims['id']}")
 
         return jsonify(inventory_schema.dump(inventory)), 200
     except Exception as e:
@@ -111,13 +254,13 @@ def update_inventory(inventory_id):
     if not token:
         abort(403, "Something went wrong")
     try:
-        admin_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    admin = requests.get(f"{ADMIN_PATH}/admin:{admin_id}")
-    if admin.status_code == 404:
+    if not has_role(claims, ROLE_ADMIN):
         return abort(403, "Unauthorized")
+    admin_name = claims.get('username', claims['id'])
     
     
     name = request.json.get('name')
@@ -146,6 +289,7 @@ def update_inventory(inventory_id):
 
         if not inventory:
             return abort(404, "Item not Found")
+        old_price, old_count = inventory.price, inventory.count
         
         if name:
             inventory.name = name
@@ -162,9 +306,14 @@ def update_inventory(inventory_id):
         if count:
             inventory.count = count
 
+        if name or category or price or description:
+            bump_catalog_version(CATALOG)
+        if count:
+            bump_catalog_version(STOCK)
         db.session.commit()
+        publish_change(inventory, old_price, old_count)
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {admin.json()['username']} updated inventory item {inventory.name}"})
+        emit_log(f"Admin {admin_name} updated inventory item {inventory.name}", SERVICE_NAME, "inventory.updated", f"{claims['role']}:{claims['id']}")
 
         return jsonify(inventory_schema.dump(inventory)), 200
     except Exception as e:
@@ -187,13 +336,13 @@ def delete_inventory(inventory_id):
     if not token:
         abort(403, "Something went wrong")
     try:
-        admin_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    admin = requests.get(f"{ADMIN_PATH}/admin:{admin_id}")
-    if admin.status_code == 404:
+    if not has_role(claims, ROLE_ADMIN):
         return abort(403, "Unauthorized")
+    admin_name = claims.get('username', claims['id'])
     
     
     try:
@@ -202,30 +351,385 @@ def delete_inventory(inventory_id):
         if not inventory:
             return abort(404, "Item not Found")
         
+        price, count = inventory.price, inventory.count
         db.session.delete(inventory)
+        bump_catalog_version()
         db.session.commit()
+        publish_change(inventory, price, count, deleted=True)
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {admin.json()['username']} deleted inventory item {inventory.name}"})
+        emit_log(f"Admin {admin_name} deleted inventory item {inventory.name}", SERVICE_NAME, "inventory.deleted", f"{claims['role']}:{claims['id']}")
 
         return {"Message": "Item Deleted Successfully"}, 200
     except Exception as e:
         return abort(500, "Server Error")
     
     
+def _read_lines(data, key, key_type):
+    """
+    Read the stock lines of a reservation or release request.
+
+    Accepts either a single line at the top level of the body or a list of
+    lines under ``items``. Lines naming the same item are merged.
+
+    :param data: The request body
+    :type data: dict
+    :param key: The field identifying the item on each line (``name`` or ``inventory_id``)
+    :type key: str
+    :param key_type: The expected type of ``key``
+    :type key_type: type
+    :return: Quantities by item, in request order, or None if a line is malformed
+    :rtype: dict or None
+    """
+    items = data.get('items')
+    if items is None:
+        items = [data]
+    if type(items) != list or not items:
+        return None
+
+    lines = {}
+    for item in items:
+        if type(item) != dict:
+            return None
+        value = item.get(key)
+        quantity = item.get('quantity', 1)
+        if type(value) != key_type or type(quantity) != int or quantity <= 0:
+            return None
+        lines[value] = lines.get(value, 0) + quantity
+    return lines
+
+
+def _read_order_id(data):
+    """
+    Read the optional order key of a reservation or release request.
+
+    :return: The order ID, None if absent, or False if malformed
+    :rtype: str or None or bool
+    """
+    order_id = data.get('order_id')
+    if order_id is not None and (type(order_id) != str or not 0 < len(order_id) <= 64):
+        return False
+    return order_id
+
+
+@app.route('/reserve', methods=['POST'])
+def reserve_inventory():
+    """
+    Atomically take stock of one or more items for a sale.
+
+    Each line is a conditional UPDATE, so concurrent buyers can never take
+    more than is in stock, and all lines run in one transaction: if any
+    line cannot be served, nothing is reserved. With an ``order_id`` the
+    reservation is recorded in the same transaction, so a retried request
+    is answered without taking the stock twice and a request for an order
+    already released is refused.
+
+    :param name: The name of the inventory item, for a single-item reservation
+    :type name: str
+    :param quantity: (Optional) The number of units to take, defaults to 1
+    :type quantity: int, optional
+    :param items: (Optional) List of ``{"name", "quantity"}`` lines to reserve together
+    :type items: list, optional
+    :param order_id: (Optional) The ID of the order the stock is taken for
+    :type order_id: str, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 403 for unauthorized access, 404 if an inventory item is not found, 409 if not enough stock or the order was released, 500 for server errors
+    :return: JSON representation of the inventory item after the reservation, or a list of them when ``items`` is given; on 404/409 the body names the failing item
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        claims = decode_claims(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    if not has_role(claims, ROLE_ADMIN, ROLE_SERVICE):
+        return abort(403, "Unauthorized")
+
+    data = request.get_json()
+    lines = _read_lines(data, 'name', str)
+    order_id = _read_order_id(data)
+    if lines is None or order_id is False:
+        return abort(400, "Bad Request")
+
+    failed = None
+    reserved = False
+    try:
+        reservation = db.session.get(Reservation, order_id) if order_id is not None else None
+        if reservation is None:
+            for name, quantity in lines.items():
+                result = db.session.execute(
+                    db.update(Inventory)
+                    .where(Inventory.name == name, Inventory.count >= quantity)
+                    .values(count=Inventory.count - quantity)
+                )
+                if result.rowcount == 0:
+                    failed = name
+                    break
+
+            if failed is not None:
+                db.session.rollback()
+                exists = db.session.query(Inventory.inventory_id).filter_by(name=failed).first()
+            else:
+                if order_id is not None:
+                    ids = dict(db.session.query(Inventory.name, Inventory.inventory_id).filter(Inventory.name.in_(lines)))
+                    db.session.add(Reservation(order_id=order_id, status=RESERVATION_HELD,
+                                               items=json.dumps([[ids[name], quantity] for name, quantity in lines.items()])))
+                bump_catalog_version(STOCK)
+                db.session.commit()
+                reserved = True
+    except IntegrityError:
+        # The same order was reserved concurrently; this reservation was rolled back.
+        db.session.rollback()
+        reservation = db.session.get(Reservation, order_id)
+        if reservation is None:
+            return abort(500, "Server Error")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return abort(500, "Server Error")
+
+    if failed is not None:
+        if not exists:
+            return jsonify({"message": "Item not Found", "name": failed}), 404
+        return jsonify({"message": "Out of Stock", "name": failed}), 409
+
+    if reservation is not None and reservation.status != RESERVATION_HELD:
+        return jsonify({"message": "Order Cancelled", "order_id": order_id}), 409
+
+    inventories = Inventory.query.filter(Inventory.name.in_(lines)).all()
+    if reserved:
+        for inventory in inventories:
+            publish_change(inventory, inventory.price, inventory.count + lines[inventory.name])
+
+    if 'items' not in data:
+        return jsonify(inventory_schema.dump(inventories[0])), 200
+    by_name = {inventory.name: inventory for inventory in inventories}
+    return jsonify(inventories_schema.dump([by_name[name] for name in lines])), 200
+
+
+@app.route('/release', methods=['POST'])
+def release_inventory():
+    """
+    Return previously reserved stock, e.g. when payment for a sale fails.
+
+    With an ``order_id`` the stock recorded for that order is returned
+    instead of the given lines. Such releases are idempotent, so they are
+    safe to retry, including when the outcome of the reservation is
+    unknown: releasing an order that was never reserved records it as
+    released, so a reservation for it arriving late is refused.
+
+    :param inventory_id: The ID of the inventory item, for a single-item release
+    :type inventory_id: int
+    :param quantity: (Optional) The number of units to return, defaults to 1
+    :type quantity: int, optional
+    :param items: (Optional) List of ``{"inventory_id", "quantity"}`` lines to return together
+    :type items: list, optional
+    :param order_id: (Optional) The ID of the order whose stock to return
+    :type order_id: str, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 403 for unauthorized access, 404 if an inventory item is not found, 500 for server errors, 503 if the order is being reserved concurrently
+    :return: JSON representation of the inventory item after the release, or a list of them when ``items`` is given; with ``order_id``, the ``order_id``, its ``status`` and whether this call ``released`` stock
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        claims = decode_claims(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    if not has_role(claims, ROLE_ADMIN, ROLE_SERVICE):
+        return abort(403, "Unauthorized")
+
+    data = request.get_json()
+    order_id = _read_order_id(data)
+    lines = _read_lines(data, 'inventory_id', int) if order_id is None else {}
+    if lines is None or order_id is False:
+        return abort(400, "Bad Request")
+
+    missing = False
+    try:
+        if order_id is not None:
+            reservation = db.session.get(Reservation, order_id)
+            if reservation is None:
+                db.session.add(Reservation(order_id=order_id, items="[]", status=RESERVATION_RELEASED))
+            else:
+                result = db.session.execute(
+                    db.update(Reservation)
+                    .where(Reservation.order_id == order_id, Reservation.status == RESERVATION_HELD)
+                    .values(status=RESERVATION_RELEASED)
+                )
+                if result.rowcount:
+                    lines = {inventory_id: quantity for inventory_id, quantity in json.loads(reservation.items)}
+
+        for inventory_id, quantity in lines.items():
+            result = db.session.execute(
+                db.update(Inventory)
+                .where(Inventory.inventory_id == inventory_id)
+                .values(count=Inventory.count + quantity)
+            )
+            # Items deleted since the order was reserved have no stock to return.
+            if result.rowcount == 0 and order_id is None:
+                missing = True
+                break
+
+        if missing:
+            db.session.rollback()
+        else:
+            if lines:
+                bump_catalog_version(STOCK)
+            db.session.commit()
+            inventories = Inventory.query.filter(Inventory.inventory_id.in_(lines)).all()
+    except IntegrityError:
+        # A reservation of this order committed first; retrying will release it.
+        db.session.rollback()
+        return abort(503, "Try Again", retry_after=1)
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return abort(500, "Server Error")
+
+    if missing:
+        return abort(404, "Item not Found")
+
+    for inventory in inventories:
+        publish_change(inventory, inventory.price, inventory.count - lines[inventory.inventory_id])
+
+    if order_id is not None:
+        return jsonify({"order_id": order_id, "status": RESERVATION_RELEASED, "released": bool(lines)}), 200
+    if 'items' not in data:
+        return jsonify(inventory_schema.dump(inventories[0])), 200
+    by_id = {inventory.inventory_id: inventory for inventory in inventories}
+    return jsonify(inventories_schema.dump([by_id[inventory_id] for inventory_id in lines])), 200
+
+
+def _read_fields(args):
+    """
+    Read the ``fields`` projection of an inventory listing.
+
+    :param args: The request's query parameters
+    :type args: werkzeug.datastructures.MultiDict
+    :raises werkzeug.exceptions.HTTPException: 400 if a field is unknown
+    :return: The requested fields, or None to return every field
+    :rtype: list or None
+    """
+    fields = get_list_arg(args, 'fields')
+    if fields is None:
+        return None
+    if not fields or any(field not in InventorySchema.Meta.fields for field in fields):
+        abort(400, "Bad Request")
+    return fields
+
+
+def _get_price_arg(args, name):
+    """
+    Read an optional price bound from the query parameters.
+
+    :param args: The request's query parameters
+    :type args: werkzeug.datastructures.MultiDict
+    :param name: The parameter name
+    :type name: str
+    :raises werkzeug.exceptions.HTTPException: 400 if the value is not a number
+    :rtype: float or None
+    """
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        abort(400, "Bad Request")
+
+
 @app.route('/inventory', methods=['GET'])
+@versioned_response(catalog_cache, get_catalog_version)
 def get_inventory():
     """
-    Retrieve all inventory items.
-
-    :raises werkzeug.exceptions.HTTPException: 500 for server errors
-    :return: JSON representation of all inventory items
+    Retrieve inventory items one page at a time, or a batch of them by ID or name.
+
+    Pages are ordered by ID; when a page is full the response carries an
+    ``X-Next-Cursor`` header holding the ``after_id`` of the next page. A
+    batch lookup resolves every requested item with a single ``IN`` query,
+    so a caller needing N items makes one request instead of N. Unknown IDs
+    or names are left out of the result. ``fields`` restricts both the
+    selected columns and the serialized keys.
+
+    :param ids: (Optional) Comma-separated inventory IDs to look up
+    :type ids: str, optional
+    :param names: (Optional) Comma-separated inventory names to look up
+    :type names: str, optional
+    :param after_id: (Optional) Only return items with a greater ID
+    :type after_id: int, optional
+    :param limit: (Optional) Page size, defaults to 100 and capped at 1000
+    :type limit: int, optional
+    :param category: (Optional) Only return items of this category
+    :type category: str, optional
+    :param min_price: (Optional) Only return items costing at least this much
+    :type min_price: float, optional
+    :param max_price: (Optional) Only return items costing at most this much
+    :type max_price: float, optional
+    :param fields: (Optional) Comma-separated fields to return, e.g. ``name,price``
+    :type fields: str, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 500 for server errors
+    :return: JSON representation of the inventory items, in the requested order for batch lookups
     :rtype: flask.Response
     """
-    inventories = Inventory.query.all()
-    return jsonify(inventories_schema.dump(inventories)), 200
+    ids = get_list_arg(request.args, 'ids', int)
+    names = get_list_arg(request.args, 'names')
+    if ids is not None and names is not None:
+        return abort(400, "Bad Request")
+
+    fields = _read_fields(request.args)
+    schema = InventorySchema(many=True, only=fields) if fields else inventories_schema
+    # The ID and name are always selected: they drive the cursor and batch ordering.
+    columns = [Inventory.inventory_id, Inventory.name] + [getattr(Inventory, field) for field in fields or InventorySchema.Meta.fields
+                                                          if field not in ('inventory_id', 'name')]
+    query = db.session.query(*columns)
+
+    if ids is not None or names is not None:
+        try:
+            if ids is not None:
+                found = {row.inventory_id: row for row in query.filter(Inventory.inventory_id.in_(ids))}
+                rows = [found[inventory_id] for inventory_id in ids if inventory_id in found]
+            else:
+                found = {row.name: row for row in query.filter(Inventory.name.in_(names))}
+                rows = [found[name] for name in names if name in found]
+        except Exception as e:
+            print(e)
+            return abort(500, "Server Error")
+        return jsonify(schema.dump(rows)), 200
+
+    after_id = get_int_arg(request.args, 'after_id')
+    limit = get_limit(request.args)
+    category = request.args.get('category')
+    min_price = _get_price_arg(request.args, 'min_price')
+    max_price = _get_price_arg(request.args, 'max_price')
+
+    if category is not None:
+        try:
+            query = query.filter(Inventory.category == Category(category))
+        except ValueError:
+            return abort(400, "Bad Request")
+    if min_price is not None:
+        query = query.filter(Inventory.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Inventory.price <= max_price)
+    if after_id is not None:
+        query = query.filter(Inventory.inventory_id > after_id)
+
+    try:
+        rows = query.order_by(Inventory.inventory_id).limit(limit).all()
+    except Exception as e:
+        print(e)
+        return abort(500, "Server Error")
+
+    response = jsonify(schema.dump(rows))
+    return set_next_cursor(response, rows, limit, lambda row: row.inventory_id), 200
 
 
 @app.route('/inventory:<string:name>', methods=['GET'])
+@versioned_response(catalog_cache, get_catalog_version)
 def get_inventory_by_name(name):
     """
     Retrieve an inventory item by its name.
@@ -248,6 +752,7 @@ def get_inventory_by_name(name):
     
 
 @app.route('/inventory:<int:inventory_id>', methods=['GET'])
+@versioned_response(catalog_cache, get_catalog_version)
 def get_inventory_by_id(inventory_id):
     """
     Retrieve an inventory item by its ID.
@@ -269,5 +774,59 @@ def get_inventory_by_id(inventory_id):
         return abort(500, "Server Error")
 
 
+
+@app.route('/search', methods=['GET'])
+@versioned_response(catalog_cache, get_catalog_version)
+def search_inventory():
+    """
+    Search the catalog by name and description, best match first.
+
+    Every word of ``q`` must match, as a prefix, a word of the item's name
+    or description; name matches rank higher. The search only reads the
+    catalog's full-text index and answers 503 when the database lacks it.
+    When a page is full the response carries an ``X-Next-Cursor`` header
+    to pass back as ``cursor``.
+
+    :param q: The search text
+    :type q: str
+    :param category: (Optional) Only return items of this category
+    :type category: str, optional
+    :param cursor: (Optional) The ``X-Next-Cursor`` of the previous page
+    :type cursor: str, optional
+    :param limit: (Optional) Page size, defaults to 100 and capped at 1000
+    :type limit: int, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 500 for server errors, 503 if the index is missing
+    :return: JSON list of the matching inventory items
+    :rtype: flask.Response
+    """
+    terms = match_terms(request.args.get('q'))
+    if not terms:
+        abort(400, "Bad Request")
+    limit = get_limit(request.args)
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor, 2) if cursor else None
+    category = request.args.get('category')
+
+    query = Inventory.query
+    if category is not None:
+        try:
+            query = query.filter(Inventory.category == Category(category))
+        except ValueError:
+            return abort(400, "Bad Request")
+
+    try:
+        rows = inventory_search.search(query, terms, limit, after)
+    except SearchUnavailable as e:
+        print(e)
+        return abort(503, "Search Unavailable")
+    except Exception as e:
+        print(e)
+        return abort(500, "Server Error")
+
+    response = jsonify(inventories_schema.dump([item for item, rank in rows]))
+    return set_next_cursor(response, rows, limit, lambda row: encode_cursor(row[1], row[0].inventory_id)), 200
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5200)
\ No newline at end of file
+    log_emitter.start()
+    inventory_events.start()
+    app.run(debug=True, port=SERVICE_PORTS["inventory"])
\ No newline at end of file
@@ -0,0 +1,9 @@
+from shared.migrations import Migration
+from inventory_service.models import MODELS, inventory_search
+
+MIGRATIONS = [
+    Migration(1, "create tables", lambda ops: ops.create_tables(MODELS)),
+    Migration(2, "index price and category", lambda ops: ops.create_indexes(MODELS)),
+    Migration(3, "full-text search index", lambda ops: ops.create_search_index(inventory_search)),
+    Migration(4, "reservations", lambda ops: ops.create_tables(MODELS)),
+]
@@ -1,4 +1,6 @@
 from shared.db import db, ma
+from shared.search import SearchIndex
+from datetime import datetime
 from enum import Enum
 from marshmallow_enum import EnumField
 
@@ -12,13 +14,62 @@ class Inventory(db.Model):
     inventory_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False, unique=True)
     category = db.Column(db.Enum(Category), nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Float, nullable=False, index=True)
     description = db.Column(db.String(128), nullable=False)
     count = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_inventory_category_price', 'category', 'price'),
+    )
+
     def __init__(self, name, category, price, description, count):
         super(Inventory, self).__init__(name=name, category=category, price=price, description=description, count=count)
 
+CATALOG = 1
+STOCK = 2
+
+class CatalogVersion(db.Model):
+    """
+    Counters bumped by writes to the inventory, one row per part of it.
+
+    The ``CATALOG`` row changes when items are added, removed, renamed,
+    recategorized, described or repriced; the ``STOCK`` row when only
+    counts change, as they do on every sale. Catalog responses use them as
+    their ETag and cache key, so every inventory process sees the same
+    version, and responses without counts survive sales.
+
+    :ivar catalog_id: ``CATALOG`` or ``STOCK``
+    :vartype catalog_id: int
+    :ivar version: Incremented whenever that part of the inventory changes
+    :vartype version: int
+    """
+    catalog_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+RESERVATION_HELD = "held"
+RESERVATION_RELEASED = "released"
+
+class Reservation(db.Model):
+    """
+    The stock taken for one order, so it is taken and returned at most once.
+
+    A release for an order that was never reserved is recorded too, so a
+    reservation arriving after it is refused instead of taking the stock.
+
+    :ivar order_id: The ID sale_service chose for the order
+    :vartype order_id: str
+    :ivar items: JSON list of the ``[inventory_id, quantity]`` lines taken
+    :vartype items: str
+    :ivar status: ``held`` or ``released``
+    :vartype status: str
+    :ivar created: The date when the reservation was recorded
+    :vartype created: str
+    """
+    order_id = db.Column(db.String(64), primary_key=True)
+    items = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    created = db.Column(db.String(30), nullable=False, default=lambda: str(datetime.now()))
+
 class InventorySchema(ma.Schema):
     category = EnumField(Category, by_value=True)
     class Meta:
@@ -27,3 +78,8 @@ class InventorySchema(ma.Schema):
 
 inventory_schema = InventorySchema()
 inventories_schema = InventorySchema(many=True)
+
+# Full-text index of the catalog, kept up to date by triggers; name matches rank above description matches
+inventory_search = SearchIndex(Inventory, ('name', 'description'), weights=(10, 1))
+
+MODELS = (Inventory, CatalogVersion, Reservation)
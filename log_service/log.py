@@ -1,31 +1,110 @@
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, request, Response, stream_with_context
 from flask_cors import CORS
 
-from log_service.models import Log, logs_schema, log_schema
-from shared.db import db, ma, bcrypt
+from log_service.models import Log, logs_schema, log_schema, next_timestamp, PARTITION_FORMAT
+from shared.db import db, ma, bcrypt, database_uri, engine_options
+from shared.metrics import register_metrics
+from shared.identity import register_revocation_routes
+from shared.pagination import get_int_arg, get_limit, set_next_cursor
+from shared.token import extract_auth_token, decode_claims, has_role, jwt, ROLE_ADMIN, ROLE_SERVICE, SERVICE_PORTS
+
+from datetime import datetime, timedelta
+import json
+import os
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///lab-project.db"
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri("log")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 db.init_app(app)
 bcrypt.init_app(app)
 ma.init_app(app)
 
 CORS(app)
+register_metrics(app, "log_service")
+register_revocation_routes(app)
+
+LOG_RETENTION_DAYS = int(os.environ.get("LOG_RETENTION_DAYS", 90))
+PURGE_CHUNK_SIZE = 5000
+STREAM_CHUNK_SIZE = 500
+LOG_FIELDS = ('service', 'event_type', 'actor')
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, "Bad request")
 
 
 @app.route('/logs', methods=['GET'])
 def get_logs():
     """
-    Retrieve all logs.
+    Retrieve logs, oldest first, one page at a time.
+
+    When the page is full the response carries an ``X-Next-Cursor`` header
+    holding the ``after_id`` of the next page. With ``format=ndjson`` every
+    matching log is streamed as one JSON object per line instead, read from
+    the database in chunks so memory use does not grow with the table.
 
-    :raises werkzeug.exceptions.HTTPException: 500 for server errors
-    :return: JSON representation of all logs
+    :param after_id: (Optional) Only return logs with a greater ID
+    :type after_id: int, optional
+    :param limit: (Optional) Page size, defaults to 100 and capped at 1000; no default when streaming
+    :type limit: int, optional
+    :param since: (Optional) ISO 8601 time of the earliest log to return
+    :type since: str, optional
+    :param until: (Optional) ISO 8601 time before which logs are returned
+    :type until: str, optional
+    :param service: (Optional) Only return logs recorded by this service
+    :type service: str, optional
+    :param q: (Optional) Only return logs whose message contains this text
+    :type q: str, optional
+    :param format: (Optional) ``json`` (default) or ``ndjson``
+    :type format: str, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 500 for server errors
+    :return: JSON list of logs, or an NDJSON stream
     :rtype: flask.Response
     """
-    logs = Log.query.all()
-    return jsonify(logs_schema.dump(logs)), 200
+    after_id = get_int_arg(request.args, 'after_id')
+    since = _parse_time(request.args.get('since'))
+    until = _parse_time(request.args.get('until'))
+    service = request.args.get('service')
+    q = request.args.get('q')
+    output = request.args.get('format', 'json')
+    if output not in ('json', 'ndjson'):
+        abort(400, "Bad request")
+
+    query = Log.query
+    if after_id is not None:
+        query = query.filter(Log.log_id > after_id)
+    if since:
+        query = query.filter(Log.timestamp >= since)
+    if until:
+        query = query.filter(Log.timestamp < until)
+    if service:
+        query = query.filter(Log.service == service)
+    if q:
+        query = query.filter(Log.message.contains(q, autoescape=True))
+    query = query.order_by(Log.log_id)
+
+    if output == 'ndjson':
+        limit = get_int_arg(request.args, 'limit', minimum=1)
+        if limit:
+            query = query.limit(limit)
+
+        def generate():
+            for log in query.yield_per(STREAM_CHUNK_SIZE):
+                yield json.dumps(log_schema.dump(log)) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    limit = get_limit(request.args)
+    logs = query.limit(limit).all()
+    response = jsonify(logs_schema.dump(logs))
+    return set_next_cursor(response, logs, limit, lambda log: log.log_id), 200
 
 @app.route('/add-log', methods=['POST'])
 def add_log():
@@ -34,17 +113,121 @@ def add_log():
 
     :param message: The log message to be added
     :type message: str
+    :param service: (Optional) The service that recorded the entry
+    :type service: str, optional
+    :param event_type: (Optional) The kind of event
+    :type event_type: str, optional
+    :param actor: (Optional) Who caused the event
+    :type actor: str, optional
     :raises werkzeug.exceptions.HTTPException: 400 for bad request, 500 for server errors
     :return: JSON representation of the newly created log
     :rtype: flask.Response
     """
     if 'message' not in request.json:
         abort(400, "Bad request")
-    log = Log(message=request.json['message'])
+    log = Log(message=request.json['message'], **{field: request.json.get(field) for field in LOG_FIELDS})
     db.session.add(log)
     db.session.commit()
     return jsonify(log_schema.dump(log)), 200
 
+@app.route('/add-logs', methods=['POST'])
+def add_logs():
+    """
+    Add a batch of log messages in a single transaction.
+
+    :param logs: The log entries to be added, each an object with a 'message' and optionally 'service', 'event_type' and 'actor'
+    :type logs: list
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 500 for server errors
+    :return: Number of logs added
+    :rtype: flask.Response
+    """
+    entries = request.json.get('logs')
+    if type(entries) != list:
+        abort(400, "Bad request")
+    for entry in entries:
+        if type(entry) != dict or type(entry.get('message')) != str:
+            abort(400, "Bad request")
+
+    rows = []
+    for entry in entries:
+        timestamp = next_timestamp()
+        row = {'message': entry['message'], 'timestamp': timestamp, 'partition': timestamp.strftime(PARTITION_FORMAT)}
+        for field in LOG_FIELDS:
+            row[field] = entry.get(field)
+        rows.append(row)
+
+    try:
+        if rows:
+            db.session.execute(db.insert(Log), rows)
+        db.session.commit()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        abort(500, "Server Error")
+    return jsonify({"count": len(rows)}), 200
+
+@app.route('/logs/partitions', methods=['GET'])
+def get_partitions():
+    """
+    List the daily log partitions and how many entries each holds.
+
+    :return: JSON list of partitions, oldest first
+    :rtype: flask.Response
+    """
+    partitions = db.session.query(Log.partition, db.func.count(Log.log_id)).group_by(Log.partition).order_by(Log.partition).all()
+    return jsonify([{"partition": partition, "count": count} for partition, count in partitions]), 200
+
+@app.route('/logs/rotate', methods=['POST'])
+def rotate_logs():
+    """
+    Purge every log partition older than the retention period.
+
+    Rows are deleted in chunks of ``PURGE_CHUNK_SIZE``, each in its own
+    transaction, so concurrent inserts are never blocked for long.
+
+    :param retention_days: (Optional) Days of logs to keep, defaults to ``LOG_RETENTION_DAYS``
+    :type retention_days: int, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 403 for unauthorized access
+    :return: The oldest partition kept and the number of entries purged
+    :rtype: flask.Response
+    """
+    token = extract_auth_token(request)
+    if not token:
+        abort(403, "Something went wrong")
+    try:
+        claims = decode_claims(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        abort(403, "Something went wrong")
+
+    if not has_role(claims, ROLE_ADMIN, ROLE_SERVICE):
+        abort(403, "Unauthorized")
+
+    retention_days = (request.get_json(silent=True) or {}).get('retention_days', LOG_RETENTION_DAYS)
+    if type(retention_days) != int or retention_days < 0:
+        abort(400, "Bad request")
+
+    oldest_kept = (datetime.now() - timedelta(days=retention_days)).strftime(PARTITION_FORMAT)
+    purged = purge_partitions(oldest_kept)
+    return jsonify({"oldest_kept": oldest_kept, "purged": purged}), 200
+
+
+def purge_partitions(oldest_kept):
+    """
+    Delete all entries in partitions before ``oldest_kept``.
+
+    :param oldest_kept: The first partition to keep
+    :type oldest_kept: str
+    :return: Number of entries deleted
+    :rtype: int
+    """
+    purged = 0
+    while True:
+        chunk = db.session.query(Log.log_id).filter(Log.partition < oldest_kept).limit(PURGE_CHUNK_SIZE).subquery()
+        deleted = Log.query.filter(Log.log_id.in_(db.select(chunk.c.log_id))).delete(synchronize_session=False)
+        db.session.commit()
+        purged += deleted
+        if deleted < PURGE_CHUNK_SIZE:
+            return purged
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5250)
\ No newline at end of file
+    app.run(debug=True, port=SERVICE_PORTS["log"])
\ No newline at end of file
@@ -0,0 +1,21 @@
+from shared.migrations import Migration
+from log_service.models import MODELS, Log
+
+
+def partition_logs(ops):
+    """
+    Move logs created before partitioning to the current schema.
+
+    SQLite cannot drop the old unique constraint on ``message`` in place, so
+    the table is rebuilt; ``partition`` is derived from the stored timestamp.
+    """
+    if ops.has_column(Log.__tablename__, "partition"):
+        ops.create_indexes(MODELS)
+        return
+    ops.rebuild_table(Log, {"partition": "substr(timestamp, 1, 10)"})
+
+
+MIGRATIONS = [
+    Migration(1, "create tables", lambda ops: ops.create_tables(MODELS)),
+    Migration(2, "partition logs by day", partition_logs),
+]
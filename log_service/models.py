@@ -1,37 +1,88 @@
 from shared.db import db, ma, bcrypt
 from datetime import datetime
+import threading
+
+PARTITION_FORMAT = "%Y-%m-%d"
+
+_clock_lock = threading.Lock()
+_last_timestamp = datetime.min
+
+
+def next_timestamp():
+    """
+    Return the current time, never earlier than the last value returned.
+
+    Keeps log order consistent with insertion order in this process even if
+    the wall clock is stepped back.
+
+    :return: The timestamp for a new log entry
+    :rtype: datetime.datetime
+    """
+    global _last_timestamp
+    with _clock_lock:
+        _last_timestamp = max(datetime.now(), _last_timestamp)
+        return _last_timestamp
+
 
 class Log(db.Model):
     """
     The Log object represents a log entry in the system.
 
+    Entries are partitioned by day: ``partition`` holds the entry's date so
+    old days can be listed and purged through an index instead of a scan.
+
     :param message: The log message
     :type message: str
-    :param timestamp: The timestamp when the log was created (defaults to the current datetime)
-    :type timestamp: str
+    :param service: The service that recorded the entry
+    :type service: str, optional
+    :param event_type: The kind of event (e.g. ``sale.created``)
+    :type event_type: str, optional
+    :param actor: Who caused the event (e.g. ``customer:5``)
+    :type actor: str, optional
     :ivar log_id: The unique identifier for the log
     :vartype log_id: int
     :ivar message: The content of the log message
     :vartype message: str
     :ivar timestamp: The time at which the log entry was created
-    :vartype timestamp: str
+    :vartype timestamp: datetime.datetime
+    :ivar partition: The day the entry belongs to, formatted with ``PARTITION_FORMAT``
+    :vartype partition: str
+    :ivar service: The service that recorded the entry
+    :vartype service: str
+    :ivar event_type: The kind of event
+    :vartype event_type: str
+    :ivar actor: Who caused the event
+    :vartype actor: str
     """
     log_id = db.Column(db.Integer, primary_key=True)
-    message = db.Column(db.String(255), nullable=False, unique=True)
-    timestamp = db.Column(db.String(30), nullable=False, default=datetime.now())
-    def __init__(self, message):
-        super(Log, self).__init__(message=message, timestamp=datetime.now())
+    message = db.Column(db.String(255), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True, default=next_timestamp)
+    partition = db.Column(db.String(10), nullable=False, index=True)
+    service = db.Column(db.String(40), nullable=True)
+    event_type = db.Column(db.String(40), nullable=True)
+    actor = db.Column(db.String(80), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_log_service_timestamp', 'service', 'timestamp'),
+    )
+
+    def __init__(self, message, service=None, event_type=None, actor=None):
+        timestamp = next_timestamp()
+        super(Log, self).__init__(message=message, timestamp=timestamp, partition=timestamp.strftime(PARTITION_FORMAT),
+                                  service=service, event_type=event_type, actor=actor)
 
 
 class LogSchema(ma.Schema):
     """
     The LogSchema object is used for serializing and deserializing log data.
 
-    :cvar Meta.fields: The fields included in the schema ('log_id', 'message', 'timestamp')
+    :cvar Meta.fields: The fields included in the schema ('log_id', 'message', 'timestamp', 'service', 'event_type', 'actor')
     :vartype Meta.fields: tuple
     """
     class Meta:
-        fields = ('log_id', 'message', 'timestamp')
+        fields = ('log_id', 'message', 'timestamp', 'service', 'event_type', 'actor')
 
 log_schema = LogSchema()
-logs_schema = LogSchema(many=True)
\ No newline at end of file
+logs_schema = LogSchema(many=True)
+
+MODELS = (Log,)
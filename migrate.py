@@ -0,0 +1,52 @@
+"""
+Apply pending schema migrations to the services' databases.
+
+Usage::
+
+    python migrate.py                      # every service
+    python migrate.py log --batch-size 5000
+    python migrate.py sale --status
+
+Each service's steps are listed in ``<service>_service/migrations.py`` and
+its applied versions in its database's ``schema_migrations`` table.
+``serve.py`` and the ``run_*.py`` scripts apply pending migrations at
+startup as well; run this ahead of a deploy to do long backfills and table
+rebuilds without delaying it.
+"""
+import argparse
+import importlib
+
+from shared.db import db
+from shared.migrations import MIGRATION_BATCH_SIZE, applied_versions, migrate
+
+SERVICES = ("admin", "customer", "favorite", "inventory", "log", "review", "sale")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("services", nargs="*", metavar="service", help=f"one of {', '.join(SERVICES)}; all by default")
+    parser.add_argument("--target", type=int, help="highest version to apply")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE, help="rows per transaction for backfills and copies")
+    parser.add_argument("--status", action="store_true", help="list applied and pending versions without migrating")
+    args = parser.parse_args(argv)
+    unknown = set(args.services) - set(SERVICES)
+    if unknown:
+        parser.error(f"unknown services: {', '.join(sorted(unknown))}")
+
+    for service in args.services or SERVICES:
+        app = importlib.import_module(f"{service}_service.{service}").app
+        migrations = importlib.import_module(f"{service}_service.migrations").MIGRATIONS
+        with app.app_context():
+            if args.status:
+                applied = applied_versions(db.engine)
+                for migration in migrations:
+                    state = "applied" if migration.version in applied else "pending"
+                    print(f"{service} {migration.version} {migration.name}: {state}")
+                continue
+            done = migrate(db.engine, migrations, args.target, args.batch_size,
+                           progress=lambda message: print(f"{service}: {message}"))
+            print(f"{service}: {'applied ' + ', '.join(map(str, done)) if done else 'up to date'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+from sqlalchemy import text
+
+from shared.migrations import Migration
+from review_service.models import MODELS, ProductRating, RATINGS, review_search
+
+
+def _product_ratings(ops):
+    """
+    Create the product_rating table and compute it from the existing reviews.
+    """
+    ops.create_tables(MODELS)
+    stars = "".join(f", SUM(CASE WHEN flag THEN 0 ELSE rating = {r} END)" for r in RATINGS)
+    with ops.engine.begin() as connection:
+        connection.execute(text(
+            f"INSERT OR REPLACE INTO {ProductRating.__tablename__} "
+            "(inventory_id, count, total, " + ", ".join(f"stars_{r}" for r in RATINGS) + ", flagged) "
+            "SELECT inventory_id, SUM(CASE WHEN flag THEN 0 ELSE 1 END), SUM(CASE WHEN flag THEN 0 ELSE rating END)"
+            f"{stars}, SUM(CASE WHEN flag THEN 1 ELSE 0 END) "
+            "FROM review WHERE rating BETWEEN 1 AND 5 OR flag GROUP BY inventory_id"
+        ))
+
+
+MIGRATIONS = [
+    Migration(1, "create tables", lambda ops: ops.create_tables(MODELS)),
+    Migration(2, "index inventory_id and customer_id", lambda ops: ops.create_indexes(MODELS)),
+    Migration(3, "product rating aggregates", _product_ratings),
+    Migration(4, "index review listings by date and rating", lambda ops: ops.create_indexes(MODELS)),
+    Migration(5, "full-text search index", lambda ops: ops.create_search_index(review_search)),
+]
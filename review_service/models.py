@@ -1,5 +1,10 @@
 from shared.db import db, ma
 from datetime import datetime
+from marshmallow import fields
+
+from shared.search import SearchIndex
+
+RATINGS = (1, 2, 3, 4, 5)
 
 class Review(db.Model):
     """
@@ -30,13 +35,22 @@ class Review(db.Model):
     """
 
     review_id = db.Column(db.Integer, primary_key=True)
-    inventory_id = db.Column(db.Integer, nullable=False)
-    customer_id = db.Column(db.Integer, nullable=False)
+    inventory_id = db.Column(db.Integer, nullable=False, index=True)
+    customer_id = db.Column(db.Integer, nullable=False, index=True)
     date = db.Column(db.String(30), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.String(80))
     flag = db.Column(db.Boolean, nullable=True)
 
+    __table_args__ = (
+        # Back the paginated listings: each seeks on (key, sort column), and SQLite
+        # appends review_id, the rowid, to every index entry to break ties.
+        db.Index('ix_review_inventory_date', 'inventory_id', 'date'),
+        db.Index('ix_review_inventory_rating', 'inventory_id', 'rating'),
+        db.Index('ix_review_customer_date', 'customer_id', 'date'),
+        db.Index('ix_review_customer_rating', 'customer_id', 'rating'),
+    )
+
     def __init__(self, inventory_id, customer_id, rating, comment):
         self.date = datetime.now()
         self.flag = None
@@ -56,4 +70,61 @@ class ReviewSchema(ma.Schema):
         fields = ('review_id', 'inventory_id', 'customer_id', 'date', 'rating', 'comment', 'flag')
 
 review_schema = ReviewSchema()
-reviews_schema = ReviewSchema(many=True)
\ No newline at end of file
+reviews_schema = ReviewSchema(many=True)
+
+class ProductRating(db.Model):
+    """
+    The ProductRating object holds the running rating aggregates of an inventory item.
+
+    It is updated in the same transaction as every review write, so a
+    product's rating is read from one row instead of computed over its
+    reviews. Flagged reviews are left out of the count, total and
+    histogram and counted in ``flagged`` instead.
+
+    :ivar inventory_id: The ID of the inventory item
+    :vartype inventory_id: int
+    :ivar count: The number of unflagged reviews
+    :vartype count: int
+    :ivar total: The sum of the unflagged reviews' ratings
+    :vartype total: int
+    :ivar stars_1: The number of unflagged 1-star reviews (likewise ``stars_2`` to ``stars_5``)
+    :vartype stars_1: int
+    :ivar flagged: The number of flagged reviews
+    :vartype flagged: int
+    """
+    inventory_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    stars_1 = db.Column(db.Integer, nullable=False, default=0)
+    stars_2 = db.Column(db.Integer, nullable=False, default=0)
+    stars_3 = db.Column(db.Integer, nullable=False, default=0)
+    stars_4 = db.Column(db.Integer, nullable=False, default=0)
+    stars_5 = db.Column(db.Integer, nullable=False, default=0)
+    flagged = db.Column(db.Integer, nullable=False, default=0)
+
+class ProductRatingSchema(ma.Schema):
+    """
+    The ProductRatingSchema object is used for serializing product rating aggregates.
+
+    :cvar Meta.fields: The fields included in the schema ('inventory_id', 'count', 'average', 'histogram', 'flagged')
+    :vartype Meta.fields: tuple
+    """
+    average = fields.Method("get_average")
+    histogram = fields.Method("get_histogram")
+
+    class Meta:
+        fields = ('inventory_id', 'count', 'average', 'histogram', 'flagged')
+
+    def get_average(self, rating):
+        return round(rating.total / rating.count, 2) if rating.count else None
+
+    def get_histogram(self, rating):
+        return {str(stars): getattr(rating, f"stars_{stars}") for stars in RATINGS}
+
+product_rating_schema = ProductRatingSchema()
+product_ratings_schema = ProductRatingSchema(many=True)
+
+# Full-text index of review comments, kept up to date by triggers
+review_search = SearchIndex(Review, ('comment',))
+
+MODELS = (Review, ProductRating)
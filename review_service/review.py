@@ -1,22 +1,148 @@
 from flask import Flask, request, abort, jsonify
+from werkzeug.exceptions import HTTPException
 from flask_cors import CORS
 import jwt
-
-from review_service.models import Review, review_schema, reviews_schema
-from shared.db import db, ma, bcrypt
-from shared.token import extract_auth_token, decode_token, CUSTOMER_PATH, ADMIN_PATH, LOG_PATH
-
-import requests
+import os
+from collections import Counter, defaultdict
+from datetime import datetime
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.sqlite import insert
+
+from review_service.models import Review, ProductRating, RATINGS, review_schema, reviews_schema, product_rating_schema, product_ratings_schema, review_search
+from shared.db import db, ma, bcrypt, database_uri, engine_options
+from shared.metrics import register_metrics
+from shared.token import extract_auth_token, decode_token, decode_claims, has_role, ROLE_ADMIN, SERVICE_PORTS
+from shared.emitter import emit_log, log_emitter
+from shared.cache import register_cache_routes
+from shared.identity import get_customer, register_revocation_routes
+from shared.pagination import get_bool_arg, get_int_arg, get_limit, get_list_arg, set_next_cursor, encode_cursor, decode_cursor
+from shared.search import SearchUnavailable, match_terms
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///lab-project.db"
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri("review")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 db.init_app(app)
 bcrypt.init_app(app)
 ma.init_app(app)
 
 CORS(app)
+register_cache_routes(app)
+
+SERVICE_NAME = "review_service"
+register_metrics(app, SERVICE_NAME)
+register_revocation_routes(app)
+BULK_MODERATION_LIMIT = int(os.environ.get("BULK_MODERATION_LIMIT", 10000))
+# Review IDs per IN (...) query, well under SQLite's bound parameter limit
+BULK_CHUNK_SIZE = 500
+
+# Columns review listings can be sorted by; each has an index per listing key.
+SORT_COLUMNS = {'date': Review.date, 'rating': Review.rating}
+
+
+def valid_rating(rating):
+    """
+    Check that a rating is a whole number of stars from 1 to 5.
+    """
+    return isinstance(rating, int) and not isinstance(rating, bool) and rating in RATINGS
+
+
+def adjust_rating(inventory_id, rating, sign, flagged=False):
+    """
+    Add (``sign=1``) or remove (``sign=-1``) one review from its product's rating, in the current transaction.
+
+    The increment runs in SQL, so concurrent writers never lose each
+    other's updates. Flagged reviews only move the flagged count.
+
+    :param inventory_id: The ID of the reviewed inventory item
+    :type inventory_id: int
+    :param rating: The review's rating
+    :type rating: int
+    :param sign: 1 to add the review, -1 to remove it
+    :type sign: int
+    :param flagged: Whether the review is flagged
+    :type flagged: bool
+    """
+    apply_rating_deltas(inventory_id, rating_deltas(rating, sign, flagged))
+
+
+def rating_deltas(rating, sign, flagged=False):
+    """
+    Compute how adding or removing one review changes its product's rating columns.
+
+    :return: The change of each ``ProductRating`` column
+    :rtype: collections.Counter
+    """
+    if flagged:
+        return Counter({'flagged': sign})
+    if rating in RATINGS:
+        return Counter({'count': sign, 'total': sign * rating, f'stars_{rating}': sign})
+    return Counter()
+
+
+def apply_rating_deltas(inventory_id, deltas):
+    """
+    Add column changes to a product's rating with one upsert, in the current transaction.
+
+    :param inventory_id: The ID of the inventory item
+    :type inventory_id: int
+    :param deltas: The change of each ``ProductRating`` column
+    :type deltas: collections.Counter
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    columns = ProductRating.__table__.c
+    db.session.execute(
+        insert(ProductRating).values(inventory_id=inventory_id, **deltas)
+        .on_conflict_do_update(index_elements=['inventory_id'], set_={name: columns[name] + delta for name, delta in deltas.items()})
+    )
+
+
+def review_page(query):
+    """
+    Return one page of a review listing, following the request's paging parameters.
+
+    Pages are read by keyset: the cursor holds the sort value and ID of the
+    previous page's last review, and the next page starts strictly after
+    it, so every page costs one index seek however deep it is.
+
+    :param query: Reviews of one product or customer
+    :type query: flask_sqlalchemy.query.Query
+    :raises werkzeug.exceptions.HTTPException: 400 for bad paging parameters
+    :return: JSON list of reviews, with an ``X-Next-Cursor`` header if more follow
+    :rtype: flask.Response
+    """
+    sort = request.args.get('sort', 'date')
+    order = request.args.get('order', 'desc')
+    if sort not in SORT_COLUMNS or order not in ('asc', 'desc'):
+        abort(400, "Bad Request")
+    column = SORT_COLUMNS[sort]
+    limit = get_limit(request.args)
+
+    if get_bool_arg(request.args, 'exclude_flagged'):
+        query = query.filter(Review.flag.isnot(True))
+    cursor = request.args.get('cursor')
+    if cursor:
+        value, review_id = decode_cursor(cursor, 2)
+        key = tuple_(column, Review.review_id)
+        query = query.filter(key < tuple_(value, review_id) if order == 'desc' else key > tuple_(value, review_id))
+    if order == 'desc':
+        query = query.order_by(column.desc(), Review.review_id.desc())
+    else:
+        query = query.order_by(column, Review.review_id)
+
+    reviews = query.limit(limit).all()
+    response = jsonify(reviews_schema.dump(reviews))
+    return set_next_cursor(response, reviews, limit, lambda review: encode_cursor(getattr(review, sort), review.review_id))
+
+
+def empty_rating(inventory_id):
+    """
+    Build the rating of a product that has no reviews yet.
+    """
+    return ProductRating(inventory_id=inventory_id, count=0, total=0, flagged=0, **{f'stars_{stars}': 0 for stars in RATINGS})
 
 
 @app.route('/review', methods=['POST'])
@@ -26,7 +152,7 @@ def submit_review():
 
     :param inventory_id: The ID of the inventory item being reviewed
     :type inventory_id: int
-    :param rating: The rating given by the customer
+    :param rating: The rating given by the customer, from 1 to 5
     :type rating: int
     :param comment: The review comment
     :type comment: str
@@ -43,10 +169,9 @@ def submit_review():
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    response = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
-    if response.status_code == 404:
+    customer = get_customer(customer_id)
+    if not customer:
         return abort(403, "Unauthorized")
-    customer = response.json()
     
     if 'inventory_id' not in request.json or 'rating' not in request.json or 'comment' not in request.json:
         abort(400, "Bad Request")
@@ -54,12 +179,20 @@ def submit_review():
     inventory_id = request.json['inventory_id']
     rating = request.json['rating']
     comment = request.json['comment']
+    if type(inventory_id) != int or not valid_rating(rating):
+        abort(400, "Bad Request")
 
-    review = Review(customer_id=customer['user_id'], inventory_id=inventory_id, rating=rating, comment=comment)
-    db.session.add(review)
-    db.session.commit()
+    try:
+        review = Review(customer_id=customer['user_id'], inventory_id=inventory_id, rating=rating, comment=comment)
+        db.session.add(review)
+        adjust_rating(inventory_id, rating, 1)
+        db.session.commit()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return abort(500, "Server Error")
     
-    requests.post(f"{LOG_PATH}/add-log", json={"message": f"Customer {customer['full_name']} added review on item {inventory_id}"})
+    emit_log(f"Customer {customer['full_name']} added review on item {inventory_id}", SERVICE_NAME, "review.submitted", f"customer:{customer_id}")
 
     return jsonify(review_schema.dump(review)), 201
 
@@ -71,7 +204,7 @@ def update_review():
 
     :param review_id: The ID of the review to be updated
     :type review_id: int
-    :param rating: (Optional) The updated rating
+    :param rating: (Optional) The updated rating, from 1 to 5
     :type rating: int, optional
     :param comment: (Optional) The updated comment
     :type comment: str, optional
@@ -87,10 +220,9 @@ def update_review():
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    response = requests.get(f"{CUSTOMER_PATH}/customer:{customer_id}")
-    if response.status_code == 404:
+    customer = get_customer(customer_id)
+    if not customer:
         return abort(403, "Unauthorized")
-    customer = response.json()
     
     if 'review_id' not in request.json or ('rating' not in request.json and 'comment' not in request.json):
         abort(400, "Bad Request")
@@ -107,12 +239,17 @@ def update_review():
         abort(403, "Unauthorized")
 
     if rating:
+        if not valid_rating(rating):
+            abort(400, "Bad Request")
+        if rating != review.rating:
+            adjust_rating(review.inventory_id, review.rating, -1, review.flag)
+            adjust_rating(review.inventory_id, rating, 1, review.flag)
         review.rating = rating
     if comment:
         review.comment = comment
     db.session.commit()
     
-    requests.post(f"{LOG_PATH}/add-log", json={"message": f"Customer {customer['full_name']} updated review on item {review.inventory_id}"})
+    emit_log(f"Customer {customer['full_name']} updated review on item {review.inventory_id}", SERVICE_NAME, "review.updated", f"customer:{customer_id}")
     
     return jsonify(review_schema.dump(review)), 200
 
@@ -132,79 +269,178 @@ def delete_review():
     if not token:
         abort(403, "Something went wrong")
     try:
-        id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    response1 = requests.get(f"{CUSTOMER_PATH}/customer:{id}")
-    response2 = requests.get(f"{ADMIN_PATH}/admin:{id}")
-
-    if response1.status_code == 200:
-        customer = response1.json()
-    
+    if has_role(claims, ROLE_ADMIN):
         if 'review_id' not in request.json:
             abort(400, "Bad Request")
-            
         review_id = request.json['review_id']
         review = Review.query.filter_by(review_id=review_id).first()
         if not review:
             abort(404, "Review not found")
-        if review.customer_id != customer['user_id']:
-            abort(403, "Unauthorized")
         db.session.delete(review)
+        adjust_rating(review.inventory_id, review.rating, -1, review.flag)
         db.session.commit()
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Customer {customer['full_name']} deleted review on item {review.inventory_id}"})
-    
-        return jsonify({"message": "Review deleted"}), 200
-    
-    
-    elif response2.status_code == 200:
-        admin = response2.json()
-        if 'review_id' not in request.json:
-            abort(400, "Bad Request")
-        review_id = request.json['review_id']
-        review = Review.query.filter_by(review_id=review_id).first()
-        if not review:
-            abort(404, "Review not found")
-        db.session.delete(review)
-        db.session.commit()
-        
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {admin['username']} deleted review on item {review.inventory_id} from customer {review.customer_id}"})
+        emit_log(f"Admin {claims.get('username', claims['id'])} deleted review on item {review.inventory_id} from customer {review.customer_id}", SERVICE_NAME, "review.deleted", f"admin:{claims['id']}")
         return jsonify({"message": "Review deleted"}), 200
-        
-    else:
+
+    customer = get_customer(claims['id'])
+    if not customer:
         return abort(403, "Unauthorized")
 
+    if 'review_id' not in request.json:
+        abort(400, "Bad Request")
+        
+    review_id = request.json['review_id']
+    review = Review.query.filter_by(review_id=review_id).first()
+    if not review:
+        abort(404, "Review not found")
+    if review.customer_id != customer['user_id']:
+        abort(403, "Unauthorized")
+    db.session.delete(review)
+    adjust_rating(review.inventory_id, review.rating, -1, review.flag)
+    db.session.commit()
+    
+    emit_log(f"Customer {customer['full_name']} deleted review on item {review.inventory_id}", SERVICE_NAME, "review.deleted", f"customer:{claims['id']}")
+
+    return jsonify({"message": "Review deleted"}), 200
+
 
 
 @app.route('/product-reviews:<inventory_id>', methods=['GET'])
 def get_product_reviews(inventory_id):
     """
-    Get all reviews for a specific product.
+    Get the reviews for a specific product, one page at a time.
 
     :param inventory_id: The ID of the inventory item
     :type inventory_id: int
-    :raises werkzeug.exceptions.HTTPException: 500 for server errors
-    :return: JSON representation of all reviews for the product
+    :param sort: (Optional) ``date`` (default) or ``rating``
+    :type sort: str, optional
+    :param order: (Optional) ``desc`` (default) or ``asc``
+    :type order: str, optional
+    :param exclude_flagged: (Optional) Leave out flagged reviews
+    :type exclude_flagged: bool, optional
+    :param cursor: (Optional) The ``X-Next-Cursor`` of the previous page
+    :type cursor: str, optional
+    :param limit: (Optional) Page size, defaults to 100 and capped at 1000
+    :type limit: int, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad paging parameters, 500 for server errors
+    :return: JSON representation of a page of reviews for the product
     :rtype: flask.Response
     """
+    query = Review.query.filter_by(inventory_id=inventory_id)
     try:
-        reviews = Review.query.filter_by(inventory_id=inventory_id).all()
-        return jsonify(reviews_schema.dump(reviews)), 200
-    except:
+        response = review_page(query)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(e)
         return abort(500, "Server Error")
+    return response, 200
+
+
+@app.route('/product-rating:<int:inventory_id>', methods=['GET'])
+def get_product_rating(inventory_id):
+    """
+    Get the rating summary of a product: review count, average and histogram of 1 to 5 stars.
+
+    The summary is kept up to date by every review write, so it is read
+    from a single row however many reviews the product has. Flagged
+    reviews are not part of it and are only counted.
+
+    :param inventory_id: The ID of the inventory item
+    :type inventory_id: int
+    :return: JSON representation of the product's rating
+    :rtype: flask.Response
+    """
+    rating = db.session.get(ProductRating, inventory_id) or empty_rating(inventory_id)
+    return jsonify(product_rating_schema.dump(rating)), 200
+
+
+@app.route('/product-ratings', methods=['GET'])
+def get_product_ratings():
+    """
+    Get the rating summaries of several products at once.
+
+    :param ids: Comma-separated IDs of the inventory items (query parameter)
+    :type ids: str
+    :raises werkzeug.exceptions.HTTPException: 400 if ``ids`` is missing or malformed
+    :return: JSON list of the products' ratings, in the order requested
+    :rtype: flask.Response
+    """
+    ids = get_list_arg(request.args, 'ids', int)
+    if not ids:
+        abort(400, "Bad Request")
+    ratings = {rating.inventory_id: rating for rating in ProductRating.query.filter(ProductRating.inventory_id.in_(ids))}
+    return jsonify(product_ratings_schema.dump([ratings.get(i) or empty_rating(i) for i in ids])), 200
+
+
+@app.route('/search', methods=['GET'])
+def search_reviews():
+    """
+    Search review comments, best match first.
+
+    Every word of ``q`` must match, as a prefix, a word of the comment. The
+    search only reads the comments' full-text index and answers 503 when
+    the database lacks it. When a page is full the response carries an
+    ``X-Next-Cursor`` header to pass back as ``cursor``.
+
+    :param q: The search text
+    :type q: str
+    :param inventory_id: (Optional) Only search the reviews of this product
+    :type inventory_id: int, optional
+    :param exclude_flagged: (Optional) Leave out flagged reviews
+    :type exclude_flagged: bool, optional
+    :param cursor: (Optional) The ``X-Next-Cursor`` of the previous page
+    :type cursor: str, optional
+    :param limit: (Optional) Page size, defaults to 100 and capped at 1000
+    :type limit: int, optional
+    :raises werkzeug.exceptions.HTTPException: 400 for bad request, 500 for server errors, 503 if the index is missing
+    :return: JSON list of the matching reviews
+    :rtype: flask.Response
+    """
+    terms = match_terms(request.args.get('q'))
+    if not terms:
+        abort(400, "Bad Request")
+    limit = get_limit(request.args)
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor, 2) if cursor else None
+    inventory_id = get_int_arg(request.args, 'inventory_id')
+
+    query = Review.query
+    if inventory_id is not None:
+        query = query.filter(Review.inventory_id == inventory_id)
+    if get_bool_arg(request.args, 'exclude_flagged'):
+        query = query.filter(Review.flag.isnot(True))
+
+    try:
+        rows = review_search.search(query, terms, limit, after)
+    except SearchUnavailable as e:
+        print(e)
+        return abort(503, "Search Unavailable")
+    except Exception as e:
+        print(e)
+        return abort(500, "Server Error")
+
+    response = jsonify(reviews_schema.dump([review for review, rank in rows]))
+    return set_next_cursor(response, rows, limit, lambda row: encode_cursor(row[1], row[0].review_id)), 200
 
 
 @app.route('/customer-reviews', methods=['GET'])
 def get_customer_reviews():
     """
-    Get all reviews submitted by a specific customer.
+    Get the reviews submitted by a specific customer, one page at a time.
+
+    Takes the same ``sort``, ``order``, ``exclude_flagged``, ``cursor`` and
+    ``limit`` query parameters as ``/product-reviews``.
 
     :param customer_id: The ID of the customer
     :type customer_id: int
     :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 403 for unauthorized access, 500 for server errors
-    :return: JSON representation of all reviews submitted by the customer
+    :return: JSON representation of a page of reviews submitted by the customer
     :rtype: flask.Response
     """
 
@@ -212,33 +448,144 @@ def get_customer_reviews():
     if not token:
         abort(403, "Something went wrong")
     try:
-        admin_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    response = requests.get(f"{ADMIN_PATH}/admin:{admin_id}")
-    if response.status_code == 404:
+    if not has_role(claims, ROLE_ADMIN):
         return abort(403, "Unauthorized")
     
     if 'customer_id' not in request.json:
         abort(400, "Bad Request")
         
     customer_id = request.json['customer_id']
-    reviews = Review.query.filter_by(customer_id=customer_id).all()
-    return jsonify(reviews_schema.dump(reviews)), 200
+    return review_page(Review.query.filter_by(customer_id=customer_id)), 200
+
+
+def _read_moderation_targets(data, flag):
+    """
+    Find the reviews a bulk moderation request applies to.
+
+    :return: The targeted review IDs in order, their rows (ID, product, rating and flag)
+        that exist, and whether a filter matched more than ``BULK_MODERATION_LIMIT`` reviews
+    :rtype: tuple
+    """
+    columns = (Review.review_id, Review.inventory_id, Review.rating, Review.flag)
+
+    if 'review_ids' in data:
+        ids = data['review_ids']
+        if (not isinstance(ids, list) or not ids or len(ids) > BULK_MODERATION_LIMIT
+                or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+            abort(400, "Bad Request")
+        ids = list(dict.fromkeys(ids))
+        rows = []
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            rows += db.session.query(*columns).filter(Review.review_id.in_(ids[start:start + BULK_CHUNK_SIZE])).all()
+        return ids, rows, False
+
+    criteria = data['filter']
+    if not isinstance(criteria, dict) or not criteria or not set(criteria) <= {'customer_id', 'inventory_id', 'since', 'until'}:
+        abort(400, "Bad Request")
+    query = db.session.query(*columns)
+    for key in ('customer_id', 'inventory_id'):
+        if key in criteria:
+            if not isinstance(criteria[key], int) or isinstance(criteria[key], bool):
+                abort(400, "Bad Request")
+            query = query.filter(getattr(Review, key) == criteria[key])
+    for key, compare in (('since', Review.date.__ge__), ('until', Review.date.__lt__)):
+        if key in criteria:
+            try:
+                # Dates are stored as str(datetime), which sorts like the time it holds.
+                query = query.filter(compare(str(datetime.fromisoformat(criteria[key]))))
+            except (TypeError, ValueError):
+                abort(400, "Bad Request")
+    if flag:
+        # Reviews already flagged are skipped, so repeating the request works through a large match.
+        query = query.filter(Review.flag.isnot(True))
+    rows = query.order_by(Review.review_id).limit(BULK_MODERATION_LIMIT + 1).all()
+    more = len(rows) > BULK_MODERATION_LIMIT
+    rows = rows[:BULK_MODERATION_LIMIT]
+    return [row.review_id for row in rows], rows, more
+
+
+def moderate_bulk(claims, data):
+    """
+    Flag or delete many reviews in one transaction, with one log entry.
+
+    :return: JSON with the number of reviews changed, each review's outcome and whether a filter matched more
+    :rtype: flask.Response
+    """
+    flag = data['flag']
+    ids, rows, more = _read_moderation_targets(data, flag)
+    found = {row.review_id: row for row in rows}
+    action = 'flagged' if flag else 'deleted'
+
+    deltas = defaultdict(Counter)
+    changed = []
+    results = []
+    for review_id in ids:
+        row = found.get(review_id)
+        if row is None:
+            results.append({"review_id": review_id, "status": "not found"})
+            continue
+        if flag and row.flag:
+            results.append({"review_id": review_id, "status": "already flagged"})
+            continue
+        if flag:
+            deltas[row.inventory_id].update(rating_deltas(row.rating, -1))
+            deltas[row.inventory_id].update(rating_deltas(row.rating, 1, flagged=True))
+        else:
+            deltas[row.inventory_id].update(rating_deltas(row.rating, -1, row.flag))
+        changed.append(review_id)
+        results.append({"review_id": review_id, "status": action})
+
+    try:
+        for start in range(0, len(changed), BULK_CHUNK_SIZE):
+            query = Review.query.filter(Review.review_id.in_(changed[start:start + BULK_CHUNK_SIZE]))
+            if flag:
+                query.update({Review.flag: True}, synchronize_session=False)
+            else:
+                query.delete(synchronize_session=False)
+        for inventory_id, delta in deltas.items():
+            apply_rating_deltas(inventory_id, delta)
+        db.session.commit()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        changed = None
+    if changed is None:
+        abort(500, "Server Error")
+
+    if changed:
+        scope = f"matching {data['filter']}" if 'filter' in data else "by ID"
+        emit_log(f"Admin {claims.get('username', claims['id'])} {action} {len(changed)} reviews {scope}",
+                 SERVICE_NAME, f"review.bulk_{action}", f"admin:{claims['id']}")
+
+    return jsonify({action: len(changed), "results": results, "more": more}), 200
 
 
 @app.route('/moderate-reviews', methods=['POST'])
 def moderate_reviews():
     """
-    Moderate a review (flag or delete).
+    Moderate a review (flag or delete), or many reviews at once.
+
+    Instead of ``review_id``, a request can name up to ``BULK_MODERATION_LIMIT``
+    reviews with ``review_ids``, or select them with ``filter`` on
+    ``customer_id``, ``inventory_id`` and a ``since``/``until`` date range.
+    They are all flagged or deleted in one transaction and recorded in one
+    log entry; the response reports the outcome for each review and, for a
+    filter, whether more reviews matched than were moderated.
 
     :param review_id: The ID of the review to be moderated
     :type review_id: int
+    :param review_ids: (Optional) The IDs of the reviews to be moderated
+    :type review_ids: list, optional
+    :param filter: (Optional) Criteria selecting the reviews to be moderated
+    :type filter: dict, optional
     :param flag: The moderation flag (e.g., inappropriate, spam)
     :type flag: str
     :raises werkzeug.exceptions.HTTPException: 400 for bad requests, 403 for unauthorized access, 404 if review is not found, 500 for server errors
-    :return: JSON representation of the moderated review or success message for deletion
+    :return: JSON representation of the moderated review or success message for deletion, or the bulk results
     :rtype: flask.Response
     """
 
@@ -246,13 +593,15 @@ def moderate_reviews():
     if not token:
         abort(403, "Something went wrong")
     try:
-        admin_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    response = requests.get(f"{ADMIN_PATH}/admin:{admin_id}")
-    if response.status_code == 404:
+    if not has_role(claims, ROLE_ADMIN):
         return abort(403, "Unauthorized")
+
+    if 'flag' in request.json and ('review_ids' in request.json or 'filter' in request.json):
+        return moderate_bulk(claims, request.json)
     
     if 'review_id' not in request.json or 'flag' not in request.json:
         abort(400, "Bad Request")
@@ -264,17 +613,21 @@ def moderate_reviews():
         abort(404, "Review not found")
 
     if flag:
+        if not review.flag:
+            adjust_rating(review.inventory_id, review.rating, -1)
+            adjust_rating(review.inventory_id, review.rating, 1, flagged=True)
         review.flag = flag
         db.session.commit()
         
-        requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {response.json()['username']} flagged review {review_id}"})
+        emit_log(f"Admin {claims.get('username', claims['id'])} flagged review {review_id}", SERVICE_NAME, "review.flagged", f"admin:{claims['id']}")
         
         return jsonify(review_schema.dump(review)), 200
     
     db.session.delete(review)
+    adjust_rating(review.inventory_id, review.rating, -1, review.flag)
     db.session.commit()
     
-    requests.post(f"{LOG_PATH}/add-log", json={"message": f"Admin {response.json['username']} deleted review {review_id}"})
+    emit_log(f"Admin {claims.get('username', claims['id'])} deleted review {review_id}", SERVICE_NAME, "review.deleted", f"admin:{claims['id']}")
     
     return jsonify({"message": "Review deleted"}), 200
 
@@ -294,12 +647,11 @@ def get_review_details():
     if not token:
         abort(403, "Something went wrong")
     try:
-        admin_id = decode_token(token)
+        claims = decode_claims(token)
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         abort(403, "Something went wrong")
 
-    response = requests.get(f"{ADMIN_PATH}/admin:{admin_id}")
-    if response.status_code == 404:
+    if not has_role(claims, ROLE_ADMIN):
         return abort(403, "Unauthorized")
     
     if 'review_id' not in request.json:
@@ -314,4 +666,5 @@ def get_review_details():
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5300)
\ No newline at end of file
+    log_emitter.start()
+    app.run(debug=True, port=SERVICE_PORTS["review"])
\ No newline at end of file
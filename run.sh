@@ -1,10 +1,7 @@
 #!/bin/bash
 
-# Uncomment the following block for concurrent execution
-echo "Running Python files concurrently..."
-python3 run_customer.py &
-python3 run_inventory.py &
-python3 run_sale.py 
-wait  # Wait for all background processes to complete
-
-echo "All scripts executed."
+# Serve all seven services under gunicorn (see serve.py for options).
+# Worker and thread counts can also be set with SERVE_WORKERS and SERVE_THREADS.
+# Send SIGHUP to this script's process to reload workers gracefully.
+echo "Serving all services..."
+exec python3 serve.py all "$@"
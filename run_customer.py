@@ -1,7 +1,12 @@
-from customer_service.customer import app, db
-
-with app.app_context():
-    db.create_all()  # Ensures tables are created if not already
+from customer_service.customer import app
+from customer_service.migrations import MIGRATIONS
+from shared.db import db
+from shared.migrations import migrate
+from shared.token import SERVICE_PORTS
+from shared.emitter import log_emitter
 
 if __name__ == "__main__":
-    app.run(port=5000)
+    with app.app_context():
+        migrate(db.engine, MIGRATIONS)  # Brings the service's schema up to date
+    log_emitter.start()
+    app.run(port=SERVICE_PORTS["customer"])
@@ -1,7 +1,13 @@
-from inventory_service.inventory import app, db
-
-with app.app_context():
-    db.create_all()  # Ensures tables are created if not already
+from inventory_service.inventory import app, inventory_events
+from inventory_service.migrations import MIGRATIONS
+from shared.db import db
+from shared.migrations import migrate
+from shared.token import SERVICE_PORTS
+from shared.emitter import log_emitter
 
 if __name__ == "__main__":
-    app.run(port=5001)
+    with app.app_context():
+        migrate(db.engine, MIGRATIONS)  # Brings the service's schema up to date
+    log_emitter.start()
+    inventory_events.start()
+    app.run(port=SERVICE_PORTS["inventory"])
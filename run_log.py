@@ -1,7 +1,10 @@
-from log_service.log import app, db
-
-with app.app_context():
-    db.create_all()  # Ensures tables are created if not already
+from log_service.log import app
+from log_service.migrations import MIGRATIONS
+from shared.db import db
+from shared.migrations import migrate
+from shared.token import SERVICE_PORTS
 
 if __name__ == "__main__":
-    app.run(port=5006)
+    with app.app_context():
+        migrate(db.engine, MIGRATIONS)  # Brings the service's schema up to date
+    app.run(port=SERVICE_PORTS["log"])
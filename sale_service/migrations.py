@@ -0,0 +1,7 @@
+from shared.migrations import Migration
+from sale_service.models import MODELS
+
+MIGRATIONS = [
+    Migration(1, "create tables", lambda ops: ops.create_tables(MODELS)),
+    Migration(2, "index inventory_id and customer_id", lambda ops: ops.create_indexes(MODELS)),
+]
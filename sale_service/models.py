@@ -27,8 +27,8 @@ class Sale(db.Model):
     :vartype price: float
     """
     sale_id = db.Column(db.Integer, primary_key=True)
-    inventory_id = db.Column(db.Integer, nullable=False)
-    customer_id = db.Column(db.Integer, nullable=False)
+    inventory_id = db.Column(db.Integer, nullable=False, index=True)
+    customer_id = db.Column(db.Integer, nullable=False, index=True)
     date = db.Column(db.String(30), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
@@ -51,4 +51,6 @@ class SaleSchema(ma.Schema):
         fields = ('sale_id', 'inventory_id', 'customer_id', 'quantity', 'price', 'date')
 
 sale_schema = SaleSchema()
-sales_schema = SaleSchema(many=True)
\ No newline at end of file
+sales_schema = SaleSchema(many=True)
+
+MODELS = (Sale,)
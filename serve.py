@@ -0,0 +1,164 @@
+"""
+Serve the services under gunicorn, with several worker processes and threads each.
+
+Usage::
+
+    python serve.py all                    # every service, each in its own gunicorn master
+    python serve.py sale inventory -w 4    # selected services
+
+Each service listens on its port from ``shared.token.SERVICE_PORTS``. Send
+``SIGHUP`` to this process (or to a service's gunicorn master) to reload
+workers gracefully; ``SIGTERM``/``SIGINT`` drain in-flight requests before
+exiting. The ``run_*.py`` scripts remain available for the development server.
+"""
+import argparse
+import importlib
+import os
+import signal
+import subprocess
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+# The workers of a host share the revocations and cache invalidations pushed
+# to them through these files; otherwise a push is only known to the worker
+# that received it. Likewise, /metrics sums the series every worker writes
+# to the metrics directory.
+os.environ.setdefault("TOKEN_REVOCATION_FILE", os.path.join("instance", "revoked-tokens.txt"))
+os.environ.setdefault("CACHE_INVALIDATION_FILE", os.path.join("instance", "cache-invalidations.jsonl"))
+os.environ.setdefault("METRICS_DIR", os.path.join("instance", "metrics"))
+
+from shared.token import SERVICE_PORTS
+
+# Per service: ``serve all`` starts seven masters, so a per-CPU default would
+# multiply the process count by seven. Raise it for the services that need it.
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", 2))
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", 4))
+SERVE_HOST = os.environ.get("SERVE_HOST", "127.0.0.1")
+SERVE_TIMEOUT = int(os.environ.get("SERVE_TIMEOUT", 30))
+SERVE_GRACEFUL_TIMEOUT = int(os.environ.get("SERVE_GRACEFUL_TIMEOUT", 30))
+
+SERVICES = tuple(SERVICE_PORTS)
+
+
+class ServiceApplication(BaseApplication):
+    """
+    A gunicorn application serving one service.
+
+    The ``run_<service>`` module is imported once in the master, which
+    then brings the service's schema up to date and clears the metrics of
+    an earlier run, and workers are forked from it. Each worker then drops the database connections inherited
+    from the master and starts its own log sender thread.
+
+    :param service: The service to serve, a key of ``SERVICE_PORTS``
+    :type service: str
+    :param options: gunicorn settings
+    :type options: dict
+    """
+    def __init__(self, service, options):
+        self.service = service
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set("post_fork", self.post_fork)
+
+    def load(self):
+        from shared import metrics
+        from shared.db import db
+        from shared.migrations import migrate
+
+        module = importlib.import_module(f"run_{self.service}")
+        self.application = module.app
+        with self.application.app_context():
+            migrate(db.engine, module.MIGRATIONS)
+        metrics.clear_directory()
+        return self.application
+
+    def post_fork(self, server, worker):
+        from shared.db import db
+        from shared.emitter import emitters, log_emitter
+
+        with self.application.app_context():
+            db.engine.dispose(close=False)
+        for emitter in emitters:
+            # log_service writes its own entries directly.
+            if emitter is not log_emitter or self.service != "log":
+                emitter.start()
+
+
+def serve(service, workers=SERVE_WORKERS, threads=SERVE_THREADS, host=SERVE_HOST):
+    """
+    Serve one service in this process until it is stopped.
+
+    :param service: The service to serve, a key of ``SERVICE_PORTS``
+    :type service: str
+    :param workers: Number of worker processes
+    :type workers: int
+    :param threads: Number of request threads per worker
+    :type threads: int
+    :param host: Interface to bind
+    :type host: str
+    """
+    ServiceApplication(service, {
+        "bind": f"{host}:{SERVICE_PORTS[service]}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": SERVE_TIMEOUT,
+        "graceful_timeout": SERVE_GRACEFUL_TIMEOUT,
+        "proc_name": f"{service}_service",
+    }).run()
+
+
+def serve_all(services, workers, threads, host):
+    """
+    Serve several services, each in its own gunicorn master, and relay signals to them.
+
+    :param services: The services to serve
+    :type services: list
+    :param workers: Number of worker processes per service
+    :type workers: int
+    :param threads: Number of request threads per worker
+    :type threads: int
+    :param host: Interface to bind
+    :type host: str
+    """
+    masters = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), service,
+                          "--workers", str(workers), "--threads", str(threads), "--host", host])
+        for service in services
+    ]
+
+    def relay(signum, frame):
+        for master in masters:
+            if master.poll() is None:
+                master.send_signal(signum)
+
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, relay)
+
+    for master in masters:
+        master.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the services under gunicorn.")
+    parser.add_argument("services", nargs="+", choices=SERVICES + ("all",))
+    parser.add_argument("-w", "--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("-t", "--threads", type=int, default=SERVE_THREADS)
+    parser.add_argument("--host", default=SERVE_HOST)
+    args = parser.parse_args(argv)
+
+    services = list(SERVICES) if "all" in args.services else list(dict.fromkeys(args.services))
+    if len(services) == 1:
+        serve(services[0], args.workers, args.threads, args.host)
+    else:
+        serve_all(services, args.workers, args.threads, args.host)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, jsonify, abort, make_response, request
+
+from shared.token import extract_auth_token, decode_claims, has_role, jwt, ROLE_SERVICE
+
+CACHE_MAXSIZE = int(os.environ.get("CACHE_MAXSIZE", 4096))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 30.0))
+CACHE_INVALIDATION_FILE = os.environ.get("CACHE_INVALIDATION_FILE")
+CACHE_INVALIDATION_MAXSIZE = int(os.environ.get("CACHE_INVALIDATION_MAXSIZE", 1024 * 1024))
+
+caches = {}
+
+_journal_inode = None
+_journal_offset = None
+_journal_lock = threading.Lock()
+
+
+def sync_invalidations():
+    """
+    Apply the invalidations other processes appended to ``CACHE_INVALIDATION_FILE``.
+
+    Only one worker of a service receives each ``POST /cache/invalidate``;
+    it appends the invalidation to the file shared by every process on the
+    host, and the other workers replay it here before their next cache read.
+    A file rotated before this process caught up may have hidden some
+    entries, so every cache is cleared instead.
+    """
+    global _journal_inode, _journal_offset
+    if not CACHE_INVALIDATION_FILE:
+        return
+    try:
+        stat = os.stat(CACHE_INVALIDATION_FILE)
+    except OSError:
+        if _journal_offset is None:
+            _journal_offset = 0
+        return
+    if stat.st_ino == _journal_inode and stat.st_size == _journal_offset:
+        return
+
+    with _journal_lock:
+        if _journal_offset is None:
+            # Nothing is cached yet, so earlier invalidations do not matter.
+            _journal_inode, _journal_offset = stat.st_ino, stat.st_size
+            return
+        if _journal_inode is None:
+            _journal_inode = stat.st_ino
+        elif stat.st_ino != _journal_inode or stat.st_size < _journal_offset:
+            for cache in caches.values():
+                cache.clear()
+            _journal_inode, _journal_offset = stat.st_ino, 0
+
+        with open(CACHE_INVALIDATION_FILE, "rb") as f:
+            f.seek(_journal_offset)
+            data = f.read()
+        consumed = data.rfind(b"\n") + 1
+        for line in data[:consumed].splitlines():
+            try:
+                entry = json.loads(line)
+                cache = caches.get(entry["cache"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if cache is not None:
+                cache.evict(entry["key"])
+        _journal_offset += consumed
+
+
+def _journal_invalidation(name, key):
+    if not CACHE_INVALIDATION_FILE:
+        return
+    try:
+        if os.path.getsize(CACHE_INVALIDATION_FILE) > CACHE_INVALIDATION_MAXSIZE:
+            os.replace(CACHE_INVALIDATION_FILE, CACHE_INVALIDATION_FILE + ".1")
+    except OSError:
+        os.makedirs(os.path.dirname(CACHE_INVALIDATION_FILE) or ".", exist_ok=True)
+    with open(CACHE_INVALIDATION_FILE, "a") as f:
+        f.write(json.dumps({"cache": name, "key": key}) + "\n")
+
+
+class TTLCache:
+    """
+    A bounded, thread-safe LRU cache whose entries also expire after a fixed time.
+
+    Every cache registers itself by name so its counters are reported by
+    ``GET /cache/stats`` and its entries can be evicted through
+    ``POST /cache/invalidate``. When ``CACHE_INVALIDATION_FILE`` is set (as
+    ``serve.py`` does), invalidations reach every process on the host,
+    not only the worker that received them.
+
+    :param name: Name the cache is registered and invalidated under
+    :type name: str
+    :param maxsize: Maximum number of entries before the least recently used is evicted
+    :type maxsize: int
+    :param ttl: Seconds an entry stays valid
+    :type ttl: float
+    :ivar hits: Number of lookups answered from the cache
+    :vartype hits: int
+    :ivar misses: Number of lookups that were absent or expired
+    :vartype misses: int
+    :ivar evictions: Number of entries dropped for size
+    :vartype evictions: int
+    :ivar invalidations: Number of entries dropped by invalidation
+    :vartype invalidations: int
+    """
+    def __init__(self, name, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        caches[name] = self
+
+    def get(self, key, default=None):
+        sync_invalidations()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Evict an entry in this process and, through the invalidation file, in every other.
+        """
+        self.evict(key)
+        _journal_invalidation(self.name, key)
+
+    def evict(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Report the cache's counters.
+
+        :return: Size, capacity, hits, misses, hit ratio, evictions and invalidations
+        :rtype: dict
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+def versioned_response(cache, get_version):
+    """
+    Serve a read-only view with a strong ETag and a cache of rendered responses.
+
+    The ETag is the current data version. A request whose ``If-None-Match``
+    already holds it gets ``304 Not Modified`` without running the view;
+    otherwise successful responses are kept in ``cache`` under the version
+    and full request path, so repeated reads skip the query and the
+    serialization until the version changes.
+
+    :param cache: Cache holding rendered responses
+    :type cache: TTLCache
+    :param get_version: Function returning the current data version
+    :type get_version: callable
+    :return: Decorator for a Flask view
+    :rtype: callable
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = str(get_version())
+            if request.if_none_match.contains(version):
+                response = Response(status=304)
+                response.set_etag(version)
+                return response
+
+            key = (version, request.full_path)
+            rendered = cache.get(key)
+            if rendered is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                headers = [(name, value) for name, value in response.headers if name != 'Content-Length']
+                rendered = (response.get_data(), headers)
+                cache.set(key, rendered)
+
+            response = Response(rendered[0], status=200, headers=rendered[1])
+            response.set_etag(version)
+            return response
+        return wrapper
+    return decorator
+
+
+def register_cache_routes(app):
+    """
+    Add the cache stats and invalidation routes to a service.
+
+    :param app: The service's Flask application
+    :type app: flask.Flask
+    """
+    @app.route('/cache/stats', methods=['GET'])
+    def cache_stats():
+        """
+        Report hit/miss counters for every cache in this process.
+
+        :return: JSON object mapping cache names to their stats
+        :rtype: flask.Response
+        """
+        return jsonify({name: cache.stats() for name, cache in caches.items()}), 200
+
+    @app.route('/cache/invalidate', methods=['POST'])
+    def cache_invalidate():
+        """
+        Evict an entry pushed by the service that owns the record.
+
+        :param cache: The name of the cache
+        :type cache: str
+        :param key: The key to evict
+        :type key: int or str
+        :raises werkzeug.exceptions.HTTPException: 400 for bad request, 403 if not called by a service, 404 if the cache does not exist
+        :return: Success message
+        :rtype: flask.Response
+        """
+        token = extract_auth_token(request)
+        if not token:
+            abort(403, "Something went wrong")
+        try:
+            claims = decode_claims(token)
+        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+            abort(403, "Something went wrong")
+
+        if not has_role(claims, ROLE_SERVICE):
+            abort(403, "Unauthorized")
+
+        if 'cache' not in request.json or 'key' not in request.json:
+            abort(400, "Bad Request")
+
+        cache = caches.get(request.json['cache'])
+        if cache is None:
+            abort(404, "Cache Not Found")
+
+        cache.invalidate(request.json['key'])
+        return jsonify({"message": "Invalidated"}), 200
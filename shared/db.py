@@ -1,7 +1,91 @@
+import os
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+SQLITE_TUNING = os.environ.get("SQLITE_TUNING", "1") != "0"
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -64000))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
-ma = Marshmallow()
\ No newline at end of file
+ma = Marshmallow()
+
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tune every new SQLite connection for several concurrent service processes.
+
+    WAL lets readers proceed while one writer commits, ``synchronous=NORMAL``
+    skips the per-commit fsync WAL does not need, and ``busy_timeout`` makes
+    a blocked writer wait for the lock instead of failing with
+    ``database is locked``. Set ``SQLITE_TUNING=0`` to keep SQLite's defaults.
+    """
+    if not SQLITE_TUNING or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+    cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+def database_uri(service):
+    """
+    Return the database URI of a service.
+
+    Every service owns its database, read from ``<SERVICE>_DATABASE_URI``
+    (any SQLAlchemy URI) and defaulting to its own SQLite file in the
+    instance folder, so one service's write lock never stalls another.
+
+    :param service: The service name, e.g. ``sale``
+    :type service: str
+    :return: The SQLAlchemy database URI
+    :rtype: str
+    """
+    return os.environ.get(f"{service.upper()}_DATABASE_URI", f"sqlite:///{service}.db")
+
+
+def engine_options(uri):
+    """
+    Build ``SQLALCHEMY_ENGINE_OPTIONS`` for a database URI.
+
+    File databases get a connection pool sized by ``DB_POOL_SIZE`` and
+    ``DB_MAX_OVERFLOW`` and a driver-level lock timeout matching
+    ``SQLITE_BUSY_TIMEOUT``. In-memory SQLite keeps the single shared
+    connection Flask-SQLAlchemy gives it.
+
+    :param uri: The SQLAlchemy database URI
+    :type uri: str
+    :return: Engine options for Flask-SQLAlchemy
+    :rtype: dict
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return {}
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT / 1000, "check_same_thread": False},
+        }
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+    }
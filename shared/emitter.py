@@ -0,0 +1,249 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+from shared import http_client
+from shared.token import LOG_PATH
+
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 200))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 0.5))
+LOG_QUEUE_POLICY = os.environ.get("LOG_QUEUE_POLICY", "drop_oldest")
+LOG_SPILL_PATH = os.environ.get("LOG_SPILL_PATH", "log-spill.jsonl")
+
+POLICIES = ("drop_oldest", "drop_newest", "block")
+
+emitters = []
+
+
+class BatchEmitter:
+    """
+    Ships entries to another service in batches from a background thread.
+
+    Every emitter registers itself in ``emitters`` so a server can start
+    them all in each worker process.
+
+    Callers only pay for a queue put. When the queue is full, ``policy``
+    decides what gives: ``drop_oldest`` discards the oldest queued entry,
+    ``drop_newest`` discards the new one and ``block`` waits up to
+    ``block_timeout`` seconds for room before dropping it. Batches the
+    upstream cannot take are appended to ``spill_path`` and replayed once
+    it accepts a batch again.
+
+    :param url: Bulk endpoint receiving ``{"<key>": [entry, ...]}``
+    :type url: str
+    :param key: Name of the list in the request body
+    :type key: str
+    :param maxsize: Maximum number of queued entries
+    :type maxsize: int
+    :param batch_size: Maximum number of entries per request
+    :type batch_size: int
+    :param flush_interval: Seconds to wait for a batch to fill before sending it
+    :type flush_interval: float
+    :param policy: Backpressure policy, one of ``POLICIES``
+    :type policy: str
+    :param spill_path: File receiving undeliverable batches, or None to drop them
+    :type spill_path: str, optional
+    :param block_timeout: Seconds the ``block`` policy waits for room
+    :type block_timeout: float
+    :param headers: (Optional) Function returning headers for each request, e.g. a fresh service token
+    :type headers: callable, optional
+    """
+    def __init__(self, url, key, maxsize=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL,
+                 policy=LOG_QUEUE_POLICY, spill_path=LOG_SPILL_PATH, block_timeout=1.0, headers=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.url = url
+        self.key = key
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self.headers = headers
+        self.thread = None
+        self.flush_registered = False
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+        emitters.append(self)
+
+    def emit(self, entry):
+        """
+        Queue an entry for delivery, applying the backpressure policy if the queue is full.
+
+        :param entry: JSON-serializable entry
+        :type entry: dict
+        """
+        try:
+            if self.policy == "block":
+                self.queue.put(entry, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(entry)
+            return
+        except queue.Full:
+            pass
+
+        if self.policy == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                pass
+        with self.lock:
+            self.dropped += 1
+
+    def start(self):
+        """
+        Start the background sender. Safe to call more than once.
+
+        The exit flush is registered once; a forked worker inherits both
+        the registration and the flag from its master.
+        """
+        with self.lock:
+            if not self.flush_registered:
+                atexit.register(self.flush)
+                self.flush_registered = True
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name=f"emitter-{self.key}", daemon=True)
+            self.thread.start()
+
+    def flush(self):
+        """
+        Send everything still queued, spilling what the upstream refuses.
+        """
+        while True:
+            batch = self._drain([])
+            if not batch:
+                return
+            self._send(batch)
+
+    def stats(self):
+        """
+        Report delivery counters.
+
+        :return: Queued, sent, dropped and spilled entry counts
+        :rtype: dict
+        """
+        return {
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "spilled": self.spilled
+        }
+
+    def _drain(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._replay_spill()
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            batch = [first]
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if self._send(batch):
+                self._replay_spill()
+
+    def _post(self, batch):
+        try:
+            response = http_client.post(self.url, json={self.key: batch}, headers=self.headers() if self.headers else None)
+        except Exception as e:
+            print(e)
+            return False
+        if 400 <= response.status_code < 500:
+            # The upstream will never accept this batch; retrying it would only block the rest.
+            print(f"{self.url} rejected {len(batch)} entries with {response.status_code}")
+            with self.lock:
+                self.dropped += len(batch)
+            return True
+        return response.status_code < 400
+
+    def _send(self, batch):
+        if self._post(batch):
+            with self.lock:
+                self.sent += len(batch)
+            return True
+        self._spill(batch)
+        return False
+
+    def _spill(self, batch):
+        if not self.spill_path:
+            with self.lock:
+                self.dropped += len(batch)
+            return
+        with self.lock:
+            with open(self.spill_path, "a") as f:
+                for entry in batch:
+                    f.write(json.dumps(entry) + "\n")
+            self.spilled += len(batch)
+
+    def _replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        replay_path = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            # Renaming first lets concurrent spills start a fresh file instead of racing the replay.
+            os.replace(self.spill_path, replay_path)
+        except OSError:
+            return
+        with open(replay_path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for i in range(0, len(entries), self.batch_size):
+            batch = entries[i:i + self.batch_size]
+            if not self._post(batch):
+                self._spill(entries[i:])
+                break
+            with self.lock:
+                self.sent += len(batch)
+        os.remove(replay_path)
+
+
+log_emitter = BatchEmitter(f"{LOG_PATH}/add-logs", "logs")
+
+
+def emit_log(message, service=None, event_type=None, actor=None):
+    """
+    Record an audit log entry without waiting for log_service.
+
+    :param message: The log message
+    :type message: str
+    :param service: Name of the service recording the event
+    :type service: str, optional
+    :param event_type: Kind of event (e.g. ``sale.created``)
+    :type event_type: str, optional
+    :param actor: Who caused the event (e.g. ``customer:5``)
+    :type actor: str, optional
+    """
+    entry = {"message": message}
+    if service:
+        entry["service"] = service
+    if event_type:
+        entry["event_type"] = event_type
+    if actor:
+        entry["actor"] = actor
+    log_emitter.emit(entry)
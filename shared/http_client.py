@@ -0,0 +1,173 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from shared.metrics import observe_upstream, path_template
+from shared.token import CUSTOMER_PATH, INVENTORY_PATH, REVIEW_PATH, SALE_PATH, FAVORITE_PATH, ADMIN_PATH, LOG_PATH
+
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 2.0))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 5.0))
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 20))
+RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", 0.05))
+RETRY_BUDGET_RATIO = float(os.environ.get("HTTP_RETRY_BUDGET_RATIO", 0.2))
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+# Host of each service, naming the target of outbound calls in the metrics
+SERVICE_HOSTS = {
+    urlsplit(path).netloc: name
+    for name, path in (("customer", CUSTOMER_PATH), ("inventory", INVENTORY_PATH), ("review", REVIEW_PATH),
+                       ("sale", SALE_PATH), ("favorite", FAVORITE_PATH), ("admin", ADMIN_PATH), ("log", LOG_PATH))
+}
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of the requests sent to one upstream.
+
+    Every request deposits ``ratio`` tokens and every retry withdraws one, so
+    a failing upstream sees at most ``1 + ratio`` times its normal load
+    instead of ``1 + retries`` times.
+
+    :param ratio: Retries allowed per request sent
+    :type ratio: float
+    :param capacity: Maximum tokens banked, also the initial balance
+    :type capacity: int
+    """
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, capacity=10):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.balance = float(capacity)
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.balance = min(self.balance + self.ratio, self.capacity)
+
+    def withdraw(self):
+        with self.lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class Upstream:
+    """
+    A keep-alive connection pool and retry budget for one upstream service.
+
+    :param base_url: Scheme and host of the upstream (e.g. ``http://localhost:5000``)
+    :type base_url: str
+    """
+    def __init__(self, base_url):
+        self.base_url = base_url
+        netloc = urlsplit(base_url).netloc
+        self.name = SERVICE_HOSTS.get(netloc, netloc)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.budget = RetryBudget()
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(url):
+    """
+    Return the pooled upstream serving ``url``, creating it on first use.
+
+    :param url: Any URL on the upstream
+    :type url: str
+    :return: The upstream for the URL's scheme and host
+    :rtype: Upstream
+    """
+    parts = urlsplit(url)
+    base_url = f"{parts.scheme}://{parts.netloc}"
+    upstream = _upstreams.get(base_url)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.get(base_url)
+            if upstream is None:
+                upstream = _upstreams[base_url] = Upstream(base_url)
+    return upstream
+
+
+def request(method, url, timeout=None, retries=None, template=None, **kwargs):
+    """
+    Send a request to another service over its pooled connection.
+
+    Idempotent methods are retried on connection errors, timeouts and
+    502/503/504 responses while the upstream's retry budget allows it. The
+    whole call is timed in ``upstream_request_duration_seconds``.
+
+    :param method: HTTP method
+    :type method: str
+    :param url: Target URL
+    :type url: str
+    :param timeout: ``(connect, read)`` timeout in seconds, defaults to ``(CONNECT_TIMEOUT, READ_TIMEOUT)``
+    :type timeout: float or tuple, optional
+    :param retries: Maximum retries, defaults to ``RETRIES`` for idempotent methods and 0 otherwise
+    :type retries: int, optional
+    :param template: Route template of the called endpoint, e.g. ``/inventory:<int:inventory_id>``, labelling the call in the metrics; defaults to the URL's path with its parameters replaced
+    :type template: str, optional
+    :raises requests.RequestException: If the last attempt fails
+    :return: The upstream response
+    :rtype: requests.Response
+    """
+    method = method.upper()
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    if retries is None:
+        retries = RETRIES if method in IDEMPOTENT_METHODS else 0
+
+    upstream = get_upstream(url)
+    upstream.budget.deposit()
+
+    start = time.perf_counter()
+    status = "error"
+    try:
+        attempt = 0
+        while True:
+            try:
+                response = upstream.session.request(method, url, timeout=timeout, **kwargs)
+                status = response.status_code
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                status = "error"
+                if attempt >= retries or not upstream.budget.withdraw():
+                    raise
+            else:
+                if not upstream.budget.withdraw():
+                    return response
+                response.close()
+            attempt += 1
+            time.sleep(RETRY_BACKOFF * (2 ** (attempt - 1)) * (0.5 + random.random()))
+    finally:
+        observe_upstream(upstream.name, method, template or path_template(urlsplit(url).path), status,
+                         time.perf_counter() - start)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
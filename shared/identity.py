@@ -0,0 +1,156 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, jsonify, request
+
+from shared import http_client
+from shared.cache import TTLCache
+from shared.emitter import emit_log
+from shared.token import create_service_token, add_revocation, revoke_token, extract_auth_token, decode_claims, has_role, jwt, ROLE_SERVICE
+from shared.token import CUSTOMER_PATH, INVENTORY_PATH, REVIEW_PATH, SALE_PATH, FAVORITE_PATH, ADMIN_PATH, LOG_PATH
+
+CUSTOMER_SUBSCRIBERS = [SALE_PATH, REVIEW_PATH, FAVORITE_PATH]
+
+# Every service checks tokens, so every service is told of revocations
+SERVICE_PATHS = {
+    "customer_service": CUSTOMER_PATH, "inventory_service": INVENTORY_PATH, "review_service": REVIEW_PATH,
+    "sale_service": SALE_PATH, "favorite_service": FAVORITE_PATH, "admin_service": ADMIN_PATH, "log_service": LOG_PATH,
+}
+
+customer_cache = TTLCache("customer")
+
+_publisher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-invalidation")
+
+
+class IdentityLookupError(Exception):
+    """
+    Raised when the service owning an identity fails to answer a lookup.
+    """
+
+
+def get_customer(customer_id):
+    """
+    Look up a customer, answering from the local cache when possible.
+
+    :param customer_id: The ID of the customer
+    :type customer_id: int
+    :raises IdentityLookupError: If customer_service answers with an error other than 404
+    :return: The customer as returned by ``GET /customer:<id>``, or None if it does not exist
+    :rtype: dict or None
+    """
+    customer = customer_cache.get(customer_id)
+    if customer is not None:
+        return customer
+
+    response = http_client.get(f"{CUSTOMER_PATH}/customer:{customer_id}", template="/customer:<int:customer_id>")
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise IdentityLookupError(f"customer_service returned {response.status_code}")
+
+    customer = response.json()
+    customer_cache.set(customer_id, customer)
+    return customer
+
+
+def _push_invalidation(path, token, cache, key, source):
+    try:
+        response = http_client.post(f"{path}/cache/invalidate", json={"cache": cache, "key": key}, headers={"Authorization": f"Bearer {token}"})
+        error = None if response.status_code == 200 else f"status {response.status_code}"
+    except Exception as e:
+        error = e
+    if error is not None:
+        emit_log(f"Invalidation of {cache}:{key} not delivered to {path}: {error}", source, "cache.invalidation_failed", f"service:{source}")
+
+
+def invalidate_customer(customer_id, source):
+    """
+    Evict a customer locally and push the eviction to every service caching customers.
+
+    Pushes run in the background so the mutating request does not wait on them.
+    The subscriber worker receiving a push shares it with its other workers
+    through ``CACHE_INVALIDATION_FILE``; a subscriber that misses one, which
+    is logged, still drops the entry when its TTL expires.
+
+    :param customer_id: The ID of the customer that changed
+    :type customer_id: int
+    :param source: Name of the service publishing the change
+    :type source: str
+    """
+    customer_cache.invalidate(customer_id)
+    token = create_service_token(source)
+    for path in CUSTOMER_SUBSCRIBERS:
+        _publisher.submit(_push_invalidation, path, token, customer_cache.name, customer_id, source)
+
+
+def _push_revocation(path, token, jti, exp, source):
+    try:
+        response = http_client.post(f"{path}/tokens/revoke", json={"jti": jti, "exp": exp}, headers={"Authorization": f"Bearer {token}"})
+        error = None if response.status_code == 200 else f"status {response.status_code}"
+    except Exception as e:
+        error = e
+    if error is not None:
+        emit_log(f"Revocation of token {jti} not delivered to {path}: {error}", source, "token.revocation_failed", f"service:{source}")
+
+
+def publish_revocation(token, source):
+    """
+    Revoke a token locally and push the revocation to every other service.
+
+    Pushes run in the background, like cache invalidations. The worker
+    receiving a push shares it with the host's other workers through
+    ``TOKEN_REVOCATION_FILE``; a service that misses one, which is logged,
+    accepts the token until it expires.
+
+    :param token: The token to revoke
+    :type token: str
+    :param source: Name of the service revoking the token, e.g. ``customer_service``
+    :type source: str
+    """
+    revoked = revoke_token(token)
+    if revoked is None:
+        return
+    jti, exp = revoked
+    service_token = create_service_token(source)
+    for name, path in SERVICE_PATHS.items():
+        if name != source:
+            _publisher.submit(_push_revocation, path, service_token, jti, exp, source)
+
+
+def register_revocation_routes(app):
+    """
+    Add the route receiving token revocations to a service.
+
+    :param app: The service's Flask application
+    :type app: flask.Flask
+    """
+    @app.route('/tokens/revoke', methods=['POST'])
+    def tokens_revoke():
+        """
+        Refuse a token revoked by the service that issued it, until it expires.
+
+        :param jti: The ID of the revoked token
+        :type jti: str
+        :param exp: The token's expiry, as a Unix timestamp
+        :type exp: float
+        :raises werkzeug.exceptions.HTTPException: 400 for bad request, 403 if not called by a service
+        :return: Success message
+        :rtype: flask.Response
+        """
+        token = extract_auth_token(request)
+        if not token:
+            abort(403, "Something went wrong")
+        try:
+            claims = decode_claims(token)
+        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+            abort(403, "Something went wrong")
+
+        if not has_role(claims, ROLE_SERVICE):
+            abort(403, "Unauthorized")
+
+        jti = request.json.get('jti')
+        exp = request.json.get('exp')
+        if type(jti) != str or not jti or type(exp) not in (int, float):
+            abort(400, "Bad Request")
+
+        add_revocation(jti, float(exp))
+        return jsonify({"message": "Revoked"}), 200
@@ -0,0 +1,356 @@
+import atexit
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_SYNC_INTERVAL = float(os.environ.get("METRICS_SYNC_INTERVAL", 1.0))
+
+# Every metric of this process by name, rendered by /metrics
+metrics = {}
+
+# Where the processes serving this service share their metrics, set by register_metrics
+_directory = None
+_sync = {"pid": None, "file": None}
+_sync_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+class Histogram:
+    """
+    A Prometheus histogram with one series per combination of label values.
+
+    Observations are counted in the first bucket whose upper bound they do
+    not exceed; buckets are rendered cumulatively, as Prometheus expects.
+
+    :param name: Metric name, e.g. ``http_request_duration_seconds``
+    :type name: str
+    :param description: Help text shown by ``/metrics``
+    :type description: str
+    :param labels: Label names, in the order their values are passed to ``observe``
+    :type labels: tuple
+    :param buckets: (Optional) Sorted bucket upper bounds, defaults to ``LATENCY_BUCKETS``
+    :type buckets: tuple, optional
+    """
+    def __init__(self, name, description, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+        metrics[name] = self
+
+    def observe(self, value, *labels):
+        """
+        Record one observation.
+
+        :param value: The observed value, e.g. seconds
+        :type value: float
+        :param labels: The label values
+        """
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """
+        Copy the series recorded so far.
+
+        :return: ``(bucket counts, sum, count)`` by label values
+        :rtype: dict
+        """
+        with self.lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+
+    def render(self, snapshot=None):
+        """
+        Render the histogram in the Prometheus text format.
+
+        :param snapshot: (Optional) Series to render instead of this process's, as returned by ``snapshot``
+        :type snapshot: dict, optional
+        :rtype: list
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{{{_format_labels(self.labels, labels, le=bound)}}} {cumulative}")
+            lines.append(f"{self.name}_bucket{{{_format_labels(self.labels, labels, le='+Inf')}}} {count}")
+            lines.append(f"{self.name}_sum{{{_format_labels(self.labels, labels)}}} {total}")
+            lines.append(f"{self.name}_count{{{_format_labels(self.labels, labels)}}} {count}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time spent handling requests.", ("service", "method", "route", "status")
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_sql_queries", "SQL statements executed per request.", ("service", "method", "route"),
+    buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_SQL_DURATION = Histogram(
+    "http_request_sql_duration_seconds", "Time spent executing SQL per request.", ("service", "method", "route")
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Time spent in calls to other services, retries included.",
+    ("service", "route", "target", "method", "path", "status")
+)
+
+
+def _process_file():
+    return os.path.join(_directory, _sync["file"])
+
+
+def write_snapshot():
+    """
+    Write this process's series to its file in the shared metrics directory.
+    """
+    if _directory is None or _sync["pid"] != os.getpid():
+        return
+    data = {name: [[list(labels), *series] for labels, series in metric.snapshot().items()]
+            for name, metric in metrics.items()}
+    path = _process_file()
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _sync_loop():
+    while True:
+        time.sleep(METRICS_SYNC_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(e)
+
+
+def start_sync():
+    """
+    Start writing this process's series to the shared metrics directory, once per process.
+
+    The file is named after the process and a random token, so a worker
+    that reuses a dead worker's PID does not overwrite its totals.
+    """
+    if _directory is None or _sync["pid"] == os.getpid():
+        return
+    with _sync_lock:
+        if _sync["pid"] == os.getpid():
+            return
+        first = _sync["pid"] is None
+        _sync["file"] = f"{os.getpid()}-{uuid.uuid4().hex}.json"
+        _sync["pid"] = os.getpid()
+        threading.Thread(target=_sync_loop, daemon=True).start()
+        if first:
+            atexit.register(write_snapshot)
+
+
+def clear_directory():
+    """
+    Remove the files of an earlier run from the shared metrics directory.
+
+    Called by the gunicorn master before it forks the workers; files of
+    workers that die during the run are kept, so totals never go down.
+    """
+    if _directory is None:
+        return
+    for path in glob.glob(os.path.join(_directory, "*.json*")):
+        os.remove(path)
+
+
+def _merged():
+    """
+    Sum the series of this process and of every other process sharing the metrics directory.
+    """
+    merged = {name: metric.snapshot() for name, metric in metrics.items()}
+    if _directory is None:
+        return merged
+    own = _process_file() if _sync["pid"] == os.getpid() else None
+    for path in glob.glob(os.path.join(_directory, "*.json")):
+        if path == own:
+            continue
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, rows in data.items():
+            if name not in merged:
+                continue
+            for labels, counts, total, count in rows:
+                labels = tuple(labels)
+                current = merged[name].get(labels)
+                if current is None:
+                    merged[name][labels] = (counts, total, count)
+                else:
+                    merged[name][labels] = ([a + b for a, b in zip(current[0], counts)], current[1] + total, current[2] + count)
+    return merged
+
+
+def render():
+    """
+    Render every metric in the Prometheus text format.
+
+    With a shared metrics directory the series of every worker of the
+    service are summed, so each scrape sees the whole service whichever
+    worker answers it.
+
+    :rtype: str
+    """
+    merged = _merged()
+    lines = []
+    for name in sorted(metrics):
+        lines.extend(metrics[name].render(merged[name]))
+    return "\n".join(lines) + "\n"
+
+
+def path_template(path):
+    """
+    Replace the parameters of a path with placeholders, e.g. ``/inventory:Laptop`` with ``/inventory:<param>``.
+
+    Used for calls made without a route template: every ``:`` parameter and
+    every numeric segment is replaced, so the number of series stays bounded.
+
+    :param path: Path of the called URL
+    :type path: str
+    :rtype: str
+    """
+    return re.sub(r"/\d+(?=/|$)", "/<id>", re.sub(r":[^/]*", ":<param>", path))
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+def _caller():
+    """
+    Return the service and route on whose behalf the current code runs.
+    """
+    service = current_app.extensions.get("metrics", "") if has_app_context() else ""
+    route = _route() if has_request_context() else "<background>"
+    return service, route
+
+
+def observe_upstream(target, method, path, status, seconds):
+    """
+    Record a call to another service, labelled with the route that made it.
+
+    The called path is labelled with the route template of the called
+    endpoint, e.g. ``/inventory:<int:inventory_id>``, so every hop of
+    ``POST /sale`` shows up as its own series.
+
+    :param target: Name of the called service, e.g. ``inventory``
+    :type target: str
+    :param method: HTTP method
+    :type method: str
+    :param path: Route template of the called endpoint
+    :type path: str
+    :param status: Response status code, or ``error`` if no response arrived
+    :type status: int or str
+    :param seconds: Duration of the call
+    :type seconds: float
+    """
+    service, route = _caller()
+    UPSTREAM_DURATION.observe(seconds, service, route, target, method, path, str(status))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+    if has_request_context() and "metrics_queries" in g:
+        g.metrics_queries += 1
+        g.metrics_sql_seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute.
+    if context.connection is not None and context.connection.info.get("metrics_query_start"):
+        context.connection.info["metrics_query_start"].pop()
+
+
+def register_metrics(app, service):
+    """
+    Time every request of a service and add the ``/metrics`` route.
+
+    Metrics live in the memory of each process. When ``METRICS_DIR`` is set,
+    as ``serve.py`` does, every worker also writes its series to a
+    directory of the service there, and ``/metrics`` sums them all.
+
+    :param app: The service's Flask application
+    :type app: flask.Flask
+    :param service: The service name used as the ``service`` label, e.g. ``sale_service``
+    :type service: str
+    """
+    global _directory
+    app.extensions["metrics"] = service
+    if METRICS_DIR:
+        _directory = os.path.join(METRICS_DIR, service)
+        os.makedirs(_directory, exist_ok=True)
+
+    @app.before_request
+    def start_timer():
+        start_sync()
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_sql_seconds = 0.0
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exception=None):
+        if "metrics_start" not in g:
+            return
+        route = _route()
+        REQUEST_DURATION.observe(time.perf_counter() - g.metrics_start, service, request.method, route,
+                                 str(g.get("metrics_status", 500)))
+        REQUEST_QUERIES.observe(g.metrics_queries, service, request.method, route)
+        REQUEST_SQL_DURATION.observe(g.metrics_sql_seconds, service, request.method, route)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """
+        Report request, SQL and upstream timings of the service in the Prometheus text format.
+
+        :return: The metrics as ``text/plain``
+        :rtype: flask.Response
+        """
+        return Response(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,316 @@
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 1000))
+MIGRATION_PROGRESS_INTERVAL = float(os.environ.get("MIGRATION_PROGRESS_INTERVAL", 1.0))
+
+VERSION_TABLE = "schema_migrations"
+
+
+class Migration:
+    """
+    One versioned step of a service's schema.
+
+    Each service lists its steps as ``MIGRATIONS`` in its ``migrations.py``,
+    over the tables named by ``MODELS`` in its ``models.py``. Applied
+    versions are recorded in ``schema_migrations``, so a released step is
+    never edited: changes go in a new version.
+
+    :param version: Position of the step; steps run in increasing order and each runs once
+    :type version: int
+    :param name: Short description recorded with the version
+    :type name: str
+    :param upgrade: Function applying the step, called with an ``Operations``
+    :type upgrade: callable
+    """
+    def __init__(self, version, name, upgrade):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+
+
+class Operations:
+    """
+    Schema operations available to migrations.
+
+    Every operation is idempotent, so a migration interrupted half way can
+    simply be run again, and works in small transactions so the service can
+    keep serving while large tables are changed: backfills update
+    ``batch_size`` rows per transaction, and table rebuilds copy rows in
+    chunks while triggers mirror concurrent writes into the new table.
+
+    :param engine: Engine of the database being migrated
+    :type engine: sqlalchemy.engine.Engine
+    :param batch_size: Rows per transaction for backfills and copies
+    :type batch_size: int
+    :param progress: Function receiving progress messages
+    :type progress: callable
+    """
+    def __init__(self, engine, batch_size=MIGRATION_BATCH_SIZE, progress=print):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.progress = progress
+
+    def has_table(self, table):
+        return inspect(self.engine).has_table(table)
+
+    def has_column(self, table, column):
+        return column in {c['name'] for c in inspect(self.engine).get_columns(table)}
+
+    def create_tables(self, models):
+        """
+        Create the tables of the given models that do not exist yet, with their indexes.
+
+        :param models: The models owned by the service
+        :type models: iterable
+        """
+        tables = [model.__table__ for model in models]
+        tables[0].metadata.create_all(self.engine, tables=tables)
+
+    def create_indexes(self, models):
+        """
+        Create the declared indexes of the given models that the database lacks.
+
+        :param models: The models owned by the service
+        :type models: iterable
+        """
+        inspector = inspect(self.engine)
+        for model in models:
+            existing = {index['name'] for index in inspector.get_indexes(model.__tablename__)}
+            for index in model.__table__.indexes:
+                if index.name not in existing:
+                    self.progress(f"creating index {index.name}")
+                    index.create(self.engine)
+
+    def create_search_index(self, index):
+        """
+        Create a full-text search index and fill it from its table.
+
+        :param index: The index, declared next to its model
+        :type index: shared.search.SearchIndex
+        """
+        self.progress(f"building search index {index.name}")
+        with self.engine.begin() as connection:
+            if not index.create(connection):
+                self.progress(f"full-text search is not available, {index.name} skipped")
+
+    def add_column(self, model, column):
+        """
+        Add a model's column to its existing table.
+
+        The column is added as nullable, which SQLite can do without
+        rewriting the table; fill it with ``backfill``.
+
+        :param model: The model declaring the column
+        :type model: flask_sqlalchemy.model.Model
+        :param column: The column name
+        :type column: str
+        """
+        table = model.__tablename__
+        if self.has_column(table, column):
+            return
+        column_type = model.__table__.c[column].type.compile(dialect=self.engine.dialect)
+        with self.engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+
+    def backfill(self, model, assignments, where):
+        """
+        Update the rows matching ``where`` in batches of ``batch_size``, one transaction each.
+
+        ``where`` must stop matching a row once it has been updated (e.g.
+        ``partition IS NULL``), which is how the loop advances.
+
+        :param model: The model whose table is updated
+        :type model: flask_sqlalchemy.model.Model
+        :param assignments: SQL ``SET`` clause, e.g. ``partition = substr(timestamp, 1, 10)``
+        :type assignments: str
+        :param where: SQL condition selecting the rows still to update
+        :type where: str
+        :return: The number of rows updated
+        :rtype: int
+        """
+        table = model.__tablename__
+        key = model.__table__.primary_key.columns.values()[0].name
+        with self.engine.connect() as connection:
+            total = connection.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {where}")).scalar()
+        done = 0
+        reporter = self._reporter(f"backfilling {table}", total)
+        while True:
+            with self.engine.begin() as connection:
+                updated = connection.execute(text(
+                    f"UPDATE {table} SET {assignments} WHERE {key} IN "
+                    f"(SELECT {key} FROM {table} WHERE {where} LIMIT :batch)"
+                ), {"batch": self.batch_size}).rowcount
+            if not updated:
+                break
+            done += updated
+            reporter(done)
+        reporter(done, final=True)
+        return done
+
+    def deduplicate(self, model, columns):
+        """
+        Delete rows repeating another row's values in ``columns``, keeping the oldest.
+
+        Run before adding a unique index over ``columns`` to an existing table.
+
+        :param model: The model whose table is cleaned up
+        :type model: flask_sqlalchemy.model.Model
+        :param columns: Names of the columns that must be unique together
+        :type columns: iterable
+        :return: The number of rows deleted
+        :rtype: int
+        """
+        table = model.__tablename__
+        key = model.__table__.primary_key.columns.values()[0].name
+        columns = ", ".join(columns)
+        with self.engine.begin() as connection:
+            deleted = connection.execute(text(
+                f"DELETE FROM {table} WHERE {key} NOT IN (SELECT MIN({key}) FROM {table} GROUP BY {columns})"
+            )).rowcount
+        if deleted:
+            self.progress(f"removed {deleted} duplicate rows from {table}")
+        return deleted
+
+    def rebuild_table(self, model, expressions=None):
+        """
+        Rebuild a table to match its model, for changes SQLite cannot make in place.
+
+        A new table is created from the model, triggers on the old table
+        mirror every insert, update and delete into it, and the existing
+        rows are copied over in chunks of ``batch_size``. Only the final
+        swap, dropping the old table and renaming the new one, holds the
+        write lock for more than a chunk.
+
+        :param model: The model describing the new table
+        :type model: flask_sqlalchemy.model.Model
+        :param expressions: SQL expressions, over the old table's columns, for new columns
+            (columns missing from both the old table and ``expressions`` are left NULL)
+        :type expressions: dict, optional
+        """
+        table = model.__table__
+        name = table.name
+        temp = f"_{name}_rebuild"
+        key = table.primary_key.columns.values()[0].name
+        old_columns = {c['name'] for c in inspect(self.engine).get_columns(name)}
+        expressions = expressions or {}
+        columns = [c.name for c in table.columns]
+        values = [expressions.get(c, c if c in old_columns else "NULL") for c in columns]
+        column_list = ", ".join(columns)
+        select_list = ", ".join(values)
+
+        with self.engine.begin() as connection:
+            self._drop_rebuild_triggers(connection, name)
+            connection.execute(text(f"DROP TABLE IF EXISTS {temp}"))
+            # Indexes are created after the swap: their names are global in SQLite.
+            connection.execute(CreateTable(table.to_metadata(MetaData(), name=temp)))
+            connection.execute(text(
+                f"CREATE TRIGGER {name}_rebuild_insert AFTER INSERT ON {name} BEGIN "
+                f"INSERT OR REPLACE INTO {temp} ({column_list}) SELECT {select_list} FROM {name} WHERE {key} = NEW.{key}; END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER {name}_rebuild_update AFTER UPDATE ON {name} BEGIN "
+                f"DELETE FROM {temp} WHERE {key} = OLD.{key}; "
+                f"INSERT OR REPLACE INTO {temp} ({column_list}) SELECT {select_list} FROM {name} WHERE {key} = NEW.{key}; END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER {name}_rebuild_delete AFTER DELETE ON {name} BEGIN "
+                f"DELETE FROM {temp} WHERE {key} = OLD.{key}; END"
+            ))
+            total = connection.execute(text(f"SELECT COUNT(*) FROM {name}")).scalar()
+
+        reporter = self._reporter(f"copying {name}", total)
+        last = None
+        done = 0
+        while True:
+            with self.engine.begin() as connection:
+                after = "" if last is None else f"WHERE {key} > :last"
+                keys = connection.execute(text(
+                    f"SELECT {key} FROM {name} {after} ORDER BY {key} LIMIT :batch"
+                ), {"last": last, "batch": self.batch_size}).scalars().all()
+                if not keys:
+                    break
+                # OR IGNORE keeps rows a trigger already wrote, which are at least as recent.
+                connection.execute(text(
+                    f"INSERT OR IGNORE INTO {temp} ({column_list}) SELECT {select_list} FROM {name} "
+                    f"WHERE {key} >= :first AND {key} <= :last"
+                ), {"first": keys[0], "last": keys[-1]})
+            last = keys[-1]
+            done += len(keys)
+            reporter(done)
+        reporter(done, final=True)
+
+        with self.engine.begin() as connection:
+            self._drop_rebuild_triggers(connection, name)
+            connection.execute(text(f"DROP TABLE {name}"))
+            connection.execute(text(f"ALTER TABLE {temp} RENAME TO {name}"))
+            for index in table.indexes:
+                index.create(connection)
+
+    def _drop_rebuild_triggers(self, connection, name):
+        for event in ("insert", "update", "delete"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}_rebuild_{event}"))
+
+    def _reporter(self, label, total):
+        last_report = [0.0]
+
+        def report(done, final=False):
+            now = time.monotonic()
+            if final or now - last_report[0] >= MIGRATION_PROGRESS_INTERVAL:
+                last_report[0] = now
+                self.progress(f"{label}: {done}/{total} rows")
+        return report
+
+
+def applied_versions(engine):
+    """
+    List the migration versions already applied to a database.
+
+    :param engine: Engine of the database
+    :type engine: sqlalchemy.engine.Engine
+    :return: The applied versions
+    :rtype: set
+    """
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} "
+            "(version INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL, applied_at VARCHAR(30) NOT NULL)"
+        ))
+        return set(connection.execute(text(f"SELECT version FROM {VERSION_TABLE}")).scalars())
+
+
+def migrate(engine, migrations, target=None, batch_size=MIGRATION_BATCH_SIZE, progress=print):
+    """
+    Apply the pending migrations of a service, in version order.
+
+    :param engine: Engine of the service's database
+    :type engine: sqlalchemy.engine.Engine
+    :param migrations: The service's migrations
+    :type migrations: list
+    :param target: (Optional) Highest version to apply
+    :type target: int, optional
+    :param batch_size: Rows per transaction for backfills and copies
+    :type batch_size: int
+    :param progress: Function receiving progress messages
+    :type progress: callable
+    :return: The versions applied
+    :rtype: list
+    """
+    applied = applied_versions(engine)
+    operations = Operations(engine, batch_size, progress)
+    done = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in applied or (target is not None and migration.version > target):
+            continue
+        progress(f"applying migration {migration.version}: {migration.name}")
+        migration.upgrade(operations)
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)"
+            ), {"version": migration.version, "name": migration.name, "applied_at": datetime.now().isoformat()})
+        done.append(migration.version)
+    return done
@@ -0,0 +1,156 @@
+import base64
+import json
+
+from flask import abort
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def get_int_arg(args, name, default=None, minimum=None):
+    """
+    Read an optional integer query parameter.
+
+    :param args: The request's query parameters
+    :type args: werkzeug.datastructures.MultiDict
+    :param name: The parameter name
+    :type name: str
+    :param default: Value used when the parameter is absent
+    :type default: int, optional
+    :param minimum: Smallest accepted value
+    :type minimum: int, optional
+    :raises werkzeug.exceptions.HTTPException: 400 if the value is not an integer or is below ``minimum``
+    :return: The parameter value
+    :rtype: int or None
+    """
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, "Bad Request")
+    if minimum is not None and value < minimum:
+        abort(400, "Bad Request")
+    return value
+
+
+def get_bool_arg(args, name, default=False):
+    """
+    Read an optional boolean query parameter (``1``/``true``/``yes`` or ``0``/``false``/``no``).
+
+    :param args: The request's query parameters
+    :type args: werkzeug.datastructures.MultiDict
+    :param name: The parameter name
+    :type name: str
+    :param default: Value used when the parameter is absent
+    :type default: bool
+    :raises werkzeug.exceptions.HTTPException: 400 if the value is not a boolean
+    :return: The parameter value
+    :rtype: bool
+    """
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    value = value.lower()
+    if value in ("1", "true", "yes"):
+        return True
+    if value in ("0", "false", "no"):
+        return False
+    abort(400, "Bad Request")
+
+
+def get_list_arg(args, name, item_type=str, maximum=MAX_LIMIT):
+    """
+    Read an optional comma-separated list query parameter (e.g. ``ids=1,2,3``).
+
+    :param args: The request's query parameters
+    :type args: werkzeug.datastructures.MultiDict
+    :param name: The parameter name
+    :type name: str
+    :param item_type: Type each element is converted to
+    :type item_type: type
+    :param maximum: Largest accepted number of elements
+    :type maximum: int
+    :raises werkzeug.exceptions.HTTPException: 400 if an element cannot be converted or the list is too long
+    :return: The distinct elements in request order, or None if the parameter is absent
+    :rtype: list or None
+    """
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        values = list(dict.fromkeys(item_type(element.strip()) for element in value.split(',') if element.strip()))
+    except ValueError:
+        abort(400, "Bad Request")
+    if len(values) > maximum:
+        abort(400, "Bad Request")
+    return values
+
+
+def get_limit(args, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """
+    Read the ``limit`` query parameter, clamped to ``maximum``.
+
+    :param args: The request's query parameters
+    :type args: werkzeug.datastructures.MultiDict
+    :raises werkzeug.exceptions.HTTPException: 400 if the limit is not a positive integer
+    :return: The page size
+    :rtype: int
+    """
+    return min(get_int_arg(args, 'limit', default, minimum=1), maximum)
+
+
+def set_next_cursor(response, rows, limit, cursor):
+    """
+    Tell the client where the next page starts, if there is one.
+
+    The header is only set when the page is full; its value is passed back
+    as the endpoint's cursor parameter to fetch the next page.
+
+    :param response: The response carrying the page
+    :type response: flask.Response
+    :param rows: The rows in the page
+    :type rows: list
+    :param limit: The page size that was requested
+    :type limit: int
+    :param cursor: Function computing the cursor value from the last row
+    :type cursor: callable
+    :return: The response
+    :rtype: flask.Response
+    """
+    if rows and len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(cursor(rows[-1]))
+    return response
+
+
+def encode_cursor(*values):
+    """
+    Pack the sort key of a page's last row into an opaque cursor.
+
+    :return: URL-safe cursor string
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    """
+    Unpack a cursor made by ``encode_cursor``.
+
+    :param cursor: The cursor sent back by the client
+    :type cursor: str
+    :param size: Number of values the cursor must hold
+    :type size: int
+    :raises werkzeug.exceptions.HTTPException: 400 if the cursor is malformed
+    :return: The packed values
+    :rtype: list
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        abort(400, "Bad Request")
+    if not isinstance(values, list) or len(values) != size:
+        abort(400, "Bad Request")
+    return values
@@ -0,0 +1,126 @@
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from flask import abort
+
+PASSWORD_HASH_ROUNDS = int(os.environ.get("PASSWORD_HASH_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+AUTH_CONCURRENCY = int(os.environ.get("AUTH_CONCURRENCY", 2))
+AUTH_QUEUE_TIMEOUT = float(os.environ.get("AUTH_QUEUE_TIMEOUT", 0.5))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def _run(function, *args):
+    """
+    Run a bcrypt call in the hashing pool, or inline when ``PASSWORD_HASH_WORKERS`` is 0.
+
+    The pool is created on the first hash in each process, so only the
+    workers of services that hash passwords (customer and admin) start one,
+    each after the fork. Every worker has its own pool, so keep
+    ``PASSWORD_HASH_WORKERS`` small. Its processes are spawned rather than
+    forked from the multi-threaded worker.
+    """
+    global _pool, _pool_pid
+    if PASSWORD_HASH_WORKERS <= 0:
+        return function(*args)
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        pool = _pool
+    return pool.submit(function, *args).result()
+
+
+def hash_password(password, rounds=None):
+    """
+    Hash a password with bcrypt in the hashing pool.
+
+    The request thread only waits for the result, so the CPU-heavy hashing
+    never holds the worker's interpreter while other requests are served.
+
+    :param password: The plain-text password
+    :type password: str
+    :param rounds: (Optional) bcrypt cost factor, defaults to ``PASSWORD_HASH_ROUNDS``
+    :type rounds: int, optional
+    :return: The bcrypt hash
+    :rtype: str
+    """
+    return _run(_hash, password, rounds or PASSWORD_HASH_ROUNDS)
+
+
+def verify_password(hashed, password):
+    """
+    Check a password against its bcrypt hash in the hashing pool.
+
+    :param hashed: The stored hash
+    :type hashed: str
+    :param password: The plain-text password
+    :type password: str
+    :return: Whether the password matches
+    :rtype: bool
+    """
+    return _run(_check, hashed, password)
+
+
+def needs_rehash(hashed, rounds=None):
+    """
+    Check whether a hash was made with another cost factor than the configured one.
+
+    Verified passwords whose hash needs rehashing are hashed again on login,
+    so changing ``PASSWORD_HASH_ROUNDS`` migrates accounts as they sign in.
+
+    :param hashed: The stored hash, e.g. ``$2b$12$...``
+    :type hashed: str
+    :param rounds: (Optional) Expected cost factor, defaults to ``PASSWORD_HASH_ROUNDS``
+    :type rounds: int, optional
+    :rtype: bool
+    """
+    try:
+        return int(hashed.split('$')[2]) != (rounds or PASSWORD_HASH_ROUNDS)
+    except (IndexError, ValueError):
+        return True
+
+
+def concurrency_limit(limit=None, timeout=None):
+    """
+    Decorator capping how many requests of an endpoint a process serves at once.
+
+    Requests beyond the limit wait up to ``timeout`` seconds for a slot and
+    are then turned away with 503 and ``Retry-After``, so a burst of logins
+    cannot occupy every worker thread while cheap requests queue behind it.
+
+    :param limit: (Optional) Concurrent requests allowed, defaults to ``AUTH_CONCURRENCY``
+    :type limit: int, optional
+    :param timeout: (Optional) Seconds to wait for a slot, defaults to ``AUTH_QUEUE_TIMEOUT``
+    :type timeout: float, optional
+    """
+    def decorator(view):
+        slots = threading.BoundedSemaphore(limit or AUTH_CONCURRENCY)
+        wait = AUTH_QUEUE_TIMEOUT if timeout is None else timeout
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not slots.acquire(timeout=wait):
+                abort(503, "Server Busy", retry_after=1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                slots.release()
+        wrapper.slots = slots
+        return wrapper
+    return decorator
@@ -0,0 +1,150 @@
+import re
+
+from sqlalchemy import column, event, literal_column, table, text, tuple_
+from sqlalchemy.exc import OperationalError
+
+
+def match_terms(query):
+    """
+    Split a search query into words.
+
+    :param query: The text typed by the user
+    :type query: str
+    :return: The words of the query
+    :rtype: list
+    """
+    return re.findall(r"\w+", query or "")
+
+
+class SearchUnavailable(Exception):
+    """
+    Raised when a search runs against a database that lacks the full-text index.
+    """
+
+
+class SearchIndex:
+    """
+    Full-text index over some text columns of a model, backed by SQLite FTS5.
+
+    The index is an external-content FTS5 table named ``<table>_fts`` that
+    stores only the index, not a copy of the text. Triggers on the model's
+    table keep it up to date in the same transaction as every insert,
+    update and delete, so the services need no extra code on write. The
+    index is created with the model's table (``create_all``) and can be
+    added to an existing database with ``Operations.create_search_index``.
+
+    Searches rank matches with BM25 and treat every word as a prefix. When
+    the database lacks the index (not SQLite, SQLite built without FTS5, or
+    a database not yet migrated), searches raise ``SearchUnavailable``
+    rather than scan the table.
+
+    :param model: The model whose rows are indexed
+    :type model: flask_sqlalchemy.model.Model
+    :param columns: Names of the indexed text columns
+    :type columns: tuple
+    :param weights: (Optional) BM25 weight of each column, e.g. to rank name matches above description matches
+    :type weights: tuple, optional
+    """
+    def __init__(self, model, columns, weights=None):
+        self.model = model
+        self.columns = tuple(columns)
+        self.weights = weights
+        self.table = model.__tablename__
+        self.name = f"{self.table}_fts"
+        self.key = model.__table__.primary_key.columns.values()[0]
+        event.listen(model.__table__, "after_create", lambda target, connection, **kw: self.create(connection))
+        event.listen(model.__table__, "before_drop", lambda target, connection, **kw: self.drop(connection))
+
+    def create(self, connection):
+        """
+        Create the index and its triggers if missing, and (re)build it from the table.
+
+        :param connection: Connection of the database holding the model's table
+        :type connection: sqlalchemy.engine.Connection
+        :return: Whether the database supports the index
+        :rtype: bool
+        """
+        if connection.dialect.name != "sqlite":
+            return False
+        key = self.key.name
+        columns = ", ".join(self.columns)
+        new = ", ".join(f"new.{name}" for name in self.columns)
+        old = ", ".join(f"old.{name}" for name in self.columns)
+        try:
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} USING fts5({columns}, "
+                f"content='{self.table}', content_rowid='{key}', tokenize='unicode61 remove_diacritics 2')"
+            ))
+        except OperationalError as e:
+            print(e)
+            return False
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_insert AFTER INSERT ON {self.table} BEGIN "
+            f"INSERT INTO {self.name} (rowid, {columns}) VALUES (new.{key}, {new}); END"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_delete AFTER DELETE ON {self.table} BEGIN "
+            f"INSERT INTO {self.name} ({self.name}, rowid, {columns}) VALUES ('delete', old.{key}, {old}); END"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_update AFTER UPDATE OF {columns} ON {self.table} BEGIN "
+            f"INSERT INTO {self.name} ({self.name}, rowid, {columns}) VALUES ('delete', old.{key}, {old}); "
+            f"INSERT INTO {self.name} (rowid, {columns}) VALUES (new.{key}, {new}); END"
+        ))
+        if self.weights:
+            weights = ", ".join(str(float(weight)) for weight in self.weights)
+            connection.execute(text(f"INSERT INTO {self.name} ({self.name}, rank) VALUES ('rank', 'bm25({weights})')"))
+        connection.execute(text(f"INSERT INTO {self.name} ({self.name}) VALUES ('rebuild')"))
+        return True
+
+    def drop(self, connection):
+        """
+        Drop the index; the triggers go with the model's table.
+
+        :param connection: Connection of the database holding the model's table
+        :type connection: sqlalchemy.engine.Connection
+        """
+        if connection.dialect.name == "sqlite":
+            connection.execute(text(f"DROP TABLE IF EXISTS {self.name}"))
+
+    def enabled(self, session):
+        """
+        Check whether the index exists in the session's database.
+
+        :param session: The database session
+        :type session: sqlalchemy.orm.Session
+        :rtype: bool
+        """
+        if session.get_bind().dialect.name != "sqlite":
+            return False
+        return session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": self.name}
+        ).first() is not None
+
+    def search(self, query, terms, limit, after=None):
+        """
+        Return one page of the rows of ``query`` matching every term, best match first.
+
+        :param query: Query over the model, possibly already filtered
+        :type query: flask_sqlalchemy.query.Query
+        :param terms: The words to match, as returned by ``match_terms``
+        :type terms: list
+        :param limit: Page size
+        :type limit: int
+        :param after: (Optional) Rank and ID of the previous page's last row
+        :type after: list, optional
+        :raises SearchUnavailable: If the database lacks the index
+        :return: ``(row, rank)`` pairs; a lower rank is a better match
+        :rtype: list
+        """
+        if not self.enabled(query.session):
+            raise SearchUnavailable(f"Full-text index {self.name} is missing")
+        fts = table(self.name, column("rowid"), column("rank"))
+        rank = fts.c.rank
+        # Quoting keeps FTS5 syntax in user input literal; * makes each word a prefix.
+        match = " ".join('"{}"*'.format(term) for term in terms)
+        query = (query.join(fts, fts.c.rowid == self.key)
+                 .filter(literal_column(self.name).op("MATCH")(match)))
+        if after is not None:
+            query = query.filter(tuple_(rank, self.key) > tuple_(*after))
+        return query.add_columns(rank).order_by(rank, self.key).limit(limit).all()
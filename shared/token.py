@@ -1,12 +1,50 @@
+import fcntl
 import jwt
+import os
+import threading
+import time
+import uuid
 
-from datetime import datetime
-from .secret_key import SECRET_KEY
+from datetime import datetime, timedelta
+
+# Key signing every token; services trust the claims of any token it signed.
+SECRET_KEY = os.environ.get("SECRET_KEY")
+if not SECRET_KEY:
+    raise RuntimeError("SECRET_KEY must be set to the key signing the services' tokens")
+
+# Port each service listens on (see ports.txt); override with <NAME>_PORT.
+SERVICE_PORTS = {
+    name: int(os.environ.get(f"{name.upper()}_PORT", port))
+    for name, port in (("customer", 5000), ("inventory", 5001), ("review", 5002), ("sale", 5003),
+                       ("favorite", 5004), ("admin", 5005), ("log", 5006))
+}
+
+
+def _service_path(name):
+    # <NAME>_PATH points at another host, e.g. a container name under docker-compose.
+    return os.environ.get(f"{name.upper()}_PATH", f"http://localhost:{SERVICE_PORTS[name]}")
+
+
+CUSTOMER_PATH = _service_path("customer")
+INVENTORY_PATH = _service_path("inventory")
+REVIEW_PATH = _service_path("review")
+SALE_PATH = _service_path("sale")
+FAVORITE_PATH = _service_path("favorite")
+ADMIN_PATH = _service_path("admin")
+LOG_PATH = _service_path("log")
+
+ROLE_CUSTOMER = "customer"
+ROLE_ADMIN = "admin"
+ROLE_SERVICE = "service"
+
+TOKEN_TTL = int(os.environ.get("TOKEN_TTL", 24 * 60 * 60))
+REVOCATION_FILE = os.environ.get("TOKEN_REVOCATION_FILE")
+
+# Revoked token ids, each with the expiry after which it no longer needs refusing
+_revoked = {}
+_revoked_mtime = None
+_revoked_lock = threading.Lock()
 
-CUSTOMER_PATH = "http://localhost:5000"
-INVENTORY_PATH = "http://localhost:5001"
-ADMIN_PATH = "http://localhost:5005"
-LOG_PATH = "http://localhost:5006"
 
 def extract_auth_token(authenticated_request):
     '''
@@ -19,30 +57,179 @@ def extract_auth_token(authenticated_request):
         return None
 
 
+def _read_revocations(f):
+    '''
+    Read the unexpired revocations of a revocation file, one ``jti exp`` per line.
+    '''
+    now = time.time()
+    entries = {}
+    for line in f:
+        jti, _, exp = line.strip().partition(" ")
+        try:
+            if jti and float(exp) > now:
+                entries[jti] = float(exp)
+        except ValueError:
+            continue
+    return entries
+
+
+def _prune_revocations():
+    now = time.time()
+    for jti in [jti for jti, exp in _revoked.items() if exp <= now]:
+        del _revoked[jti]
+
+
+def _load_revocations():
+    '''
+    Reload the revocation file if it changed since the last read.
+    '''
+    global _revoked_mtime
+    if not REVOCATION_FILE:
+        return
+    try:
+        mtime = os.path.getmtime(REVOCATION_FILE)
+    except OSError:
+        return
+    if mtime == _revoked_mtime:
+        return
+    with _revoked_lock:
+        with open(REVOCATION_FILE) as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            _revoked.update(_read_revocations(f))
+        _prune_revocations()
+        _revoked_mtime = mtime
+
+
+def add_revocation(jti, exp):
+    """
+    Refuse the token with the given id until it expires.
+
+    The revocation is kept in memory and, when ``TOKEN_REVOCATION_FILE`` is
+    set, written to that file so the other processes of the host pick it
+    up. Expired revocations are dropped from both on every write.
+
+    Requires:
+        jti (str): the token's id
+        exp (float): the token's expiry, as a Unix timestamp
+    """
+    with _revoked_lock:
+        _revoked[jti] = exp
+        _prune_revocations()
+        if REVOCATION_FILE:
+            os.makedirs(os.path.dirname(REVOCATION_FILE) or ".", exist_ok=True)
+            with open(REVOCATION_FILE, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                entries = _read_revocations(f)
+                entries[jti] = exp
+                f.truncate(0)
+                f.writelines(f"{key} {value}\n" for key, value in entries.items())
+
+
+def revoke_token(token):
+    """
+    Revoke a token in this service so it is rejected until it expires.
+
+    Use ``shared.identity.publish_revocation`` to revoke it in every service.
+
+    Requires:
+        token (str)
+
+    Returns:
+        The token's id and expiry (tuple), or None if it has no id
+    """
+    payload = jwt.decode(token, SECRET_KEY, 'HS256', options={"verify_exp": False})
+    jti = payload.get('jti')
+    if not jti:
+        return None
+    add_revocation(jti, float(payload['exp']))
+    return jti, float(payload['exp'])
+
+
+def decode_claims(token):
+    '''
+    Decode and verify an Authentication Token.
+
+    Checks the signature, expiry and revocation list locally, without
+    contacting any other service.
+
+    Raises:
+        jwt.ExpiredSignatureError, jwt.InvalidTokenError
+
+    Returns:
+        Token claims (dict) with 'id', 'role', 'exp' and optionally 'username'
+    '''
+    payload = jwt.decode(token, SECRET_KEY, 'HS256', options={"require": ["exp", "id", "role"]})
+    _load_revocations()
+    if payload.get('jti') in _revoked:
+        raise jwt.InvalidTokenError("Token has been revoked")
+    return payload
+
+
 def decode_token(token):
     '''
-    Decode Authentication Token.
+    Decode a customer's Authentication Token.
+
+    Admin and service ids are not customer ids, so their tokens are refused.
+
+    Raises:
+        jwt.ExpiredSignatureError, jwt.InvalidTokenError
+
+    Returns:
+        Customer id (int)
+    '''
+    claims = decode_claims(token)
+    if not has_role(claims, ROLE_CUSTOMER):
+        raise jwt.InvalidTokenError("Not a customer token")
+    return claims['id']
+
+
+def has_role(claims, *roles):
     '''
-    payload = jwt.decode(token, SECRET_KEY, 'HS256')
-    return payload['id']
+    Check whether decoded token claims carry one of the given roles.
+    '''
+    return claims.get('role') in roles
+
 
-def create_token(user_id):
+def create_token(user_id, role=ROLE_CUSTOMER, username=None):
     """
     Create a user token.
 
     Requires:
         user id (int)
 
+    Optional:
+        role (str): one of ROLE_CUSTOMER, ROLE_ADMIN or ROLE_SERVICE
+        username (str): embedded so services can log the actor without a lookup
+
     Returns:
         JWT Token
     """
-    
+    now = datetime.utcnow()
     payload = {
-        'iat': datetime.utcnow(),
-        'id': user_id
+        'iat': now,
+        'exp': now + timedelta(seconds=TOKEN_TTL),
+        'jti': uuid.uuid4().hex,
+        'id': user_id,
+        'role': role
     }
+    if username is not None:
+        payload['username'] = username
     return jwt.encode(
         payload,
         SECRET_KEY,
         algorithm='HS256'
     )
+
+
+def create_service_token(service_name):
+    """
+    Create a token identifying a service to the services it calls.
+
+    Requires:
+        service name (str)
+
+    Returns:
+        JWT Token carrying ROLE_SERVICE
+    """
+    return create_token(0, role=ROLE_SERVICE, username=service_name)
@@ -2,7 +2,7 @@ import pytest
 from unittest.mock import patch
 from admin_service.admin import app as flask_app
 from shared.db import db
-from shared.token import create_token
+from shared.token import create_token, revoke_token, ROLE_ADMIN
 import uuid  # To generate unique usernames
 
 # Test Data
@@ -16,7 +16,7 @@ INVALID_ADMIN = {
 }
 
 # Mock valid token for testing
-VALID_TOKEN = create_token(1)
+VALID_TOKEN = create_token(1, role=ROLE_ADMIN, username="admin1")
 
 
 @pytest.fixture
@@ -53,8 +53,8 @@ def auth_headers():
     return {"Authorization": f"Bearer {VALID_TOKEN}"}
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_create_admin_success(mock_post, mock_get, client, auth_headers):
     """
     Test the /create-admin route with valid data.
@@ -79,8 +79,8 @@ def test_create_admin_success(mock_post, mock_get, client, auth_headers):
     assert data["username"] == unique_admin["username"]
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_duplicate_admin_creation(mock_post, mock_get, client, auth_headers):
     """
     Test the /create-admin route with duplicate usernames.
@@ -103,7 +103,7 @@ def test_duplicate_admin_creation(mock_post, mock_get, client, auth_headers):
     assert response.status_code == 500  # Username already taken
 
 
-@patch("requests.post")
+@patch("shared.http_client.post")
 def test_create_admin_unauthorized(mock_post, client):
     """
     Test the /create-admin route when unauthorized.
@@ -113,3 +113,26 @@ def test_create_admin_unauthorized(mock_post, client):
 
     response = client.post("/create-admin", json=VALID_ADMIN)  # No auth headers
     assert response.status_code == 403  # Forbidden
+
+
+@patch("shared.http_client.post")
+def test_create_admin_customer_token(mock_post, client):
+    """
+    Test the /create-admin route with a customer token.
+    """
+    headers = {"Authorization": f"Bearer {create_token(1)}"}
+
+    response = client.post("/create-admin", json=VALID_ADMIN, headers=headers)
+    assert response.status_code == 403  # Not an admin
+
+
+@patch("shared.http_client.post")
+def test_create_admin_revoked_token(mock_post, client):
+    """
+    Test the /create-admin route with a revoked admin token.
+    """
+    token = create_token(1, role=ROLE_ADMIN)
+    revoke_token(token)
+
+    response = client.post("/create-admin", json=VALID_ADMIN, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403  # Revoked
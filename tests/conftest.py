@@ -0,0 +1,11 @@
+import os
+
+# Every service gets its own in-memory database, so tests never touch the files in instance/.
+for service in ("admin", "customer", "favorite", "inventory", "log", "review", "sale"):
+    os.environ.setdefault(f"{service.upper()}_DATABASE_URI", "sqlite:///:memory:")
+
+# The lowest bcrypt cost keeps account creation and login fast in tests.
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+
+# Tokens are signed with a key only the tests use.
+os.environ.setdefault("SECRET_KEY", "test-secret-key-used-only-by-the-test-suite")
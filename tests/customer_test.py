@@ -1,8 +1,12 @@
 import pytest
 from unittest.mock import patch
-from customer_service.customer import app as flask_app
+from customer_service.customer import app as flask_app, authenticate
+from customer_service.models import Customer
 from shared.db import db
-from shared.token import create_token
+import time
+from shared import token as shared_token
+from shared.identity import CUSTOMER_SUBSCRIBERS, SERVICE_PATHS, _push_invalidation, _push_revocation
+from shared.token import create_token, create_service_token, add_revocation, ROLE_ADMIN
 import uuid  # To generate unique usernames for testing
 
 # Test Data
@@ -47,6 +51,22 @@ def app():
         db.drop_all()
 
 
+@pytest.fixture(autouse=True)
+def publisher():
+    """
+    Fixture capturing the cache invalidations pushed to other services instead of sending them.
+    """
+    with patch("shared.identity._publisher") as mock_publisher:
+        yield mock_publisher
+
+
+def pushed_invalidations(publisher):
+    """
+    Return ``(subscriber, key)`` of every invalidation pushed through the mocked publisher.
+    """
+    return [(call.args[1], call.args[4]) for call in publisher.submit.call_args_list if call.args[0] is _push_invalidation]
+
+
 @pytest.fixture
 def client(app):
     """
@@ -63,8 +83,8 @@ def auth_headers():
     return {"Authorization": f"Bearer {VALID_TOKEN}"}
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_create_customer_success(mock_post, mock_get, client, auth_headers):
     """
     Test the /customer route for creating a customer with valid data.
@@ -80,8 +100,8 @@ def test_create_customer_success(mock_post, mock_get, client, auth_headers):
     assert data["balance"] == 0
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_create_customer_invalid_data(mock_post, mock_get, client, auth_headers):
     """
     Test the /customer route for creating a customer with invalid data.
@@ -90,7 +110,7 @@ def test_create_customer_invalid_data(mock_post, mock_get, client, auth_headers)
     assert response.status_code == 400  # Bad Request
 
 
-@patch("requests.get")
+@patch("shared.http_client.get")
 def test_get_customer_by_name(mock_get, client, auth_headers):
     """
     Test retrieving a customer by their full name.
@@ -109,8 +129,8 @@ def test_get_customer_by_name(mock_get, client, auth_headers):
     assert data["full_name"] == VALID_CUSTOMER["full_name"]
 
 
-@patch("requests.post")
-def test_update_customer(mock_post, client, auth_headers):
+@patch("shared.http_client.post")
+def test_update_customer(mock_post, client, auth_headers, publisher):
     """
     Test updating customer details.
     """
@@ -128,11 +148,12 @@ def test_update_customer(mock_post, client, auth_headers):
     data = response.get_json()
     assert data["username"] == "newusername"
     assert data["address"] == "456 Elm Street"
+    assert pushed_invalidations(publisher) == [(path, 1) for path in CUSTOMER_SUBSCRIBERS]
 
 
-@patch("requests.get")
-@patch("requests.post")
-def test_delete_customer(mock_post, mock_get, client, auth_headers):
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
+def test_delete_customer(mock_post, mock_get, client, auth_headers, publisher):
     """
     Test deleting a customer.
     """
@@ -150,3 +171,145 @@ def test_delete_customer(mock_post, mock_get, client, auth_headers):
     response = client.delete("/customer", json={"customer_id": 1}, headers=auth_headers)
     assert response.status_code == 200
     assert response.get_json()["Message"] == "Customer Deleted"
+    assert pushed_invalidations(publisher) == [(path, 1) for path in CUSTOMER_SUBSCRIBERS]
+
+
+@patch("shared.http_client.post")
+def test_deduct_insufficient_balance(mock_post, client, auth_headers):
+    """
+    Test that a deduction larger than the balance is refused.
+    """
+    client.post("/customer", json=VALID_CUSTOMER, headers=auth_headers)
+
+    response = client.post("/deduct", json={"amount": 5.0}, headers=auth_headers)
+    assert response.status_code == 400
+
+    client.post("/charge", json={"amount": 10.0}, headers=auth_headers)
+    response = client.post("/deduct", json={"amount": 5.0}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()["balance"] == 5.0
+
+
+@patch("shared.http_client.post")
+def test_deduct_and_refund_by_order(mock_post, client, auth_headers):
+    """
+    Test that a debit with an order ID is applied once however often it is sent, and refunded once.
+    """
+    client.post("/customer", json=VALID_CUSTOMER, headers=auth_headers)
+    client.post("/charge", json={"amount": 10.0}, headers=auth_headers)
+    service_headers = {"Authorization": f"Bearer {create_service_token('sale_service')}"}
+    order = {"order_id": "order-1", "customer_id": 1, "amount": 4.0}
+
+    for _ in range(2):
+        response = client.post("/deduct", json={"amount": 4.0, "order_id": "order-1"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.get_json()["balance"] == 6.0
+
+    assert client.post("/refund", json=order, headers=auth_headers).status_code == 403  # Services only
+    for refunded in (True, False):
+        response = client.post("/refund", json=order, headers=service_headers)
+        assert response.status_code == 200
+        assert response.get_json()["refunded"] is refunded
+    assert db.session.get(Customer, 1).balance == 10.0
+
+    # A debit arriving after its order was refunded is refused
+    assert client.post("/deduct", json={"amount": 4.0, "order_id": "order-1"}, headers=auth_headers).status_code == 409
+
+    # So is one whose refund came first, as when the debit timed out before reaching the service
+    client.post("/refund", json={**order, "order_id": "order-2"}, headers=service_headers)
+    assert client.post("/deduct", json={"amount": 4.0, "order_id": "order-2"}, headers=auth_headers).status_code == 409
+    assert db.session.get(Customer, 1).balance == 10.0
+
+@patch("shared.http_client.post")
+def test_admin_token_is_not_a_customer_token(mock_post, client):
+    """
+    Test that an admin token cannot act as the customer sharing its id.
+    """
+    client.post("/customer", json=VALID_CUSTOMER)
+    headers = {"Authorization": f"Bearer {create_token(1, role=ROLE_ADMIN)}"}
+
+    response = client.put("/customer", json={"address": "456 Elm Street"}, headers=headers)
+    assert response.status_code == 403
+
+
+@patch("shared.http_client.post")
+def test_logout_revokes_token(mock_post, client, publisher):
+    """
+    Test that a token is refused once its customer logged out.
+    """
+    client.post("/customer", json=VALID_CUSTOMER)
+    headers = {"Authorization": f"Bearer {create_token(1)}"}
+
+    assert client.post("/logout", headers=headers).status_code == 200
+    assert client.put("/customer", json={"address": "456 Elm Street"}, headers=headers).status_code == 403
+    assert client.post("/logout", headers=headers).status_code == 403
+
+    pushed = [call.args[1] for call in publisher.submit.call_args_list if call.args[0] is _push_revocation]
+    assert sorted(pushed) == sorted(path for name, path in SERVICE_PATHS.items() if name != "customer_service")
+
+
+def test_pushed_revocation_is_enforced(client, tmp_path):
+    """
+    Test that a revocation pushed by another service is enforced, and that expired revocations are dropped.
+    """
+    token = create_token(1)
+    jti = shared_token.jwt.decode(token, options={"verify_signature": False})["jti"]
+    revocations = tmp_path / "revoked-tokens.txt"
+    service_headers = {"Authorization": f"Bearer {create_service_token('admin_service')}"}
+
+    with patch("shared.token.REVOCATION_FILE", str(revocations)):
+        add_revocation("expired", time.time() - 1)
+        response = client.post("/tokens/revoke", json={"jti": jti, "exp": time.time() + 60}, headers=service_headers)
+        assert response.status_code == 200
+        assert client.put("/customer", json={"address": "456 Elm Street"},
+                          headers={"Authorization": f"Bearer {token}"}).status_code == 403
+
+    assert "expired" not in shared_token._revoked
+    assert revocations.read_text().split()[0] == jti
+    assert client.post("/tokens/revoke", json={"jti": "x", "exp": 1}, headers={"Authorization": f"Bearer {token}"}).status_code == 403
+    assert client.post("/tokens/revoke", json={"jti": 5, "exp": 1}, headers=service_headers).status_code == 400
+
+@patch("shared.http_client.post")
+def test_authenticate_rehashes_on_cost_change(mock_post, client):
+    """
+    Test logging in, and that a password hashed with an old cost factor is rehashed on login.
+    """
+    mock_post.return_value.status_code = 200
+    client.post("/customer", json=VALID_CUSTOMER)
+    credentials = {"username": VALID_CUSTOMER["username"], "password": VALID_CUSTOMER["password"]}
+
+    assert client.post("/authenticate", json={**credentials, "password": "wrong"}).status_code == 401
+
+    with patch("shared.passwords.PASSWORD_HASH_ROUNDS", 5):
+        response = client.post("/authenticate", json=credentials)
+    assert response.status_code == 200
+    assert "token" in response.get_json()
+    assert Customer.query.filter_by(username=VALID_CUSTOMER["username"]).first().hashed_password.startswith("$2b$05$")
+
+
+def test_authenticate_sheds_load(client):
+    """
+    Test that logins beyond the concurrency limit are turned away with 503 instead of queueing.
+    """
+    slots = authenticate.slots
+    held = 0
+    while slots.acquire(blocking=False):
+        held += 1
+    try:
+        response = client.post("/authenticate", json={"username": "anyone", "password": "secret"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        for _ in range(held):
+            slots.release()
+
+
+@patch("shared.identity.emit_log")
+@patch("shared.http_client.post", side_effect=ConnectionError("Connection refused"))
+def test_undelivered_invalidation_is_logged(mock_post, mock_emit_log):
+    """
+    Test that an invalidation push that cannot be delivered is recorded in the audit log.
+    """
+    _push_invalidation(CUSTOMER_SUBSCRIBERS[0], create_token(0), "customer", 1, "customer_service")
+
+    assert mock_emit_log.call_args.args[1:] == ("customer_service", "cache.invalidation_failed", "service:customer_service")
@@ -1,9 +1,10 @@
 import pytest
 from unittest.mock import patch
-from favorite_service.favorite import app as flask_app
+from favorite_service.favorite import app as flask_app, item_cache
 from inventory_service.models import Inventory, Category
 from shared.db import db
-from shared.token import create_token
+from shared.identity import customer_cache
+from shared.token import create_token, create_service_token
 
 # Mock valid token
 VALID_TOKEN = create_token(1)
@@ -19,6 +20,9 @@ def app():
         "SQLALCHEMY_TRACK_MODIFICATIONS": False,
     })
 
+    customer_cache.clear()
+    item_cache.clear()
+
     with flask_app.app_context():
         db.create_all()
 
@@ -51,8 +55,8 @@ def auth_headers():
     return {"Authorization": f"Bearer {VALID_TOKEN}"}
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_add_favorite(mock_post, mock_get, client, auth_headers):
     """
     Test adding an item to favorites.
@@ -76,9 +80,27 @@ def test_add_favorite(mock_post, mock_get, client, auth_headers):
     assert data["inventory_id"] == 1
 
 
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
+def test_add_favorite_duplicate(mock_post, mock_get, client, auth_headers):
+    """
+    Test that adding the same favorite twice is rejected by the unique index.
+    """
+    mock_get.side_effect = [
+        # First call: CUSTOMER_PATH (cached afterwards)
+        type("MockResponse", (), {"status_code": 200, "json": lambda: {"user_id": 1, "username": "testuser"}}),
+        # Second and third calls: INVENTORY_PATH
+        type("MockResponse", (), {"status_code": 200, "json": lambda: {"inventory_id": 1, "name": "Laptop"}}),
+        type("MockResponse", (), {"status_code": 200, "json": lambda: {"inventory_id": 1, "name": "Laptop"}}),
+    ]
+    mock_post.return_value.status_code = 200
+
+    assert client.post("/favorite:1", headers=auth_headers).status_code == 200
+    assert client.post("/favorite:1", headers=auth_headers).status_code == 400
+
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_delete_favorite(mock_post, mock_get, client, auth_headers):
     """
     Test deleting a favorite item.
@@ -99,7 +121,7 @@ def test_delete_favorite(mock_post, mock_get, client, auth_headers):
     assert response.get_json()["Message"] == "Favorite Deleted"
 
 
-@patch("requests.get")
+@patch("shared.http_client.get")
 def test_get_favorites(mock_get, client, auth_headers):
     """
     Test retrieving all favorite items for a customer.
@@ -122,8 +144,8 @@ def test_get_favorites(mock_get, client, auth_headers):
     assert data[1]["inventory_id"] == 2
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_add_wishlist(mock_post, mock_get, client, auth_headers):
     """
     Test adding an item to the wishlist.
@@ -147,8 +169,8 @@ def test_add_wishlist(mock_post, mock_get, client, auth_headers):
     assert data["inventory_id"] == 2
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_delete_wishlist(mock_post, mock_get, client, auth_headers):
     """
     Test deleting an item from the wishlist.
@@ -167,3 +189,125 @@ def test_delete_wishlist(mock_post, mock_get, client, auth_headers):
     response = client.delete("/wishlist:1", headers=auth_headers)
     assert response.status_code == 200
     assert response.get_json()["Message"] == "Wishlist Deleted"
+
+
+@patch("shared.http_client.get")
+def test_customer_lookup_cached(mock_get, client, auth_headers):
+    """
+    Test that repeated requests resolve the customer from the local cache.
+    """
+    # Mock customer service response
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"user_id": 1, "username": "testuser"}
+
+    before = client.get("/cache/stats").get_json()["customer"]
+
+    client.get("/favorites", headers=auth_headers)
+    client.get("/wishlists", headers=auth_headers)
+    assert mock_get.call_count == 1
+
+    after = client.get("/cache/stats").get_json()["customer"]
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+
+@patch("shared.http_client.get")
+def test_cache_invalidate(mock_get, client, auth_headers):
+    """
+    Test that an invalidation pushed by customer_service evicts the cached customer.
+    """
+    # Mock customer service response
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"user_id": 1, "username": "testuser"}
+
+    client.get("/favorites", headers=auth_headers)
+
+    response = client.post("/cache/invalidate", json={"cache": "customer", "key": 1}, headers=auth_headers)
+    assert response.status_code == 403  # Customers cannot invalidate
+
+    service_headers = {"Authorization": f"Bearer {create_service_token('customer_service')}"}
+    response = client.post("/cache/invalidate", json={"cache": "customer", "key": 1}, headers=service_headers)
+    assert response.status_code == 200
+
+    client.get("/favorites", headers=auth_headers)
+    assert mock_get.call_count == 2
+
+
+@patch("shared.http_client.get")
+def test_get_wishlists_expanded(mock_get, client, auth_headers):
+    """
+    Test paging through a wishlist with item data resolved in one inventory call per page.
+    """
+    items = {
+        1: {"inventory_id": 1, "name": "Laptop", "category": "electronics", "price": 999.99, "count": 10},
+        2: {"inventory_id": 2, "name": "T-Shirt", "category": "clothes", "price": 19.99, "count": 50},
+    }
+    inventory_calls = []
+
+    def get(url, params=None, **kwargs):
+        if url.endswith("/inventory"):
+            inventory_calls.append(params["ids"])
+            ids = [int(i) for i in params["ids"].split(",")]
+            fields = params["fields"].split(",")
+            # inventory_service returns only the projected fields
+            return type("MockResponse", (), {"status_code": 200, "json": lambda: [
+                {field: items[i][field] for field in fields} for i in ids if i in items
+            ]})
+        if "/inventory:" in url:
+            return type("MockResponse", (), {"status_code": 200, "json": lambda: items[1]})
+        return type("MockResponse", (), {"status_code": 200, "json": lambda: {"user_id": 1, "username": "testuser"}})
+
+    mock_get.side_effect = get
+    for inventory_id in (1, 2, 3):
+        client.post(f"/wishlist:{inventory_id}", headers=auth_headers)
+
+    response = client.get("/wishlists?expand=inventory&limit=2", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [entry["inventory"]["name"] for entry in data] == ["Laptop", "T-Shirt"]
+    assert inventory_calls == ["1,2"]
+
+    response = client.get(f"/wishlists?expand=inventory&limit=2&after_id={response.headers['X-Next-Cursor']}", headers=auth_headers)
+    data = response.get_json()
+    assert [entry["inventory_id"] for entry in data] == [3]
+    assert data[0]["inventory"] is None
+    assert "X-Next-Cursor" not in response.headers
+
+    # Summaries, including the missing item, are now answered from the cache.
+    client.get("/wishlists?expand=inventory", headers=auth_headers)
+    assert inventory_calls == ["1,2", "3"]
+
+    assert client.get("/wishlists?expand=reviews", headers=auth_headers).status_code == 400
+
+
+@patch("shared.http_client.get")
+def test_inventory_events_notify_wishlists(mock_get, client, auth_headers):
+    """
+    Test that a price drop or restock notifies the customers wishlisting the item, and nothing else does.
+    """
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"user_id": 1, "username": "testuser", "name": "Laptop"}
+    client.post("/wishlist:1", headers=auth_headers)
+
+    service_headers = {"Authorization": f"Bearer {create_service_token('inventory_service')}"}
+    events = [
+        {"inventory_id": 1, "name": "Laptop", "old_price": 999.99, "price": 899.99, "old_count": 0, "count": 5},
+        {"inventory_id": 1, "name": "Laptop", "old_price": 899.99, "price": 949.99, "old_count": 5, "count": 4},
+        {"inventory_id": 2, "name": "T-Shirt", "old_price": 19.99, "price": 9.99, "old_count": 50, "count": 50},
+    ]
+    response = client.post("/inventory-events", json={"events": events}, headers=service_headers)
+    assert response.status_code == 200
+    assert response.get_json()["notified"] == 2
+
+    data = client.get("/notifications", headers=auth_headers).get_json()
+    assert [(n["inventory_id"], n["kind"]) for n in data] == [(1, "price_drop"), (1, "back_in_stock")]
+    assert data[0]["message"] == "Laptop dropped from 999.99 to 899.99"
+
+    deleted = [{"inventory_id": 1, "name": "Laptop", "old_price": 949.99, "price": 949.99, "old_count": 0, "count": 4, "deleted": True}]
+    with patch("favorite_service.favorite.item_cache") as mock_cache:
+        response = client.post("/inventory-events", json={"events": deleted}, headers=service_headers)
+    assert response.get_json()["notified"] == 0
+    mock_cache.invalidate.assert_called_once_with(1)
+
+    assert client.post("/inventory-events", json={"events": events}, headers=auth_headers).status_code == 403
+    assert client.post("/inventory-events", json={"events": [{"name": "x"}]}, headers=service_headers).status_code == 400
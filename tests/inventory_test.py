@@ -1,12 +1,13 @@
 import pytest
 from unittest.mock import patch
-from inventory_service.inventory import app as flask_app
+from sqlalchemy import event
+from inventory_service.inventory import app as flask_app, catalog_cache, expire_versions
 from inventory_service.models import Inventory, Category
 from shared.db import db
-from shared.token import create_token
+from shared.token import create_token, create_service_token, ROLE_ADMIN
 
 # Mock valid admin token
-VALID_TOKEN = create_token(1)
+VALID_TOKEN = create_token(1, role=ROLE_ADMIN, username="adminuser")
 
 
 @pytest.fixture
@@ -20,6 +21,9 @@ def app():
         "SQLALCHEMY_TRACK_MODIFICATIONS": False,
     })
 
+    catalog_cache.clear()
+    expire_versions()  # The tables are recreated, so versions read by earlier tests are gone
+
     with flask_app.app_context():
         db.create_all()
 
@@ -52,8 +56,8 @@ def auth_headers():
     return {"Authorization": f"Bearer {VALID_TOKEN}"}
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_add_inventory(mock_post, mock_get, client, auth_headers):
     """
     Test adding a new inventory item.
@@ -81,8 +85,8 @@ def test_add_inventory(mock_post, mock_get, client, auth_headers):
     assert data["count"] == 20
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_update_inventory(mock_post, mock_get, client, auth_headers):
     """
     Test updating an existing inventory item.
@@ -106,8 +110,8 @@ def test_update_inventory(mock_post, mock_get, client, auth_headers):
     assert data["count"] == 15
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_delete_inventory(mock_post, mock_get, client, auth_headers):
     """
     Test deleting an inventory item.
@@ -137,6 +141,44 @@ def test_get_inventory(client):
     assert len(data) == 2  # Preloaded items: "Laptop" and "T-Shirt"
 
 
+
+def test_get_inventory_batch(client):
+    """
+    Test looking up several inventory items at once by ID and by name.
+    """
+    response = client.get("/inventory?ids=2,1,42")
+    assert response.status_code == 200
+    assert [item["name"] for item in response.get_json()] == ["T-Shirt", "Laptop"]  # Request order, unknown IDs skipped
+
+    response = client.get("/inventory?names=Laptop,Phone")
+    assert response.status_code == 200
+    assert [item["inventory_id"] for item in response.get_json()] == [1]
+
+    response = client.get("/inventory?ids=1,abc")
+    assert response.status_code == 400
+
+
+def test_get_inventory_paginated(client):
+    """
+    Test keyset pagination, filters and field projection on the inventory listing.
+    """
+    response = client.get("/inventory?limit=1")
+    assert [item["inventory_id"] for item in response.get_json()] == [1]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/inventory?limit=1&after_id={cursor}")
+    assert [item["inventory_id"] for item in response.get_json()] == [2]
+
+    response = client.get("/inventory?category=clothes&max_price=50&fields=name,price")
+    assert response.status_code == 200
+    assert response.get_json() == [{"name": "T-Shirt", "price": 19.99}]
+
+    response = client.get("/inventory?min_price=100")
+    assert [item["name"] for item in response.get_json()] == ["Laptop"]
+
+    assert client.get("/inventory?fields=password").status_code == 400
+    assert client.get("/inventory?category=toys").status_code == 400
+
 def test_get_inventory_by_id(client):
     """
     Test retrieving an inventory item by ID.
@@ -159,7 +201,7 @@ def test_get_inventory_by_name(client):
     assert data["name"] == "Laptop"
 
 
-@patch("requests.get")
+@patch("shared.http_client.get")
 def test_unauthorized_add_inventory(mock_get, client):
     """
     Test adding inventory without proper authorization.
@@ -176,3 +218,245 @@ def test_unauthorized_add_inventory(mock_get, client):
     })
 
     assert response.status_code == 403  # Unauthorized
+
+
+def test_customer_token_add_inventory(client):
+    """
+    Test adding inventory with a customer token, which must be rejected without contacting admin_service.
+    """
+    response = client.post("/inventory", json={
+        "name": "Smartphone",
+        "category": "electronics",
+        "price": 599.99,
+        "description": "A high-end smartphone",
+        "count": 20
+    }, headers={"Authorization": f"Bearer {create_token(1)}"})
+
+    assert response.status_code == 403  # Unauthorized
+
+
+def test_reserve_inventory(client):
+    """
+    Test reserving stock for a sale with a service token.
+    """
+    headers = {"Authorization": f"Bearer {create_service_token('sale_service')}"}
+
+    response = client.post("/reserve", json={"name": "Laptop", "quantity": 3}, headers=headers)
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data["inventory_id"] == 1
+    assert data["count"] == 7
+
+
+def test_reserve_inventory_out_of_stock(client):
+    """
+    Test that a reservation larger than the stock is refused and leaves the count untouched.
+    """
+    headers = {"Authorization": f"Bearer {create_service_token('sale_service')}"}
+
+    response = client.post("/reserve", json={"name": "Laptop", "quantity": 11}, headers=headers)
+    assert response.status_code == 409
+
+    response = client.post("/reserve", json={"name": "Phone", "quantity": 1}, headers=headers)
+    assert response.status_code == 404
+
+    assert client.get("/inventory:1").get_json()["count"] == 10
+
+
+def test_release_inventory(client):
+    """
+    Test returning reserved stock.
+    """
+    headers = {"Authorization": f"Bearer {create_service_token('sale_service')}"}
+
+    client.post("/reserve", json={"name": "Laptop", "quantity": 2}, headers=headers)
+    response = client.post("/release", json={"inventory_id": 1, "quantity": 2}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 10
+
+    response = client.post("/release", json={"inventory_id": 1}, headers={"Authorization": f"Bearer {create_token(1)}"})
+    assert response.status_code == 403  # Customers cannot release stock
+
+
+def test_reserve_inventory_multiple_items(client):
+    """
+    Test that a multi-item reservation is all-or-nothing.
+    """
+    headers = {"Authorization": f"Bearer {create_service_token('sale_service')}"}
+
+    response = client.post("/reserve", json={"items": [{"name": "Laptop", "quantity": 2}, {"name": "T-Shirt", "quantity": 51}]}, headers=headers)
+    assert response.status_code == 409
+    assert response.get_json()["name"] == "T-Shirt"
+    assert client.get("/inventory:1").get_json()["count"] == 10  # The Laptop line was rolled back
+
+    response = client.post("/reserve", json={"items": [{"name": "Laptop", "quantity": 2}, {"name": "T-Shirt", "quantity": 50}]}, headers=headers)
+    assert response.status_code == 200
+    assert [(item["name"], item["count"]) for item in response.get_json()] == [("Laptop", 8), ("T-Shirt", 0)]
+
+    response = client.post("/release", json={"items": [{"inventory_id": 1, "quantity": 2}, {"inventory_id": 2, "quantity": 50}]}, headers=headers)
+    assert response.status_code == 200
+    assert [item["count"] for item in response.get_json()] == [10, 50]
+
+
+def test_reserve_and_release_by_order(client):
+    """
+    Test that order-keyed reservations and releases apply at most once, and a release before the reservation refuses it.
+    """
+    headers = {"Authorization": f"Bearer {create_service_token('sale_service')}"}
+    order = {"order_id": "order-1", "items": [{"name": "Laptop", "quantity": 2}]}
+
+    assert client.post("/reserve", json=order, headers=headers).status_code == 200
+    assert client.post("/reserve", json=order, headers=headers).status_code == 200  # A retry takes nothing more
+    assert client.get("/inventory:1").get_json()["count"] == 8
+
+    response = client.post("/release", json={"order_id": "order-1"}, headers=headers)
+    assert response.get_json() == {"order_id": "order-1", "status": "released", "released": True}
+    assert client.post("/release", json={"order_id": "order-1"}, headers=headers).get_json()["released"] is False
+    assert client.get("/inventory:1").get_json()["count"] == 10
+
+    # The reservation of order-2 timed out before it was applied, and the sale released it.
+    assert client.post("/release", json={"order_id": "order-2"}, headers=headers).get_json()["released"] is False
+    response = client.post("/reserve", json=dict(order, order_id="order-2"), headers=headers)
+    assert response.status_code == 409
+    assert response.get_json()["message"] == "Order Cancelled"
+    assert client.get("/inventory:1").get_json()["count"] == 10
+
+    assert client.post("/release", json={"order_id": 5}, headers=headers).status_code == 400
+
+
+def test_get_inventory_conditional(client, auth_headers):
+    """
+    Test that catalog reads carry an ETag, answer 304 while it matches and change after a write.
+    """
+    response = client.get("/inventory:1")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/inventory:1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.put("/inventory:1", json={"price": 899.99}, headers=auth_headers)
+
+    response = client.get("/inventory:1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json()["price"] == 899.99
+
+
+def test_sales_keep_count_free_responses(client):
+    """
+    Test that stock changes invalidate responses holding counts but not those without.
+    """
+    headers = {"Authorization": f"Bearer {create_service_token('sale_service')}"}
+    names = client.get("/inventory?fields=name,price").headers["ETag"]
+    item = client.get("/inventory:1").headers["ETag"]
+
+    client.post("/reserve", json={"name": "Laptop", "quantity": 1}, headers=headers)
+
+    assert client.get("/inventory?fields=name,price", headers={"If-None-Match": names}).status_code == 304
+    response = client.get("/inventory:1", headers={"If-None-Match": item})
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 9
+
+
+def test_cached_read_runs_no_query(client):
+    """
+    Test that a cached catalog read is answered without reading the version from the database.
+    """
+    statements = []
+    client.get("/inventory?limit=1")
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        assert client.get("/inventory?limit=1").status_code == 200
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert statements == []
+
+def test_get_inventory_response_cached(client):
+    """
+    Test that repeated catalog reads are answered from the rendered-response cache.
+    """
+    before = catalog_cache.stats()["hits"]
+    first = client.get("/inventory?limit=1")
+    second = client.get("/inventory?limit=1")
+
+    assert second.get_data() == first.get_data()
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    assert catalog_cache.stats()["hits"] == before + 1
+
+
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
+def test_search_inventory(mock_post, mock_get, client, auth_headers):
+    """
+    Test ranked prefix search over names and descriptions, kept up to date on writes.
+    """
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"admin_id": 1, "username": "adminuser"}
+    mock_post.return_value.status_code = 200
+
+    client.post("/inventory", json={
+        "name": "Laptop Bag", "category": "accessories", "price": 49.99, "description": "Fits a 15 inch device", "count": 5
+    }, headers=auth_headers)
+    client.post("/inventory", json={
+        "name": "Mouse", "category": "electronics", "price": 9.99, "description": "Pairs with any laptop", "count": 5
+    }, headers=auth_headers)
+
+    data = client.get("/search?q=lapt").get_json()
+    # Name matches rank above the description match.
+    assert [item["name"] for item in data][-1] == "Mouse"
+    assert {item["name"] for item in data} == {"Laptop", "Laptop Bag", "Mouse"}
+
+    assert [item["name"] for item in client.get("/search?q=cotton shirt").get_json()] == ["T-Shirt"]
+    assert [item["name"] for item in client.get("/search?q=lapt&category=accessories").get_json()] == ["Laptop Bag"]
+
+    pages = []
+    response = client.get("/search?q=lapt&limit=2")
+    pages.append(response.get_json())
+    response = client.get(f"/search?q=lapt&limit=2&cursor={response.headers['X-Next-Cursor']}")
+    pages.append(response.get_json())
+    assert [item["name"] for page in pages for item in page] == [item["name"] for item in data]
+
+    client.put("/inventory:1", json={"name": "Notebook"}, headers=auth_headers)
+    client.delete("/inventory:2", headers=auth_headers)
+    # "Notebook" is still found through its description, now ranked below the name match.
+    assert [item["name"] for item in client.get("/search?q=lapt").get_json()][0] == "Laptop Bag"
+    assert client.get("/search?q=shirt").get_json() == []
+    assert client.get("/search?q=note").get_json()[0]["inventory_id"] == 1
+
+    assert client.get("/search?q=").status_code == 400
+
+
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
+@patch("inventory_service.inventory.inventory_events")
+def test_update_inventory_publishes_change(mock_events, mock_post, mock_get, client, auth_headers):
+    """
+    Test that every change to an item is published: edits, renames, reservations, releases and deletes.
+    """
+    mock_post.return_value.status_code = 200
+
+    client.put("/inventory:1", json={"price": 899.99}, headers=auth_headers)
+    mock_events.emit.assert_called_once_with({
+        "inventory_id": 1, "name": "Laptop", "old_price": 999.99, "price": 899.99, "old_count": 10, "count": 10
+    })
+
+    client.put("/inventory:1", json={"name": "Notebook"}, headers=auth_headers)
+    assert mock_events.emit.call_args.args[0]["name"] == "Notebook"
+
+    client.post("/reserve", json={"name": "Notebook", "quantity": 2}, headers=auth_headers)
+    assert mock_events.emit.call_args.args[0] == {
+        "inventory_id": 1, "name": "Notebook", "old_price": 899.99, "price": 899.99, "old_count": 10, "count": 8
+    }
+
+    client.post("/release", json={"inventory_id": 1, "quantity": 2}, headers=auth_headers)
+    assert mock_events.emit.call_args.args[0]["count"] == 10
+
+    client.delete("/inventory:1", headers=auth_headers)
+    assert mock_events.emit.call_args.args[0] == {
+        "inventory_id": 1, "name": "Notebook", "old_price": 899.99, "price": 899.99, "old_count": 10, "count": 10,
+        "deleted": True
+    }
+    assert mock_events.emit.call_count == 5
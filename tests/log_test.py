@@ -1,7 +1,11 @@
+import json
 import pytest
+from unittest.mock import patch
 from log_service.log import app as flask_app
 from log_service.models import Log
 from shared.db import db
+from shared.emitter import BatchEmitter, emitters
+from shared.token import create_token, ROLE_ADMIN
 
 @pytest.fixture
 def app():
@@ -72,3 +76,131 @@ def test_add_log_missing_message(client):
     response = client.post("/add-log", json={})
     assert response.status_code == 400  # Bad request
     assert b"Bad request" in response.data
+
+
+def test_add_logs(client):
+    """
+    Test adding a batch of log entries in one request.
+    """
+    response = client.post("/add-logs", json={"logs": [
+        {"message": "Customer johndoe charged 10.0"},
+        {"message": "Customer johndoe bought Laptop"},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 2
+
+    response = client.get("/logs")
+    assert len(response.get_json()) == 4
+
+
+def test_add_logs_bad_entry(client):
+    """
+    Test that a batch containing an entry without a message is rejected as a whole.
+    """
+    response = client.post("/add-logs", json={"logs": [{"message": "ok"}, {}]})
+    assert response.status_code == 400
+
+    response = client.get("/logs")
+    assert len(response.get_json()) == 2
+
+
+def test_add_duplicate_log(client):
+    """
+    Test that identical events are both recorded.
+    """
+    for _ in range(2):
+        response = client.post("/add-log", json={"message": "Deducted 10.0 from customer johndoe", "service": "customer_service", "event_type": "customer.deducted", "actor": "customer:1"})
+        assert response.status_code == 200
+
+    data = response.get_json()
+    assert data["service"] == "customer_service"
+    assert data["event_type"] == "customer.deducted"
+    assert data["actor"] == "customer:1"
+
+    response = client.get("/logs")
+    assert len(response.get_json()) == 4
+
+
+def test_rotate_logs(client):
+    """
+    Test purging log partitions older than the retention period.
+    """
+    old = Log(message="Old entry")
+    old.partition = "2000-01-01"
+    db.session.add(old)
+    db.session.commit()
+
+    response = client.post("/logs/rotate", json={"retention_days": 30})
+    assert response.status_code == 403  # Not authenticated
+
+    headers = {"Authorization": f"Bearer {create_token(1, role=ROLE_ADMIN)}"}
+    response = client.post("/logs/rotate", json={"retention_days": 30}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["purged"] == 1
+
+    partitions = client.get("/logs/partitions").get_json()
+    assert sum(partition["count"] for partition in partitions) == 2
+    assert all(partition["partition"] != "2000-01-01" for partition in partitions)
+
+
+def test_get_logs_paginated(client):
+    """
+    Test walking the logs page by page with the keyset cursor.
+    """
+    response = client.get("/logs?limit=1")
+    assert response.status_code == 200
+    assert len(response.get_json()) == 1
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(f"/logs?limit=1&after_id={cursor}")
+    data = response.get_json()
+    assert data[0]["message"] == "Customer added item T-Shirt to favorites"
+
+    response = client.get(f"/logs?limit=1&after_id={response.headers['X-Next-Cursor']}")
+    assert response.get_json() == []
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_logs_filtered(client):
+    """
+    Test filtering logs by service and message substring.
+    """
+    client.post("/add-log", json={"message": "New sale of item Laptop", "service": "sale_service"})
+
+    response = client.get("/logs?service=sale_service")
+    assert [log["message"] for log in response.get_json()] == ["New sale of item Laptop"]
+
+    response = client.get("/logs?q=Laptop")
+    assert len(response.get_json()) == 2
+
+    response = client.get("/logs?since=not-a-date")
+    assert response.status_code == 400
+
+
+def test_get_logs_ndjson(client):
+    """
+    Test streaming logs as newline-delimited JSON.
+    """
+    response = client.get("/logs?format=ndjson")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["message"] == "Admin added new inventory item Laptop"
+
+
+@patch("shared.emitter.atexit.register")
+def test_emitter_registers_exit_flush_once(mock_register):
+    """
+    Test that starting an emitter again, as every gunicorn worker does, does not add more exit flushes.
+    """
+    emitter = BatchEmitter("http://localhost/add-logs", "logs", spill_path=None)
+    emitters.remove(emitter)
+    emitter._run = lambda: None
+
+    emitter.start()
+    emitter.thread.join()
+    emitter.start()
+
+    assert mock_register.call_count == 1
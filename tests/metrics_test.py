@@ -0,0 +1,145 @@
+import json
+import pytest
+from unittest.mock import patch
+from inventory_service.inventory import app as flask_app, catalog_cache, expire_versions
+from inventory_service.models import Inventory, Category
+from sale_service.sale import app as sale_app
+from shared import http_client
+from shared.db import db
+from shared.metrics import Histogram, metrics, path_template
+from shared.token import INVENTORY_PATH
+
+
+def sample(text, series):
+    """
+    Read the value of one series from a /metrics response, 0 if absent.
+    """
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.split(" ")[1])
+    return 0
+
+
+@pytest.fixture
+def app():
+    """
+    Fixture to configure the Flask app for testing.
+    """
+    flask_app.config.update({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+    })
+
+    catalog_cache.clear()
+    expire_versions()
+
+    with flask_app.app_context():
+        db.create_all()
+        db.session.add(Inventory(name="Laptop", category=Category.ELECTRONICS, price=999.99, description="A powerful laptop", count=10))
+        db.session.commit()
+
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """
+    Fixture to provide a test client for the app.
+    """
+    return app.test_client()
+
+
+def test_histogram_buckets_are_cumulative():
+    """
+    Test that observations land in the first bucket they fit and render cumulatively.
+    """
+    histogram = Histogram("test_latency_seconds", "Test histogram.", ("route",), buckets=(0.1, 1.0))
+    try:
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "/a\"b")
+        lines = histogram.render()
+    finally:
+        del metrics["test_latency_seconds"]
+
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{route="/a\\"b"} 4' in lines
+
+
+def test_metrics_time_requests_and_count_queries(client):
+    """
+    Test that a request is timed per route and its SQL statements are counted.
+    """
+    duration = 'http_request_duration_seconds_count{service="inventory_service",method="GET",route="/inventory",status="200"}'
+    queries = 'http_request_sql_queries_sum{service="inventory_service",method="GET",route="/inventory"}'
+    before = client.get('/metrics').get_data(as_text=True)
+
+    assert client.get('/inventory').status_code == 200
+
+    response = client.get('/metrics')
+    after = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    assert sample(after, duration) == sample(before, duration) + 1
+    assert sample(after, queries) > sample(before, queries)
+    assert '# TYPE upstream_request_duration_seconds histogram' in after
+
+
+def test_metrics_time_upstream_calls_by_route():
+    """
+    Test that outbound calls are timed per calling route, target service and path.
+    """
+    series = ('upstream_request_duration_seconds_count{service="sale_service",route="/sale",'
+              'target="inventory",method="POST",path="/reserve",status="200"}')
+    mock_response = type("MockResponse", (), {"status_code": 200})()
+    before = sale_app.test_client().get('/metrics').get_data(as_text=True)
+
+    with patch("requests.Session.request", return_value=mock_response):
+        with sale_app.test_request_context('/sale', method='POST'):
+            http_client.post(f'{INVENTORY_PATH}/reserve', json={"items": []})
+
+    after = sale_app.test_client().get('/metrics').get_data(as_text=True)
+    assert sample(after, series) == sample(before, series) + 1
+
+
+def test_upstream_paths_are_labelled_with_route_templates():
+    """
+    Test that IDs and names in called paths never become label values.
+    """
+    series = ('upstream_request_duration_seconds_count{{service="sale_service",route="/good:<int:id>",'
+              'target="inventory",method="GET",path="{}",status="200"}}')
+    mock_response = type("MockResponse", (), {"status_code": 200})()
+    before = sale_app.test_client().get('/metrics').get_data(as_text=True)
+
+    with patch("requests.Session.request", return_value=mock_response):
+        with sale_app.test_request_context('/good:7', method='GET'):
+            http_client.get(f'{INVENTORY_PATH}/inventory:7', template='/inventory:<int:inventory_id>')
+            http_client.get(f'{INVENTORY_PATH}/inventory:Laptop')
+            http_client.get(f'{INVENTORY_PATH}/inventory:Desk Lamp')
+
+    after = sale_app.test_client().get('/metrics').get_data(as_text=True)
+    assert sample(after, series.format("/inventory:<int:inventory_id>")) == sample(before, series.format("/inventory:<int:inventory_id>")) + 1
+    assert sample(after, series.format("/inventory:<param>")) == sample(before, series.format("/inventory:<param>")) + 2
+    assert path_template("/orders/12/items") == "/orders/<id>/items"
+
+
+def test_metrics_sum_every_worker(client, tmp_path):
+    """
+    Test that /metrics adds the series written by the service's other workers.
+    """
+    series = 'http_request_duration_seconds_count{service="inventory_service",method="GET",route="/inventory",status="200"}'
+    other = {"http_request_duration_seconds": [
+        [["inventory_service", "GET", "/inventory", "200"], [0] * 13, 0.5, 5]
+    ]}
+    (tmp_path / "1-other.json").write_text(json.dumps(other))
+
+    client.get('/inventory')
+    alone = sample(client.get('/metrics').get_data(as_text=True), series)
+    with patch("shared.metrics._directory", str(tmp_path)), patch("shared.metrics.start_sync"):
+        merged = sample(client.get('/metrics').get_data(as_text=True), series)
+
+    assert merged == alone + 5
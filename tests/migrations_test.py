@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine, text
+from sqlalchemy.orm import declarative_base
+
+from shared.migrations import Migration, Operations, applied_versions, migrate
+
+Base = declarative_base()
+
+
+class Item(Base):
+    """
+    Target schema: ``label`` is new and derived from ``name``.
+    """
+    __tablename__ = "item"
+    item_id = Column(Integer, primary_key=True)
+    name = Column(String(40), nullable=False, index=True)
+    label = Column(String(40))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    Fixture providing a file database holding the old ``item`` table with 25 rows.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE item (item_id INTEGER PRIMARY KEY, name VARCHAR(40) NOT NULL UNIQUE)"))
+        connection.execute(text("INSERT INTO item (name) VALUES (:name)"), [{"name": f"item{i}"} for i in range(25)])
+    yield engine
+    engine.dispose()
+
+
+def test_migrate_applies_each_version_once(engine):
+    """
+    Test that migrations run in order, are recorded, and are skipped once applied.
+    """
+    calls = []
+    migrations = [
+        Migration(2, "second", lambda ops: calls.append(2)),
+        Migration(1, "first", lambda ops: calls.append(1)),
+        Migration(3, "third", lambda ops: calls.append(3)),
+    ]
+
+    assert migrate(engine, migrations, target=2, progress=lambda message: None) == [1, 2]
+    assert migrate(engine, migrations, progress=lambda message: None) == [3]
+    assert migrate(engine, migrations, progress=lambda message: None) == []
+    assert calls == [1, 2, 3]
+    assert applied_versions(engine) == {1, 2, 3}
+
+
+def test_backfill_in_batches(engine):
+    """
+    Test adding a column and filling it in batches.
+    """
+    ops = Operations(engine, batch_size=10, progress=lambda message: None)
+    ops.add_column(Item, "label")
+    ops.add_column(Item, "label")  # Idempotent
+
+    assert ops.backfill(Item, "label = upper(name)", "label IS NULL") == 25
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM item WHERE label = upper(name)")).scalar() == 25
+
+
+def test_rebuild_table_mirrors_concurrent_writes(engine):
+    """
+    Test that a chunked table rebuild keeps writes made while rows are being copied.
+    """
+    writes = []
+
+    def write_during_copy(message):
+        # Runs after the first chunk is copied, standing in for the live service.
+        if message.startswith("copying") and not writes:
+            writes.append(message)
+            with engine.begin() as connection:
+                connection.execute(text("UPDATE item SET name = 'renamed' WHERE item_id = 1"))
+                connection.execute(text("DELETE FROM item WHERE item_id = 2"))
+                connection.execute(text("INSERT INTO item (name) VALUES ('late')"))
+                connection.execute(text("UPDATE item SET name = 'ahead' WHERE item_id = 20"))
+
+    ops = Operations(engine, batch_size=10, progress=write_during_copy)
+    ops.rebuild_table(Item, {"label": "upper(name)"})
+
+    with engine.connect() as connection:
+        rows = dict(connection.execute(text("SELECT item_id, label FROM item")).all())
+        objects = connection.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'item'")).scalars().all()
+
+    assert writes
+    assert len(rows) == 25
+    assert rows[1] == "RENAMED" and rows[20] == "AHEAD" and 2 not in rows
+    assert "LATE" in rows.values()
+    assert "ix_item_name" in objects
+    assert not [name for name in objects if "rebuild" in name]
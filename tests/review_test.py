@@ -1,13 +1,14 @@
 import pytest
 from unittest.mock import patch
 from review_service.review import app as flask_app
-from review_service.models import Review
+from review_service.models import Review, ProductRating
 from shared.db import db
-from shared.token import create_token
+from shared.identity import customer_cache
+from shared.token import create_token, ROLE_ADMIN
 
 # Mock valid customer and admin tokens
 VALID_CUSTOMER_TOKEN = create_token(1)  # Customer ID 1
-VALID_ADMIN_TOKEN = create_token(99)    # Admin ID 99
+VALID_ADMIN_TOKEN = create_token(99, role=ROLE_ADMIN, username="adminuser")    # Admin ID 99
 
 
 @pytest.fixture
@@ -21,6 +22,8 @@ def app():
         "SQLALCHEMY_TRACK_MODIFICATIONS": False,
     })
 
+    customer_cache.clear()
+
     with flask_app.app_context():
         db.create_all()
 
@@ -30,6 +33,10 @@ def app():
             Review(customer_id=1, inventory_id=2, rating=4, comment="Good quality."),
         ]
         db.session.bulk_save_objects(reviews)
+        db.session.add_all([
+            ProductRating(inventory_id=1, count=1, total=5, stars_5=1),
+            ProductRating(inventory_id=2, count=1, total=4, stars_4=1),
+        ])
         db.session.commit()
 
         yield flask_app
@@ -61,8 +68,8 @@ def admin_headers():
     return {"Authorization": f"Bearer {VALID_ADMIN_TOKEN}"}
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_submit_review(mock_post, mock_get, client, customer_headers):
     """
     Test submitting a new review.
@@ -87,8 +94,8 @@ def test_submit_review(mock_post, mock_get, client, customer_headers):
     assert data["comment"] == "Amazing product!"
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_update_review(mock_post, mock_get, client, customer_headers):
     """
     Test updating an existing review.
@@ -112,8 +119,8 @@ def test_update_review(mock_post, mock_get, client, customer_headers):
     assert data["comment"] == "Updated review: still great!"
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_delete_review_by_customer(mock_post, mock_get, client, customer_headers):
     """
     Test deleting a review by the customer.
@@ -132,8 +139,8 @@ def test_delete_review_by_customer(mock_post, mock_get, client, customer_headers
 
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_delete_review_by_admin(mock_post, mock_get, client, admin_headers):
     """
     Test deleting a review by the admin.
@@ -165,7 +172,7 @@ def test_get_product_reviews(client):
     assert data[0]["inventory_id"] == 1
 
 
-@patch("requests.get")
+@patch("shared.http_client.get")
 def test_get_customer_reviews(mock_get, client, admin_headers):
     """
     Test retrieving all reviews from a specific customer.
@@ -180,8 +187,8 @@ def test_get_customer_reviews(mock_get, client, admin_headers):
     assert len(data) == 2  # Customer 1 has two reviews
 
 
-@patch("requests.get")
-@patch("requests.post")
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
 def test_moderate_review_flagging(mock_post, mock_get, client, admin_headers):
     """
     Test flagging a review during moderation.
@@ -197,3 +204,162 @@ def test_moderate_review_flagging(mock_post, mock_get, client, admin_headers):
     assert response.status_code == 200
     data = response.get_json()
     assert data["flag"] is True
+
+
+@patch("shared.http_client.get")
+@patch("shared.http_client.post")
+def test_product_rating_follows_reviews(mock_post, mock_get, client, customer_headers, admin_headers):
+    """
+    Test that a product's rating is kept up to date by submits, updates, flags and deletes.
+    """
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"user_id": 1, "full_name": "John Doe"}
+    mock_post.return_value.status_code = 200
+
+    client.post("/review", json={"inventory_id": 1, "rating": 3, "comment": "Okay."}, headers=customer_headers)
+    data = client.get("/product-rating:1").get_json()
+    assert data["count"] == 2
+    assert data["average"] == 4.0
+    assert data["histogram"] == {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1}
+
+    client.put("/review", json={"review_id": 1, "rating": 1}, headers=customer_headers)
+    data = client.get("/product-rating:1").get_json()
+    assert data["average"] == 2.0
+    assert data["histogram"]["1"] == 1 and data["histogram"]["5"] == 0
+
+    client.post("/moderate-reviews", json={"review_id": 1, "flag": True}, headers=admin_headers)
+    data = client.get("/product-rating:1").get_json()
+    assert (data["count"], data["average"], data["flagged"]) == (1, 3.0, 1)
+
+    client.delete("/review", json={"review_id": 1}, headers=customer_headers)
+    data = client.get("/product-rating:1").get_json()
+    assert (data["count"], data["flagged"]) == (1, 0)
+
+
+@patch("shared.http_client.get")
+def test_submit_review_rejects_bad_rating(mock_get, client, customer_headers):
+    """
+    Test that ratings outside 1 to 5 and non-integer product IDs are rejected without touching any rating.
+    """
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"user_id": 1, "full_name": "John Doe"}
+
+    response = client.post("/review", json={"inventory_id": 1, "rating": 6, "comment": "Too good"}, headers=customer_headers)
+    assert response.status_code == 400
+    assert client.get("/product-rating:1").get_json()["count"] == 1
+
+    for inventory_id in ("1", 1.5, None, [1]):
+        response = client.post("/review", json={"inventory_id": inventory_id, "rating": 4, "comment": "Fine"}, headers=customer_headers)
+        assert response.status_code == 400
+    assert ProductRating.query.count() == 2
+
+
+def test_get_product_ratings(client):
+    """
+    Test retrieving the ratings of several products in one request.
+    """
+    response = client.get("/product-ratings?ids=2,7,1")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [rating["inventory_id"] for rating in data] == [2, 7, 1]
+    assert [rating["average"] for rating in data] == [4.0, None, 5.0]
+    assert data[1]["count"] == 0
+
+    assert client.get("/product-ratings").status_code == 400
+
+
+def test_get_product_reviews_paginated(app, client):
+    """
+    Test paging through a product's reviews by rating, including ties and flagged reviews.
+    """
+    reviews = [Review(customer_id=c, inventory_id=3, rating=r, comment="") for c, r in enumerate([4, 2, 4, 5, 4], start=2)]
+    reviews[1].flag = True
+    db.session.add_all(reviews)
+    db.session.commit()
+
+    seen = []
+    url = "/product-reviews:3?sort=rating&limit=2"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen += [(review["rating"], review["review_id"]) for review in response.get_json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        url = cursor and f"/product-reviews:3?sort=rating&limit=2&cursor={cursor}"
+
+    ids = [review.review_id for review in reviews]
+    assert seen == [(5, ids[3]), (4, ids[4]), (4, ids[2]), (4, ids[0]), (2, ids[1])]
+
+    data = client.get("/product-reviews:3?sort=rating&order=asc&exclude_flagged=true").get_json()
+    assert [review["rating"] for review in data] == [4, 4, 4, 5]
+
+    assert client.get("/product-reviews:3?sort=comment").status_code == 400
+    assert client.get("/product-reviews:3?cursor=garbage").status_code == 400
+
+
+def test_search_reviews(client):
+    """
+    Test prefix search over review comments, with the product and flagged filters.
+    """
+    db.session.add_all([
+        Review(customer_id=2, inventory_id=1, rating=1, comment="Quality dropped, not great"),
+        Review(customer_id=3, inventory_id=2, rating=2, comment="Poor quality stitching"),
+    ])
+    db.session.commit()
+    Review.query.filter_by(customer_id=3).first().flag = True
+    db.session.commit()
+
+    data = client.get("/search?q=qual").get_json()
+    assert {review["comment"] for review in data} == {"Good quality.", "Quality dropped, not great", "Poor quality stitching"}
+    assert {review["comment"] for review in client.get("/search?q=great").get_json()} == {"Great product!", "Quality dropped, not great"}
+    assert len(client.get("/search?q=qual&exclude_flagged=1").get_json()) == 2
+    assert len(client.get("/search?q=qual&inventory_id=2").get_json()) == 2
+    assert client.get("/search?q=\"*").status_code == 400
+
+
+def test_search_without_index_is_refused(client):
+    """
+    Test that a database lacking the full-text index answers 503 instead of scanning the table.
+    """
+    with patch("shared.search.SearchIndex.enabled", return_value=False):
+        response = client.get("/search?q=qual")
+    assert response.status_code == 503
+
+
+@patch("review_service.review.emit_log")
+def test_bulk_moderation(mock_emit_log, client, admin_headers):
+    """
+    Test flagging reviews by ID and deleting them by filter, each in one request with one log entry.
+    """
+    db.session.add_all([Review(customer_id=7, inventory_id=1, rating=1, comment="spam") for _ in range(3)])
+    # Count the spam in product 1's rating, as the submits would have.
+    rating = db.session.get(ProductRating, 1)
+    rating.count, rating.total, rating.stars_1 = 4, 8, 3
+    db.session.commit()
+
+    response = client.post("/moderate-reviews", json={"review_ids": [3, 4, 999, 3], "flag": True}, headers=admin_headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["flagged"] == 2
+    assert data["results"] == [
+        {"review_id": 3, "status": "flagged"},
+        {"review_id": 4, "status": "flagged"},
+        {"review_id": 999, "status": "not found"},
+    ]
+    rating = client.get("/product-rating:1").get_json()
+    assert (rating["count"], rating["flagged"], rating["histogram"]["1"]) == (2, 2, 1)
+
+    response = client.post("/moderate-reviews", json={"review_ids": [4], "flag": True}, headers=admin_headers)
+    assert response.get_json()["results"] == [{"review_id": 4, "status": "already flagged"}]
+
+    response = client.post("/moderate-reviews", json={"filter": {"customer_id": 7}, "flag": False}, headers=admin_headers)
+    data = response.get_json()
+    assert (data["deleted"], data["more"]) == (3, False)
+    assert Review.query.filter_by(customer_id=7).count() == 0
+    rating = client.get("/product-rating:1").get_json()
+    assert (rating["count"], rating["average"], rating["flagged"]) == (1, 5.0, 0)
+
+    assert mock_emit_log.call_count == 2
+    assert "flagged 2 reviews" in mock_emit_log.call_args_list[0].args[0]
+
+    assert client.post("/moderate-reviews", json={"filter": {"color": "red"}, "flag": True}, headers=admin_headers).status_code == 400
+    assert client.post("/moderate-reviews", json={"filter": {"since": "yesterday"}, "flag": True}, headers=admin_headers).status_code == 400